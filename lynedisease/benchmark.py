@@ -0,0 +1,396 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import lynedisease.rectangular_lattice as rl
+import lynedisease.solver as s
+from lynedisease.stats import SearchStats
+
+__author__ = 'ondra'
+
+LEVELS_PATH = os.path.join(os.path.dirname(__file__), "levels.txt")
+"""The bundled corpus of boards."""
+
+DEFAULT_THRESHOLD = 0.25
+"""How much slower (as a fraction) a level may get before it is flagged as a regression."""
+
+MIN_SECONDS = 0.01
+"""Time differences below this are noise and never flagged."""
+
+
+def read_levels(in_file):
+    """
+    Read width:height:spec lines, skipping empty lines and comments starting with #.
+
+    :type in_file: io.TextIOBase
+    :rtype: list[str]
+    """
+    levels = []
+    for line in in_file:
+        line = line.strip()
+        if len(line) == 0 or line.startswith("#"):
+            continue
+        levels.append(line)
+    return levels
+
+
+def walk_shape(rng, width, height, spec, visits, used_edges, shape, max_length):
+    """
+    Draw one shape as a random walk over the lattice: it starts on a free cell and steps to
+    neighboring cells that are not claimed by a shape node yet, without reusing or crossing an
+    edge. Returns whether the walk ended on a cell it could claim as the second terminator.
+
+    :type rng: random.Random
+    :type width: int
+    :type height: int
+    :type spec: list[str]
+    :type visits: dict[int, list[int]]
+    :type used_edges: set[(int, int)]
+    :type shape: int
+    :type max_length: int
+    :rtype: bool
+    """
+    free = [cell for cell in range(width * height) if spec[cell] == "_" and cell not in visits]
+    if len(free) == 0:
+        return False
+
+    terminator = chr(ord("A") + shape)
+    cell = rng.choice(free)
+    spec[cell] = terminator
+    for _ in range(rng.randint(1, max_length)):
+        (column, row) = (cell % width, cell // width)
+        steps = []
+        for (column_step, row_step) in (
+                (-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)
+        ):
+            (next_column, next_row) = (column + column_step, row + row_step)
+            if not (0 <= next_column < width and 0 <= next_row < height):
+                continue
+            next_cell = next_row * width + next_column
+            if spec[next_cell] != "_" or (min(cell, next_cell), max(cell, next_cell)) in used_edges:
+                continue
+            if column_step != 0 and row_step != 0:
+                # the other diagonal of the same square
+                (one, two) = (row * width + next_column, next_row * width + column)
+                if (min(one, two), max(one, two)) in used_edges:
+                    continue
+            steps.append(next_cell)
+
+        if len(steps) == 0:
+            break
+        next_cell = rng.choice(steps)
+        used_edges.add((min(cell, next_cell), max(cell, next_cell)))
+        visits.setdefault(next_cell, []).append(shape)
+        cell = next_cell
+
+    if spec[cell] != "_" or len(visits[cell]) != 1:
+        # the walk ended where it started or on a cell it passes through more than once
+        return False
+    del visits[cell]
+    spec[cell] = terminator
+    return True
+
+
+def generate_level(rng, width, height, shape_count, max_length=12, attempts=200):
+    """
+    Generate a solvable board by drawing the shapes as random walks and placing the nodes they
+    pass through: a node passed through once becomes a node of that shape (or, sometimes, a
+    multipass node for one pass), a node passed through several times a multipass node. Returns
+    a width:height:spec line, or None if no attempt worked out.
+
+    :type rng: random.Random
+    :type width: int
+    :type height: int
+    :type shape_count: int
+    :type max_length: int
+    :type attempts: int
+    :rtype: str|None
+    """
+    for _ in range(attempts):
+        spec = ["_" for _ in range(width * height)]
+        visits = {}
+        used_edges = set()
+        if not all(
+                walk_shape(rng, width, height, spec, visits, used_edges, shape, max_length)
+                for shape in range(shape_count)
+        ):
+            continue
+        if any(len(shapes) > 9 for shapes in visits.values()):
+            continue
+
+        for (cell, shapes) in visits.items():
+            if len(shapes) == 1 and rng.random() < 0.7:
+                spec[cell] = chr(ord("a") + shapes[0])
+            else:
+                spec[cell] = str(len(shapes))
+        return "{0}:{1}:{2}".format(width, height, "".join(spec))
+    return None
+
+
+def generate_levels(count, seed=0, min_size=6, max_size=7, max_shapes=4):
+    """
+    Generate count boards, the same ones for the same seed.
+
+    :type count: int
+    :type seed: int
+    :type min_size: int
+    :type max_size: int
+    :type max_shapes: int
+    :rtype: list[str]
+    """
+    rng = random.Random(seed)
+    levels = []
+    while len(levels) < count:
+        level = generate_level(
+            rng, rng.randint(min_size, max_size), rng.randint(min_size, max_size),
+            rng.randint(2, max_shapes), max_length=2 * max_size
+        )
+        if level is not None:
+            levels.append(level)
+    return levels
+
+
+def time_engine(line, engine):
+    """
+    Solve a board with the given engine, returning the time taken in seconds and whether a solution
+    was found.
+
+    :type line: str
+    :type engine: str
+    :rtype: (float, bool)
+    """
+    (puzzle, _) = rl.build_puzzle(*rl.parse_spec(line))
+    start = time.perf_counter()
+    solution = s.solve(puzzle, engine=engine)
+    return time.perf_counter() - start, solution is not None
+
+
+def measure_level(line, engine="search", memory=True):
+    """
+    Solve a board, returning a result record with the time taken, the nodes expanded by the search
+    and, if memory is set, the peak memory allocated while solving. Only the first run is timed;
+    the nodes are counted in a second run and the memory is measured in a third, since collecting
+    statistics and tracing allocations both slow the solver down.
+
+    :type line: str
+    :type engine: str
+    :type memory: bool
+    :rtype: dict
+    """
+    (puzzle, _) = rl.build_puzzle(*rl.parse_spec(line))
+    start = time.perf_counter()
+    solution = s.solve(puzzle, engine=engine)
+    seconds = time.perf_counter() - start
+
+    (puzzle, _) = rl.build_puzzle(*rl.parse_spec(line))
+    stats = SearchStats()
+    s.solve(puzzle, engine=engine, stats=stats)
+
+    result = {
+        "level": line,
+        "solved": solution is not None,
+        "seconds": seconds,
+        "nodes_expanded": stats.nodes_expanded,
+        "peak_memory": None,
+    }
+
+    if memory:
+        (puzzle, _) = rl.build_puzzle(*rl.parse_spec(line))
+        tracemalloc.start()
+        try:
+            s.solve(puzzle, engine=engine)
+            result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return result
+
+
+def run_benchmark(levels, engine="search", memory=True, progress=None):
+    """
+    Measure every board, returning the results in the format written by the command line.
+
+    :type levels: list[str]
+    :type engine: str
+    :type memory: bool
+    :type progress: ((dict) -> None)|None
+    :rtype: dict
+    """
+    results = []
+    for line in levels:
+        result = measure_level(line, engine, memory)
+        results.append(result)
+        if progress is not None:
+            progress(result)
+
+    return {
+        "engine": engine,
+        "python": sys.version.split()[0],
+        "total_seconds": sum(result["seconds"] for result in results),
+        "total_nodes_expanded": sum(result["nodes_expanded"] for result in results),
+        "results": results,
+    }
+
+
+def find_regressions(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare a report to a baseline report, returning a message for every level that got slower
+    by more than the threshold (and more than MIN_SECONDS), expands more nodes than it used to
+    by more than the threshold, or is no longer solved the same way, and for every level of the
+    baseline that is missing from the report (because the run dropped it or failed on it).
+
+    :type report: dict
+    :type baseline: dict
+    :type threshold: float
+    :rtype: list[str]
+    """
+    baseline_results = {result["level"]: result for result in baseline["results"]}
+    reported_levels = {result["level"] for result in report["results"]}
+    regressions = [
+        "{0}: missing from the report".format(level)
+        for level in baseline_results if level not in reported_levels
+    ]
+    for result in report["results"]:
+        before = baseline_results.get(result["level"])
+        if before is None:
+            continue
+        level = result["level"]
+
+        if result["solved"] != before["solved"]:
+            regressions.append("{0}: solved {1}, was {2}".format(
+                level, result["solved"], before["solved"]
+            ))
+
+        seconds = result["seconds"]
+        if seconds > before["seconds"] * (1 + threshold) and \
+                seconds - before["seconds"] > MIN_SECONDS:
+            regressions.append("{0}: {1:.4f}s, was {2:.4f}s".format(
+                level, seconds, before["seconds"]
+            ))
+
+        nodes = result["nodes_expanded"]
+        if nodes > before["nodes_expanded"] * (1 + threshold):
+            regressions.append("{0}: {1} nodes expanded, was {2}".format(
+                level, nodes, before["nodes_expanded"]
+            ))
+    return regressions
+
+
+def compare_engines(levels, engines, out_file):
+    """
+    Solve every board with every engine and write a table of the times taken, flagging boards on
+    which the engines disagree about solvability.
+
+    :type levels: list[str]
+    :type engines: list[str]
+    :type out_file: io.TextIOBase
+    """
+    totals = [0.0 for _ in engines]
+    out_file.write("{0:>5}  {1:<7}".format("level", "size"))
+    for engine in engines:
+        out_file.write("  {0:>10}".format(engine))
+    out_file.write("\n")
+
+    for (index, line) in enumerate(levels):
+        (width, height, _) = line.split(":")
+        out_file.write("{0:>5}  {1:<7}".format(index, width + "x" + height))
+        solved = set()
+        for (k, engine) in enumerate(engines):
+            (seconds, has_solution) = time_engine(line, engine)
+            totals[k] += seconds
+            solved.add(has_solution)
+            out_file.write("  {0:>10.4f}".format(seconds))
+        if len(solved) > 1:
+            out_file.write("  DISAGREE")
+        out_file.write("\n")
+        out_file.flush()
+
+    out_file.write("{0:>5}  {1:<7}".format("total", ""))
+    for total in totals:
+        out_file.write("  {0:>10.4f}".format(total))
+    out_file.write("\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the solver on a set of boards.")
+    parser.add_argument(
+        "levels", metavar="FILE", nargs="*",
+        help="files of width:height:spec lines to solve (- for stdin; default: the bundled corpus)"
+    )
+    parser.add_argument(
+        "--generate", metavar="N", type=int, default=8,
+        help="also solve N generated boards (default: 8)"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0,
+        help="seed for generating boards (default: 0)"
+    )
+    parser.add_argument(
+        "--engine", default="search",
+        help="engine to benchmark (default: search)"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true",
+        help="skip measuring the peak memory, which solves every board a second time"
+    )
+    parser.add_argument(
+        "--output", metavar="PATH",
+        help="write the results as JSON to PATH"
+    )
+    parser.add_argument(
+        "--baseline", metavar="PATH",
+        help="compare the results to those in PATH and exit with status 1 on regressions"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help="fraction by which a level may get slower before it is flagged (default: 0.25)"
+    )
+    parser.add_argument(
+        "--compare-engines", metavar="ENGINES",
+        help="instead, print a table of the times taken by each of the comma-separated ENGINES"
+    )
+    args = parser.parse_args()
+
+    levels = []
+    for path in (args.levels or [LEVELS_PATH]):
+        if path == "-":
+            levels.extend(read_levels(sys.stdin))
+        else:
+            with open(path, "r") as f:
+                levels.extend(read_levels(f))
+    levels.extend(generate_levels(args.generate, args.seed))
+
+    if args.compare_engines is not None:
+        compare_engines(levels, args.compare_engines.split(","), sys.stdout)
+        sys.exit(0)
+
+    def print_result(result):
+        memory = result["peak_memory"]
+        print("{0:>9.4f}s {1:>9} nodes {2:>9} {3}".format(
+            result["seconds"], result["nodes_expanded"],
+            "-" if memory is None else "{0}k".format(memory // 1024),
+            result["level"]
+        ))
+        sys.stdout.flush()
+
+    report = run_benchmark(levels, args.engine, not args.no_memory, progress=print_result)
+    print("{0:>9.4f}s {1:>9} nodes total".format(
+        report["total_seconds"], report["total_nodes_expanded"]
+    ))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if len(regressions) > 0:
+            sys.exit(1)
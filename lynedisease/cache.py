@@ -0,0 +1,192 @@
+from collections import OrderedDict
+import json
+import sqlite3
+
+from lynedisease.canonical import canonical_form, canonical_shape_labels
+from lynedisease.limits import GaveUp
+import lynedisease.solver as s
+
+__author__ = 'ondra'
+
+MISSING = object()
+"""Returned by SolutionCache.lookup() if nothing is stored for a fingerprint."""
+
+
+class SolutionCache:
+    """
+    Memoizes solve() by the canonical fingerprint of the puzzle, so that the same puzzle is only
+    solved once regardless of the order in which its nodes were added. Solutions are stored in
+    terms of canonical node numbers and translated to the node IDs of each puzzle on the way out.
+
+    If relabel_shapes is set, puzzles that only differ in the labels of their shapes share an
+    entry as well.
+
+    The most recently used entries are kept in memory; if a path is given, all entries are also
+    stored in an SQLite database there, which survives restarts.
+    """
+    def __init__(self, max_entries=1024, path=None, relabel_shapes=False):
+        """
+        :type max_entries: int
+        :type path: str|None
+        :type relabel_shapes: bool
+        """
+        self.max_entries = max_entries
+        """:type: int"""
+        self.relabel_shapes = relabel_shapes
+        """:type: bool"""
+        self.entries = OrderedDict()
+        """:type: OrderedDict[str, dict[int, list[int]]|None]"""
+        self.hits = 0
+        """:type: int"""
+        self.misses = 0
+        """:type: int"""
+
+        self.database = None
+        """:type: sqlite3.Connection|None"""
+        if path is not None:
+            self.database = sqlite3.connect(path)
+            self.database.execute(
+                "CREATE TABLE IF NOT EXISTS solutions ("
+                "fingerprint TEXT PRIMARY KEY, solution TEXT NOT NULL"
+                ")"
+            )
+            self.database.commit()
+
+    def close(self):
+        if self.database is not None:
+            self.database.close()
+            self.database = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def lookup(self, fingerprint):
+        """
+        Return the canonical solution stored for the fingerprint (None if the puzzle has no
+        solution), or MISSING if nothing is stored.
+
+        :type fingerprint: str
+        :rtype: dict[int, list[int]]|None|object
+        """
+        solution = self.entries.get(fingerprint, MISSING)
+        if solution is not MISSING:
+            self.entries.move_to_end(fingerprint)
+            return solution
+
+        if self.database is not None:
+            row = self.database.execute(
+                "SELECT solution FROM solutions WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+            if row is not None:
+                solution = json.loads(row[0])
+                if solution is not None:
+                    solution = {int(shape): path for (shape, path) in solution.items()}
+                self.remember(fingerprint, solution)
+                return solution
+
+        return MISSING
+
+    def remember(self, fingerprint, solution):
+        """
+        :type fingerprint: str
+        :type solution: dict[int, list[int]]|None
+        """
+        self.entries[fingerprint] = solution
+        self.entries.move_to_end(fingerprint)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def store(self, fingerprint, solution):
+        """
+        :type fingerprint: str
+        :type solution: dict[int, list[int]]|None
+        """
+        self.remember(fingerprint, solution)
+        if self.database is not None:
+            self.database.execute(
+                "INSERT OR REPLACE INTO solutions (fingerprint, solution) VALUES (?, ?)",
+                (fingerprint, json.dumps(solution))
+            )
+            self.database.commit()
+
+    def canonicalize(self, compiled):
+        """
+        Return the fingerprint under which the puzzle is cached, along with the canonical order of
+        its nodes and labels of its shapes needed to translate its solutions.
+
+        :type compiled: lynedisease.model.CompiledPuzzle
+        :rtype: (str, list[int], dict[int, int])
+        """
+        (fingerprint, order) = canonical_form(compiled, self.relabel_shapes)
+        if self.relabel_shapes:
+            shape_labels = canonical_shape_labels(compiled, order)
+        else:
+            shape_labels = {shape: shape for shape in compiled.shapes}
+        return fingerprint, order, shape_labels
+
+    @staticmethod
+    def to_canonical(solution, compiled, order, shape_labels):
+        """
+        Translate a solution of the puzzle into canonical node numbers and shape labels.
+
+        :type solution: dict[int, list[int]]
+        :type compiled: lynedisease.model.CompiledPuzzle
+        :type order: list[int]
+        :type shape_labels: dict[int, int]
+        :rtype: dict[int, list[int]]
+        """
+        ranks = {compiled.node_ids[node_index]: rank for (rank, node_index) in enumerate(order)}
+        return {
+            shape_labels[shape]: [ranks[node_id] for node_id in path]
+            for (shape, path) in solution.items()
+        }
+
+    @staticmethod
+    def from_canonical(canonical_solution, compiled, order, shape_labels):
+        """
+        Translate a canonical solution back into the node IDs and shapes of the puzzle.
+
+        :type canonical_solution: dict[int, list[int]]
+        :type compiled: lynedisease.model.CompiledPuzzle
+        :type order: list[int]
+        :type shape_labels: dict[int, int]
+        :rtype: dict[int, list[int]]
+        """
+        shapes = {label: shape for (shape, label) in shape_labels.items()}
+        return {
+            shapes[label]: [compiled.node_ids[order[rank]] for rank in path]
+            for (label, path) in canonical_solution.items()
+        }
+
+    def solve(self, puzzle, **kwargs):
+        """
+        Like solver.solve(), but answered from the cache if an equivalent puzzle has been solved
+        before. Keyword arguments are passed to solver.solve(). If the solver gives up, nothing
+        is remembered.
+
+        :type puzzle: lynedisease.model.Puzzle
+        :rtype: dict[int, list[int]]|lynedisease.limits.GaveUp|None
+        """
+        compiled = puzzle.compile()
+        (fingerprint, order, shape_labels) = self.canonicalize(compiled)
+
+        canonical_solution = self.lookup(fingerprint)
+        if canonical_solution is not MISSING:
+            self.hits += 1
+            if canonical_solution is None:
+                return None
+            return self.from_canonical(canonical_solution, compiled, order, shape_labels)
+
+        self.misses += 1
+        solution = s.solve(puzzle, **kwargs)
+        if isinstance(solution, GaveUp):
+            return solution
+        if solution is None:
+            self.store(fingerprint, None)
+            return None
+
+        self.store(fingerprint, self.to_canonical(solution, compiled, order, shape_labels))
+        return solution
@@ -0,0 +1,303 @@
+import hashlib
+
+__author__ = 'ondra'
+
+MAX_LEAVES = 1000
+"""How many leaves canonical_form() searches before it gives up on the canonical numbering."""
+
+
+def node_invariants(compiled, relabel_shapes=False):
+    """
+    The properties of each node that any renumbering has to preserve. If shapes may be relabeled,
+    the shape of a node is replaced by the number of nodes of that shape.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type relabel_shapes: bool
+    :rtype: list[(int, int, bool, int)]
+    """
+    invariants = []
+    for i in range(compiled.node_count):
+        shape = compiled.node_shapes[i]
+        if shape is None:
+            shape = -1
+        elif relabel_shapes:
+            shape = compiled.shape_node_counts[shape]
+        invariants.append((
+            compiled.node_kinds[i],
+            shape,
+            compiled.node_terminates[i],
+            compiled.node_multipass_counts[i],
+        ))
+    return invariants
+
+
+def canonical_shape_labels(compiled, order):
+    """
+    Relabel the shapes in the order in which they first appear in the given node order.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type order: list[int]
+    :rtype: dict[int, int]
+    """
+    labels = {}
+    for node_index in order:
+        shape = compiled.node_shapes[node_index]
+        if shape is not None and shape not in labels:
+            labels[shape] = len(labels)
+    return labels
+
+
+def rank_values(values):
+    """
+    Replace each value by its rank among the distinct values.
+
+    :type values: list
+    :rtype: list[int]
+    """
+    ranks = {value: rank for (rank, value) in enumerate(sorted(set(values)))}
+    return [ranks[value] for value in values]
+
+
+def refine_colors(compiled, colors, edge_conflict_counts, relabel_shapes=False):
+    """
+    Refine a node coloring until nodes of the same color cannot be told apart by the colors of
+    their neighbors (1-dimensional Weisfeiler-Lehman refinement). If shapes may be relabeled, the
+    colors of the other nodes of the same shape are taken into account as well.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type colors: list[int]
+    :type edge_conflict_counts: list[int]
+    :type relabel_shapes: bool
+    :rtype: list[int]
+    """
+    offsets = compiled.neighbor_offsets
+    color_count = len(set(colors))
+    while True:
+        shape_colors = {}
+        if relabel_shapes:
+            for (i, shape) in enumerate(compiled.node_shapes):
+                if shape is not None:
+                    shape_colors.setdefault(shape, []).append(colors[i])
+            shape_colors = {shape: tuple(sorted(cs)) for (shape, cs) in shape_colors.items()}
+
+        signatures = []
+        for i in range(compiled.node_count):
+            neighborhood = sorted(
+                (
+                    colors[compiled.neighbor_nodes[k]],
+                    edge_conflict_counts[compiled.neighbor_edges[k]],
+                )
+                for k in range(offsets[i], offsets[i + 1])
+            )
+            signatures.append((
+                colors[i], tuple(neighborhood), shape_colors.get(compiled.node_shapes[i], ())
+            ))
+
+        colors = rank_values(signatures)
+        new_color_count = len(set(colors))
+        if new_color_count == color_count:
+            return colors
+        color_count = new_color_count
+
+
+def encode(compiled, invariants, order, relabel_shapes=False):
+    """
+    Encode the puzzle with its nodes renumbered such that order[i] becomes node i (and, if shapes
+    may be relabeled, the shapes numbered in order of their first appearance).
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type invariants: list[(int, int, bool, int)]
+    :type order: list[int]
+    :type relabel_shapes: bool
+    :rtype: tuple
+    """
+    if relabel_shapes:
+        labels = canonical_shape_labels(compiled, order)
+        invariants = list(invariants)
+        for (i, shape) in enumerate(compiled.node_shapes):
+            if shape is not None:
+                (kind, _, terminates, count) = invariants[i]
+                invariants[i] = (kind, labels[shape], terminates, count)
+
+    ranks = [0 for _ in order]
+    for (rank, node_index) in enumerate(order):
+        ranks[node_index] = rank
+
+    edges = []
+    for (one, two) in zip(compiled.edge_ones, compiled.edge_twos):
+        (one, two) = (ranks[one], ranks[two])
+        edges.append((one, two) if one < two else (two, one))
+
+    conflicts = set()
+    offsets = compiled.conflict_offsets
+    for edge_index in range(compiled.edge_count):
+        for other_index in compiled.conflict_edges[offsets[edge_index]:offsets[edge_index + 1]]:
+            pair = (edges[edge_index], edges[other_index])
+            conflicts.add(pair if pair[0] < pair[1] else (pair[1], pair[0]))
+
+    return (
+        tuple(invariants[node_index] for node_index in order),
+        tuple(sorted(edges)),
+        tuple(sorted(conflicts)),
+    )
+
+
+def individualize(colors, cell_color, chosen):
+    """
+    Split the chosen node off its cell, giving it a color that comes before the rest of the cell.
+
+    :type colors: list[int]
+    :type cell_color: int
+    :type chosen: int
+    :rtype: list[int]
+    """
+    return [
+        2 * color + (1 if color == cell_color and node_index != chosen else 0)
+        for (node_index, color) in enumerate(colors)
+    ]
+
+
+def stabilizer_orbits(automorphisms, fixed, node_count):
+    """
+    The orbits of the nodes under the group generated by those of the automorphisms that fix all
+    of the given nodes, as a representative of the orbit of each node.
+
+    :type automorphisms: list[list[int]]
+    :type fixed: list[int]
+    :type node_count: int
+    :rtype: list[int]
+    """
+    parents = list(range(node_count))
+
+    def find(node_index):
+        while parents[node_index] != node_index:
+            parents[node_index] = parents[parents[node_index]]
+            node_index = parents[node_index]
+        return node_index
+
+    for automorphism in automorphisms:
+        if any(automorphism[node_index] != node_index for node_index in fixed):
+            continue
+        for (node_index, image) in enumerate(automorphism):
+            (one, two) = (find(node_index), find(image))
+            if one != two:
+                parents[max(one, two)] = min(one, two)
+    return [find(node_index) for node_index in range(node_count)]
+
+
+def fingerprint_of(encoding):
+    """
+    :type encoding: tuple
+    :rtype: str
+    """
+    return hashlib.sha256(repr(encoding).encode("utf-8")).hexdigest()
+
+
+def canonical_form(compiled, relabel_shapes=False, max_leaves=MAX_LEAVES):
+    """
+    Find a canonical numbering of the nodes of a puzzle, i.e. one that is the same for any two
+    puzzles that only differ in the order in which their nodes were added (and, if relabel_shapes
+    is set, in the labels of their shapes). Returns a fingerprint of the renumbered puzzle and the
+    canonical order, a list of node indexes of the compiled puzzle where the canonical node i is
+    order[i]; the canonical shape labels follow from canonical_shape_labels().
+
+    Since only the structure of the puzzle matters, rotated or mirrored versions of a lattice
+    puzzle are recognized as the same puzzle too.
+
+    Nodes that refinement cannot tell apart are individualized one by one, trying the candidates
+    in a search tree whose leaves are the possible orders. Two leaves that encode the same puzzle
+    reveal an automorphism, which is used to skip the candidates it maps onto ones already tried,
+    as in nauty: on the path to the first leaf, only one candidate of every orbit is tried, and
+    the search returns to that path as soon as a leaf turns out to be equivalent to the first.
+    If the search needs more than max_leaves leaves, it gives up on recognizing the puzzle by its
+    structure and returns a fingerprint of the puzzle as numbered, which is only shared by
+    puzzles with the same nodes added in the same order.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type relabel_shapes: bool
+    :type max_leaves: int
+    :rtype: (str, list[int])
+    """
+    invariants = node_invariants(compiled, relabel_shapes)
+    offsets = compiled.conflict_offsets
+    edge_conflict_counts = [offsets[i + 1] - offsets[i] for i in range(compiled.edge_count)]
+
+    def target_cell(colors):
+        # the nodes of the first color shared by several nodes, or None if there is none
+        cells = {}
+        for (node_index, color) in enumerate(colors):
+            cells.setdefault(color, []).append(node_index)
+        ambiguous = [color for (color, cell) in cells.items() if len(cell) > 1]
+        if len(ambiguous) == 0:
+            return None
+        cell_color = min(ambiguous)
+        return cell_color, cells[cell_color]
+
+    first = None
+    best = None
+    # the node individualized on each level of the path to the first leaf
+    first_path = []
+    automorphisms = []
+    leaf_count = 0
+
+    # frames of (colors, cell color, cell, candidates tried, whether on the path to the first leaf)
+    root = refine_colors(compiled, rank_values(invariants), edge_conflict_counts, relabel_shapes)
+    frames = []
+    pending = root
+    on_first_path = True
+    while True:
+        if pending is not None:
+            target = target_cell(pending)
+            if target is not None:
+                frames.append((pending, target[0], target[1], [], on_first_path))
+            elif leaf_count == max_leaves:
+                order = list(range(compiled.node_count))
+                encoding = ("as numbered", encode(compiled, invariants, order, relabel_shapes))
+                return fingerprint_of(encoding), order
+            else:
+                leaf_count += 1
+                order = sorted(range(len(pending)), key=lambda node_index: pending[node_index])
+                encoding = encode(compiled, invariants, order, relabel_shapes)
+                if first is None:
+                    first = best = (encoding, order)
+                elif encoding == first[0] or encoding == best[0]:
+                    # the same puzzle: mapping one order onto the other is an automorphism
+                    other_order = first[1] if encoding == first[0] else best[1]
+                    automorphism = list(range(len(order)))
+                    for (other_index, node_index) in zip(other_order, order):
+                        automorphism[other_index] = node_index
+                    automorphisms.append(automorphism)
+                    if encoding == first[0]:
+                        # everything below the path to the first leaf has been mirrored already
+                        while not frames[-1][4]:
+                            frames.pop()
+                elif encoding < best[0]:
+                    best = (encoding, order)
+            pending = None
+
+        if len(frames) == 0:
+            break
+        (colors, cell_color, cell, tried, on_path) = frames[-1]
+        level = len(frames) - 1
+        if len(tried) == len(cell):
+            frames.pop()
+            continue
+
+        chosen = cell[len(tried)]
+        if on_path and len(tried) > 0:
+            orbits = stabilizer_orbits(automorphisms, first_path[:level], len(colors))
+            if any(orbits[chosen] == orbits[node_index] for node_index in tried):
+                tried.append(chosen)
+                continue
+        tried.append(chosen)
+
+        if first is None:
+            first_path.append(chosen)
+        on_first_path = on_path and chosen == first_path[level]
+        pending = refine_colors(
+            compiled, individualize(colors, cell_color, chosen), edge_conflict_counts,
+            relabel_shapes
+        )
+
+    (encoding, order) = best
+    return fingerprint_of(encoding), order
@@ -0,0 +1,425 @@
+import argparse
+import json
+import mmap
+import struct
+import sys
+
+import lynedisease.model as m
+import lynedisease.rectangular_lattice as rl
+import lynedisease.solver as s
+
+__author__ = 'ondra'
+
+# A level pack is a little-endian file of:
+# * the header: magic, version, reserved (zero), level count
+# * the index: for each level, the offset of its level record and of its solution record
+#   (NOT_STORED if no solution was stored, NO_SOLUTION if the level is known to be unsolvable)
+# * the level records: width, height, bits per cell (4 or 8), then the cell codes packed row by
+#   row, low nibble first
+# * the solution records: shape count, then for each shape its label and path length, then the
+#   paths as lattice positions (one byte each if the lattice has at most 256 cells, two if it has
+#   at most 65536 and four if it has more)
+
+MAGIC = b"LYNP"
+"""The first bytes of every level pack."""
+
+VERSION = 1
+"""The version of the format written by write_level_pack()."""
+
+HEADER = struct.Struct("<4sHHI")
+INDEX_ENTRY = struct.Struct("<II")
+LEVEL_HEADER = struct.Struct("<HHB")
+SOLUTION_HEADER = struct.Struct("<B")
+SHAPE_HEADER = struct.Struct("<BH")
+
+UNSTORED = object()
+"""Stands for a solution that is not stored in a pack, unlike None for a level without one."""
+
+NOT_STORED = 0
+"""Solution offset of a level whose solution is not in the pack."""
+
+NO_SOLUTION = 0xFFFFFFFF
+"""Solution offset of a level that has no solution."""
+
+CELL_HOLE = 0
+"""Cell code of a hole; codes 1 to 9 are multipass nodes with that count."""
+
+CELL_SHAPE = 10
+"""Cell code of the first shape node; shape k is 10 + 2*k, or 11 + 2*k if it terminates."""
+
+
+def cell_code(node):
+    """
+    :type node: lynedisease.model.Node|None
+    :rtype: int
+    """
+    if node is None:
+        return CELL_HOLE
+    elif isinstance(node, m.ShapeNode):
+        code = CELL_SHAPE + 2 * node.shape + (1 if node.terminates else 0)
+    elif isinstance(node, m.MultipassNode):
+        code = node.count
+        if not 1 <= code < CELL_SHAPE:
+            raise ValueError("cannot pack a multipass node with count {0}".format(code))
+    else:
+        raise ValueError("unknown node {0!r}".format(node))
+    if code > 0xFF:
+        raise ValueError("cannot pack {0!r}".format(node))
+    return code
+
+
+def cell_node(code):
+    """
+    :type code: int
+    :rtype: lynedisease.model.Node|None
+    """
+    if code == CELL_HOLE:
+        return None
+    elif code < CELL_SHAPE:
+        return m.MultipassNode(code)
+    shape = (code - CELL_SHAPE) // 2
+    return m.ShapeNode(shape, terminates=((code - CELL_SHAPE) % 2 == 1))
+
+
+def pack_level(width, height, nodes):
+    """
+    :type width: int
+    :type height: int
+    :type nodes: list[lynedisease.model.Node|None]
+    :rtype: bytes
+    """
+    if not (0 <= width <= 0xFFFF and 0 <= height <= 0xFFFF):
+        raise ValueError("cannot pack a {0}x{1} level".format(width, height))
+    codes = [cell_code(node) for node in nodes]
+    if max(codes, default=0) < 0x10:
+        if len(codes) % 2 == 1:
+            codes.append(CELL_HOLE)
+        cells = bytes(low | (high << 4) for (low, high) in zip(codes[0::2], codes[1::2]))
+        return LEVEL_HEADER.pack(width, height, 4) + cells
+    return LEVEL_HEADER.pack(width, height, 8) + bytes(codes)
+
+
+def unpack_level(buffer, offset):
+    """
+    :type buffer: bytes|mmap.mmap
+    :type offset: int
+    :rtype: (int, int, list[lynedisease.model.Node|None])
+    """
+    (width, height, bits) = LEVEL_HEADER.unpack_from(buffer, offset)
+    offset += LEVEL_HEADER.size
+    cell_count = width * height
+    if bits == 4:
+        codes = []
+        for byte in buffer[offset:offset + (cell_count + 1) // 2]:
+            codes.append(byte & 0x0F)
+            codes.append(byte >> 4)
+        del codes[cell_count:]
+    elif bits == 8:
+        codes = buffer[offset:offset + cell_count]
+    else:
+        raise ValueError("unknown cell size {0}".format(bits))
+    return width, height, [cell_node(code) for code in codes]
+
+
+def position_format(width, height):
+    """
+    :type width: int
+    :type height: int
+    :rtype: str
+    """
+    cell_count = width * height
+    if cell_count <= 0x100:
+        return "B"
+    elif cell_count <= 0x10000:
+        return "H"
+    return "I"
+
+
+def pack_solution(width, height, solution):
+    """
+    :type width: int
+    :type height: int
+    :type solution: dict[int, list[int]]
+    :rtype: bytes
+    """
+    position = position_format(width, height)
+    parts = [SOLUTION_HEADER.pack(len(solution))]
+    for (shape, path) in solution.items():
+        if not 0 <= shape <= 0xFF:
+            raise ValueError("cannot pack the path of shape {0}".format(shape))
+        if len(path) > 0xFFFF:
+            raise ValueError("cannot pack a path through {0} nodes".format(len(path)))
+        parts.append(SHAPE_HEADER.pack(shape, len(path)))
+    for path in solution.values():
+        parts.append(struct.pack("<{0}{1}".format(len(path), position), *path))
+    return b"".join(parts)
+
+
+def unpack_solution(buffer, offset, width, height):
+    """
+    :type buffer: bytes|mmap.mmap
+    :type offset: int
+    :type width: int
+    :type height: int
+    :rtype: dict[int, list[int]]
+    """
+    (shape_count,) = SOLUTION_HEADER.unpack_from(buffer, offset)
+    offset += SOLUTION_HEADER.size
+    shapes = []
+    for _ in range(shape_count):
+        shapes.append(SHAPE_HEADER.unpack_from(buffer, offset))
+        offset += SHAPE_HEADER.size
+
+    solution = {}
+    position = position_format(width, height)
+    for (shape, length) in shapes:
+        path_format = struct.Struct("<{0}{1}".format(length, position))
+        solution[shape] = list(path_format.unpack_from(buffer, offset))
+        offset += path_format.size
+    return solution
+
+
+def write_level_pack(out_file, levels):
+    """
+    Write a level pack to a binary file. Each level is given as (width, height, nodes, solution),
+    where the solution maps shapes to paths of lattice positions, is None if the level has no
+    solution or UNSTORED if it is not to be stored.
+
+    :type out_file: io.BufferedIOBase
+    :type levels: collections.Iterable[(int, int, list[lynedisease.model.Node|None], object)]
+    """
+    records = []
+    for (width, height, nodes, solution) in levels:
+        if len(nodes) != width * height:
+            raise ValueError("need {0} nodes".format(width * height))
+        if solution is not UNSTORED and solution is not None:
+            solution = pack_solution(width, height, solution)
+        records.append((pack_level(width, height, nodes), solution))
+
+    offset = HEADER.size + len(records) * INDEX_ENTRY.size
+    index = []
+    for (level, solution) in records:
+        level_offset = offset
+        offset += len(level)
+        if solution is UNSTORED:
+            solution_offset = NOT_STORED
+        elif solution is None:
+            solution_offset = NO_SOLUTION
+        else:
+            solution_offset = offset
+            offset += len(solution)
+        index.append(INDEX_ENTRY.pack(level_offset, solution_offset))
+    if offset >= NO_SOLUTION:
+        raise ValueError("level pack too large")
+
+    out_file.write(HEADER.pack(MAGIC, VERSION, 0, len(records)))
+    out_file.write(b"".join(index))
+    for (level, solution) in records:
+        out_file.write(level)
+        if isinstance(solution, bytes):
+            out_file.write(solution)
+
+
+def puzzle_level(puzzle, node_ids_to_nodes, width, height, solution=UNSTORED):
+    """
+    Turn a puzzle built by rectangular_lattice.build_puzzle() and its solution (in terms of its
+    node IDs) into a level for write_level_pack().
+
+    :type puzzle: lynedisease.model.Puzzle
+    :type node_ids_to_nodes: dict[int, int]
+    :type width: int
+    :type height: int
+    :type solution: dict[int, list[int]]|None|object
+    :rtype: (int, int, list[lynedisease.model.Node|None], object)
+    """
+    if solution is not UNSTORED and solution is not None:
+        solution = {
+            shape: [node_ids_to_nodes[p] for p in path]
+            for (shape, path) in solution.items()
+        }
+    return width, height, rl.lattice_nodes(puzzle, node_ids_to_nodes, width, height), solution
+
+
+class LevelPack:
+    """
+    A level pack opened for reading. The file is memory-mapped and only the records of the levels
+    that are asked for are decoded, so opening even a large pack is cheap.
+    """
+    def __init__(self, path):
+        """
+        :type path: str
+        """
+        self.file = open(path, "rb")
+        """:type: io.BufferedReader|None"""
+        self.buffer = None
+        """:type: mmap.mmap|None"""
+        self.count = 0
+        """:type: int"""
+        try:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self.buffer) < HEADER.size:
+                raise ValueError("not a level pack")
+            (magic, version, _, self.count) = HEADER.unpack_from(self.buffer, 0)
+            if magic != MAGIC:
+                raise ValueError("not a level pack")
+            if version != VERSION:
+                raise ValueError("unknown level pack version {0}".format(version))
+            if len(self.buffer) < HEADER.size + self.count * INDEX_ENTRY.size:
+                raise ValueError("truncated level pack")
+        except (ValueError, OSError):
+            self.close()
+            raise
+
+    def close(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def index_entry(self, index):
+        """
+        :type index: int
+        :rtype: (int, int)
+        """
+        if not 0 <= index < self.count:
+            raise IndexError("no level {0} in the pack".format(index))
+        return INDEX_ENTRY.unpack_from(self.buffer, HEADER.size + index * INDEX_ENTRY.size)
+
+    def nodes(self, index):
+        """
+        :type index: int
+        :rtype: (int, int, list[lynedisease.model.Node|None])
+        """
+        (level_offset, _) = self.index_entry(index)
+        return unpack_level(self.buffer, level_offset)
+
+    def spec(self, index):
+        """
+        :type index: int
+        :rtype: str
+        """
+        return rl.format_spec(*self.nodes(index))
+
+    def solution(self, index):
+        """
+        Return the solution of the level as paths of lattice positions (None if it has no
+        solution), or UNSTORED if none is stored.
+
+        :type index: int
+        :rtype: dict[int, list[int]]|None|object
+        """
+        (level_offset, solution_offset) = self.index_entry(index)
+        if solution_offset == NOT_STORED:
+            return UNSTORED
+        elif solution_offset == NO_SOLUTION:
+            return None
+        (width, height, _) = LEVEL_HEADER.unpack_from(self.buffer, level_offset)
+        return unpack_solution(self.buffer, solution_offset, width, height)
+
+    def puzzle(self, index, topologies=None):
+        """
+        Build the puzzle of the level, returning it along with a mapping from its node IDs to
+        their positions in the lattice.
+
+        :type index: int
+        :type topologies: lynedisease.rectangular_lattice.TopologyCache|None
+        :rtype: (lynedisease.model.Puzzle, dict[int, int])
+        """
+        return rl.build_puzzle(*self.nodes(index), topologies=topologies)
+
+    def puzzle_solution(self, index, node_ids_to_nodes):
+        """
+        Return the solution of the level in terms of the node IDs of its puzzle, as built by
+        puzzle(); None and UNSTORED are passed through.
+
+        :type index: int
+        :type node_ids_to_nodes: dict[int, int]
+        :rtype: dict[int, list[int]]|None|object
+        """
+        solution = self.solution(index)
+        if solution is UNSTORED or solution is None:
+            return solution
+        positions_to_node_ids = {v: k for (k, v) in node_ids_to_nodes.items()}
+        return {
+            shape: [positions_to_node_ids[p] for p in path]
+            for (shape, path) in solution.items()
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create and read binary Lyne level packs.")
+    parser.add_argument("pack", metavar="PACK", help="path of the level pack")
+    parser.add_argument(
+        "--create", metavar="FILE",
+        help="create PACK from the width:height:spec lines of FILE (- for stdin)"
+    )
+    parser.add_argument(
+        "--solve", action="store_true",
+        help="with --create, solve the levels and store their solutions in PACK"
+    )
+    parser.add_argument(
+        "--level", type=int, default=None,
+        help="print only this level and its solution instead of every line of PACK"
+    )
+    args = parser.parse_args()
+
+    if args.create is not None:
+        # lines that cannot be parsed are left out; levels that cannot be solved are packed
+        # without a solution
+        in_file = sys.stdin if args.create == "-" else open(args.create, "r")
+        specs = []
+        line_indexes = []
+        with in_file:
+            for (line_index, line) in enumerate(in_file):
+                line = line.strip()
+                if len(line) == 0 or line.startswith("#"):
+                    continue
+                try:
+                    specs.append(rl.parse_spec(line))
+                except ValueError as exc:
+                    sys.stderr.write("line {0}: {1}\n".format(line_index + 1, exc))
+                    continue
+                line_indexes.append(line_index)
+
+        solutions = [UNSTORED for _ in specs]
+        if args.solve:
+            built = [rl.build_puzzle(*spec) for spec in specs]
+            for (i, solution) in s.solve_many(
+                    (puzzle for (puzzle, _) in built), return_exceptions=True
+            ):
+                if isinstance(solution, Exception):
+                    sys.stderr.write("line {0}: {1}\n".format(line_indexes[i] + 1, solution))
+                    continue
+                solutions[i] = solution
+
+        with open(args.pack, "wb") as f:
+            levels = []
+            for (i, (width, height, nodes)) in enumerate(specs):
+                if solutions[i] is UNSTORED or solutions[i] is None:
+                    levels.append((width, height, nodes, solutions[i]))
+                else:
+                    levels.append(puzzle_level(*built[i], width, height, solution=solutions[i]))
+            write_level_pack(f, levels)
+        sys.exit(0)
+
+    with LevelPack(args.pack) as pack:
+        if args.level is not None:
+            if not 0 <= args.level < len(pack):
+                parser.error("no level {0} in a pack of {1} levels".format(args.level, len(pack)))
+            solution = pack.solution(args.level)
+            print(pack.spec(args.level))
+            print("not stored" if solution is UNSTORED else json.dumps(solution))
+        else:
+            for index in range(len(pack)):
+                print(pack.spec(index))
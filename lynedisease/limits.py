@@ -0,0 +1,108 @@
+import threading
+import time
+
+__author__ = 'ondra'
+
+GAVE_UP_TIMEOUT = "timeout"
+"""The time limit ran out."""
+GAVE_UP_MAX_NODES = "max_nodes"
+"""The budget of expanded search nodes ran out."""
+GAVE_UP_CANCELLED = "cancelled"
+"""The cancellation token was cancelled."""
+
+
+class CancellationToken:
+    """
+    Lets another thread ask a running solve() to give up. The solver checks it before starting and
+    then every so often (see solver.STOP_CHECK_INTERVAL), so cancelling a running solve takes
+    effect shortly after, not immediately.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        """:type: threading.Event"""
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        """
+        :rtype: bool
+        """
+        return self.event.is_set()
+
+
+class GaveUp:
+    """
+    Returned by solve() instead of a solution (or None for "no solution") if it hit one of its
+    limits before finishing. partial holds the longest paths the search had drawn, in the same
+    format as a solution. GaveUp is false in a boolean context.
+    """
+    def __init__(self, reason, partial=None, nodes_expanded=0, elapsed=0.0):
+        """
+        :param reason: GAVE_UP_TIMEOUT, GAVE_UP_MAX_NODES or GAVE_UP_CANCELLED
+        :type reason: str
+        :type partial: dict[int, list[int]]|None
+        :type nodes_expanded: int
+        :type elapsed: float
+        """
+        self.reason = reason
+        """:type: str"""
+        self.partial = partial if partial is not None else {}
+        """:type: dict[int, list[int]]"""
+        self.nodes_expanded = nodes_expanded
+        """:type: int"""
+        self.elapsed = elapsed
+        """:type: float"""
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "GaveUp({0!r}, nodes_expanded={1}, elapsed={2:.3f})".format(
+            self.reason, self.nodes_expanded, self.elapsed
+        )
+
+
+class Limits:
+    """
+    The limits of a single solve: a time limit in seconds, a budget of expanded search nodes and a
+    cancellation token, each optional.
+    """
+    def __init__(self, timeout=None, max_nodes=None, token=None):
+        """
+        :type timeout: float|None
+        :type max_nodes: int|None
+        :type token: CancellationToken|None
+        """
+        self.start_time = time.monotonic()
+        """:type: float"""
+        self.deadline = self.start_time + timeout if timeout is not None else None
+        """:type: float|None"""
+        self.max_nodes = max_nodes
+        """:type: int|None"""
+        self.token = token
+        """:type: CancellationToken|None"""
+        self.reason = None
+        """:type: str|None"""
+
+    def exceeded(self, nodes_expanded):
+        """
+        Check the limits, remembering the reason if one of them has been hit.
+
+        :type nodes_expanded: int
+        :rtype: bool
+        """
+        if self.token is not None and self.token.cancelled:
+            self.reason = GAVE_UP_CANCELLED
+        elif self.max_nodes is not None and nodes_expanded >= self.max_nodes:
+            self.reason = GAVE_UP_MAX_NODES
+        elif self.deadline is not None and time.monotonic() >= self.deadline:
+            self.reason = GAVE_UP_TIMEOUT
+        return self.reason is not None
+
+    def elapsed(self):
+        """
+        :rtype: float
+        """
+        return time.monotonic() - self.start_time
@@ -1,5 +1,10 @@
 import lynedisease.model as m
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 __author__ = 'ondra'
 
 
@@ -33,12 +38,100 @@ def square_link(puzzle, one, two, three, four):
         puzzle.add_edge_conflict(m.Edge(one, four), m.Edge(two, three))
 
 
+def square_lattice_tables_python(node_ids, columns, rows):
+    """
+    Compute everything square_link() adds for every square of a lattice at once: the packed edges
+    (see model.pack_edge()) between neighboring nodes and the packed pairs of crossing diagonals
+    (see model.pack_edge_pair()). node_ids holds the ID of the node at each position, row by row,
+    or None for a hole.
+
+    :type node_ids: list[int|None]
+    :type columns: int
+    :type rows: int
+    :rtype: (list[int], list[int])
+    """
+    if columns < 2 or rows < 2:
+        # no squares, so nothing is linked
+        return [], []
+
+    def pack_edges(ones, twos):
+        return [
+            m.pack_edge(one, two) for (one, two) in zip(ones, twos)
+            if one is not None and two is not None
+        ]
+
+    edge_keys = []
+    conflict_keys = []
+    for row in range(rows):
+        top = node_ids[row * columns:(row + 1) * columns]
+        edge_keys.extend(pack_edges(top, top[1:]))
+        if row == rows - 1:
+            break
+
+        bottom = node_ids[(row + 1) * columns:(row + 2) * columns]
+        edge_keys.extend(pack_edges(top, bottom))
+        edge_keys.extend(pack_edges(top, bottom[1:]))
+        edge_keys.extend(pack_edges(top[1:], bottom))
+        for (top_left, top_right, bottom_left, bottom_right) in zip(
+                top, top[1:], bottom, bottom[1:]
+        ):
+            if top_left is not None and top_right is not None and bottom_left is not None and \
+                    bottom_right is not None:
+                conflict_keys.append(m.pack_edge_pair(
+                    m.pack_edge(top_left, bottom_right), m.pack_edge(top_right, bottom_left)
+                ))
+
+    return edge_keys, conflict_keys
+
+
+def square_lattice_tables_numpy(node_ids, columns, rows):
+    """
+    Like square_lattice_tables_python(), but working on whole rows and columns of the lattice at
+    once with NumPy.
+
+    :type node_ids: list[int|None]
+    :type columns: int
+    :type rows: int
+    :rtype: (list[int], list[int])
+    """
+    if columns < 2 or rows < 2:
+        return [], []
+
+    ids = numpy.array(
+        [-1 if node_id is None else node_id for node_id in node_ids], dtype=numpy.int64
+    ).reshape(rows, columns)
+
+    def pack_edges(ones, twos):
+        return numpy.minimum(ones, twos) << m.EDGE_NODE_BITS | numpy.maximum(ones, twos)
+
+    (top_left, top_right) = (ids[:-1, :-1], ids[:-1, 1:])
+    (bottom_left, bottom_right) = (ids[1:, :-1], ids[1:, 1:])
+    edge_key_arrays = []
+    for (ones, twos) in (
+            (ids[:, :-1], ids[:, 1:]), (ids[:-1, :], ids[1:, :]), (top_left, bottom_right),
+            (top_right, bottom_left)
+    ):
+        present = (ones >= 0) & (twos >= 0)
+        edge_key_arrays.append(pack_edges(ones[present], twos[present]))
+    edge_keys = numpy.concatenate(edge_key_arrays).tolist()
+
+    # packed edge pairs have more bits than NumPy's integers, so they are put together in Python
+    complete = (top_left >= 0) & (top_right >= 0) & (bottom_left >= 0) & (bottom_right >= 0)
+    falling = pack_edges(top_left[complete], bottom_right[complete])
+    rising = pack_edges(top_right[complete], bottom_left[complete])
+    conflict_keys = [
+        m.pack_edge_pair(first, second)
+        for (first, second) in zip(falling.tolist(), rising.tolist())
+    ]
+
+    return edge_keys, conflict_keys
+
+
+square_lattice_tables = \
+    square_lattice_tables_numpy if numpy is not None else square_lattice_tables_python
+
+
 def square_lattice(puzzle, node_ids, columns, rows):
-    for row in range(rows-1):
-        for column in range(columns-1):
-            top_left = node_ids[(row + 0) * columns + (column + 0)]
-            top_right = node_ids[(row + 0) * columns + (column + 1)]
-            bottom_left = node_ids[(row + 1) * columns + (column + 0)]
-            bottom_right = node_ids[(row + 1) * columns + (column + 1)]
-
-            square_link(puzzle, top_left, top_right, bottom_left, bottom_right)
+    (edge_keys, conflict_keys) = square_lattice_tables(node_ids, columns, rows)
+    puzzle.link_edge_keys(edge_keys)
+    puzzle.add_edge_conflict_keys(conflict_keys)
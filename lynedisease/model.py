@@ -1,9 +1,69 @@
+from bisect import bisect_left
+from collections.abc import MutableSet
 from functools import total_ordering
+from itertools import accumulate
+import random
 
 __author__ = 'ondra'
 
+NODE_KIND_BLOCKED = 0
+NODE_KIND_SHAPE = 1
+NODE_KIND_MULTIPASS = 2
+
+ZOBRIST_SEED = 0x4c796e65
+
+EDGE_NODE_BITS = 32
+"""How many bits each node ID takes up in a packed edge."""
+EDGE_NODE_MASK = (1 << EDGE_NODE_BITS) - 1
+EDGE_PAIR_MASK = (1 << 2 * EDGE_NODE_BITS) - 1
+
+
+def pack_edge(one, two):
+    """
+    Encode the edge between two nodes as a single integer, the same one in either direction.
+    Packed edges sort like the (lower, higher) node ID pairs they stand for.
+
+    :type one: int
+    :type two: int
+    :rtype: int
+    """
+    if one > two:
+        return two << EDGE_NODE_BITS | one
+    return one << EDGE_NODE_BITS | two
+
+
+def unpack_edge(key):
+    """
+    :type key: int
+    :rtype: (int, int)
+    """
+    return key >> EDGE_NODE_BITS, key & EDGE_NODE_MASK
+
+
+def pack_edge_pair(first, second):
+    """
+    Encode a pair of packed edges as a single integer, the same one in either order.
+
+    :type first: int
+    :type second: int
+    :rtype: int
+    """
+    if first > second:
+        return second << 2 * EDGE_NODE_BITS | first
+    return first << 2 * EDGE_NODE_BITS | second
+
+
+def unpack_edge_pair(pair_key):
+    """
+    :type pair_key: int
+    :rtype: (int, int)
+    """
+    return pair_key >> 2 * EDGE_NODE_BITS, pair_key & EDGE_PAIR_MASK
+
 
 class Node:
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -13,6 +73,8 @@ class Node:
 
 
 class ShapeNode(Node):
+    __slots__ = ("shape", "_terminates")
+
     def __init__(self, shape, terminates=False):
         Node.__init__(self)
 
@@ -29,6 +91,8 @@ class ShapeNode(Node):
 
 
 class MultipassNode(Node):
+    __slots__ = ("count",)
+
     def __init__(self, count):
         Node.__init__(self)
 
@@ -37,29 +101,48 @@ class MultipassNode(Node):
 
 @total_ordering
 class Edge:
+    """
+    An edge between two nodes, stored as its packed integer (see pack_edge()).
+    """
+    __slots__ = ("key",)
+
     def __init__(self, one, two):
         """
         :type one: int
         :type two: int
         """
-        if one > two:
-            self.one = two
-            self.two = one
-        else:
-            self.one = one
-            self.two = two
+        self.key = pack_edge(one, two)
+        """:type: int"""
+
+    @classmethod
+    def from_key(cls, key):
+        """
+        :type key: int
+        :rtype: Edge
+        """
+        edge = cls.__new__(cls)
+        edge.key = key
+        return edge
+
+    @property
+    def one(self):
+        return self.key >> EDGE_NODE_BITS
+
+    @property
+    def two(self):
+        return self.key & EDGE_NODE_MASK
 
     def __eq__(self, you):
-        return (self.one, self.two) == (you.one, you.two)
+        return self.key == you.key
 
     def __lt__(self, you):
-        return (self.one, self.two) < (you.one, you.two)
+        return self.key < you.key
 
     def __repr__(self):
         return "Edge({0}, {1})".format(self.one, self.two)
 
     def __hash__(self):
-        return 3 * (self.one, self.two).__hash__()
+        return hash(self.key)
 
     def __contains__(self, what):
         return what in (self.one, self.two)
@@ -72,23 +155,123 @@ class Edge:
         return None
 
 
+class ConflictEdgePairs(MutableSet):
+    """
+    A live set-like view of the conflicts of a puzzle as normalized (Edge, Edge) pairs, backed by
+    its packed conflict_edge_keys: membership tests take constant time, and changes go to the
+    puzzle (see Puzzle.conflict_edge_pairs).
+    """
+    __slots__ = ("puzzle",)
+
+    def __init__(self, puzzle):
+        """
+        :type puzzle: Puzzle
+        """
+        self.puzzle = puzzle
+        """:type: Puzzle"""
+
+    def __contains__(self, pair):
+        (first, second) = pair
+        return pack_edge_pair(first.key, second.key) in self.puzzle.conflict_edge_keys
+
+    def __iter__(self):
+        for pair_key in self.puzzle.conflict_edge_keys:
+            (first, second) = unpack_edge_pair(pair_key)
+            yield Edge.from_key(first), Edge.from_key(second)
+
+    def __len__(self):
+        return len(self.puzzle.conflict_edge_keys)
+
+    def add(self, pair):
+        (first, second) = pair
+        self.puzzle.add_edge_conflict(first, second)
+
+    def discard(self, pair):
+        (first, second) = pair
+        self.puzzle.detach_topology()
+        self.puzzle.conflict_edge_keys.discard(pack_edge_pair(first.key, second.key))
+
+    def __repr__(self):
+        return "ConflictEdgePairs({0!r})".format(set(self))
+
+
 class Puzzle:
+    __slots__ = (
+        "node_ids_to_nodes", "node_ids_to_adjacent_node_ids", "conflict_edge_keys", "next_node_id",
+        "topology"
+    )
+
     def __init__(self):
         self.node_ids_to_nodes = {}
         """:type: dict[int, Node]"""
         self.node_ids_to_adjacent_node_ids = {}
         """:type: dict[int, set[int]]"""
-        self.conflict_edge_pairs = set()
-        """:type: set[(Edge, Edge)]"""
+        self.conflict_edge_keys = set()
+        """:type: set[int]"""
 
         self.next_node_id = 0
 
+        # while set, the links and conflicts are those of the topology (and shared with it)
+        self.topology = None
+        """:type: Topology|None"""
+
+    def use_topology(self, topology):
+        """
+        Link the nodes as in the given topology, sharing its links, conflicts and compiled tables
+        instead of building them again. The puzzle must have the same node IDs; it gets its own
+        copy of the links as soon as they are changed.
+
+        :type topology: Topology
+        """
+        if tuple(sorted(self.node_ids_to_nodes.keys())) != topology.node_ids:
+            raise ValueError("the topology is for different nodes")
+        self.node_ids_to_adjacent_node_ids = topology.node_ids_to_adjacent_node_ids
+        self.conflict_edge_keys = topology.conflict_edge_keys
+        self.topology = topology
+
+    def detach_topology(self):
+        """
+        Make the links and conflicts of the puzzle its own again before they are changed.
+        """
+        if self.topology is None:
+            return
+        self.node_ids_to_adjacent_node_ids = {
+            k: set(v) for (k, v) in self.node_ids_to_adjacent_node_ids.items()
+        }
+        self.conflict_edge_keys = set(self.conflict_edge_keys)
+        self.topology = None
+
+    @property
+    def conflict_edge_pairs(self):
+        """
+        The conflicting edges as normalized pairs. They are stored packed in conflict_edge_keys;
+        this is a view of them that can be changed like the set it used to be.
+
+        :rtype: ConflictEdgePairs
+        """
+        return ConflictEdgePairs(self)
+
+    @conflict_edge_pairs.setter
+    def conflict_edge_pairs(self, pairs):
+        """
+        :type pairs: collections.Iterable[(Edge, Edge)]
+        """
+        self.detach_topology()
+        self.conflict_edge_keys = {
+            pack_edge_pair(first.key, second.key) for (first, second) in pairs
+        }
+
     def copy(self):
         p = Puzzle()
         p.node_ids_to_nodes = self.node_ids_to_nodes.copy()
-        for (k, v) in self.node_ids_to_adjacent_node_ids:
+        p.next_node_id = self.next_node_id
+        if self.topology is not None:
+            p.use_topology(self.topology)
+            return p
+
+        for (k, v) in self.node_ids_to_adjacent_node_ids.items():
             p.node_ids_to_adjacent_node_ids[k] = v.copy()
-        p.conflict_edge_pairs = self.conflict_edge_pairs.copy()
+        p.conflict_edge_keys = self.conflict_edge_keys.copy()
 
         return p
 
@@ -96,6 +279,7 @@ class Puzzle:
         """
         :type node: Node
         """
+        self.detach_topology()
         node_id = self.next_node_id
         self.next_node_id += 1
 
@@ -104,21 +288,51 @@ class Puzzle:
 
         return node_id
 
+    def add_nodes(self, nodes):
+        """
+        Add many nodes at once, returning their IDs in the same order.
+
+        :type nodes: list[Node]
+        :rtype: list[int]
+        """
+        self.detach_topology()
+        node_ids = list(range(self.next_node_id, self.next_node_id + len(nodes)))
+        self.next_node_id += len(nodes)
+
+        self.node_ids_to_nodes.update(zip(node_ids, nodes))
+        self.node_ids_to_adjacent_node_ids.update((node_id, set()) for node_id in node_ids)
+
+        return node_ids
+
     def link_nodes(self, one_id, two_id):
         """
         :type one_id: int
         :type two_id: int
         """
+        self.detach_topology()
         if one_id > two_id:
             one_id, two_id = two_id, one_id
 
         self.node_ids_to_adjacent_node_ids[one_id].add(two_id)
 
+    def link_edge_keys(self, edge_keys):
+        """
+        Link the nodes of many edges at once.
+
+        :param edge_keys: the edges, packed (see pack_edge())
+        :type edge_keys: collections.Iterable[int]
+        """
+        self.detach_topology()
+        adjacent_node_ids = self.node_ids_to_adjacent_node_ids
+        for key in edge_keys:
+            adjacent_node_ids[key >> EDGE_NODE_BITS].add(key & EDGE_NODE_MASK)
+
     def unlink_nodes(self, one_id, two_id):
         """
         :type one_id: int
         :type two_id: int
         """
+        self.detach_topology()
         if one_id > two_id:
             one_id, two_id = two_id, one_id
 
@@ -152,8 +366,18 @@ class Puzzle:
         :type first: Edge
         :type second: Edge
         """
-        first, second = self.normalize_edge_couple(first, second)
-        self.conflict_edge_pairs.add((first, second))
+        self.detach_topology()
+        self.conflict_edge_keys.add(pack_edge_pair(first.key, second.key))
+
+    def add_edge_conflict_keys(self, pair_keys):
+        """
+        Add many edge conflicts at once.
+
+        :param pair_keys: the conflicting pairs of edges, packed (see pack_edge_pair())
+        :type pair_keys: collections.Iterable[int]
+        """
+        self.detach_topology()
+        self.conflict_edge_keys.update(pair_keys)
 
     def is_edge_conflict(self, first, second):
         """
@@ -161,6 +385,397 @@ class Puzzle:
         :type second: Edge
         :rtype: bool
         """
-        first, second = self.normalize_edge_couple(first, second)
+        return pack_edge_pair(first.key, second.key) in self.conflict_edge_keys
+
+    def compile(self):
+        """
+        :rtype: CompiledPuzzle
+        """
+        return CompiledPuzzle(self)
+
+
+def indexes_to_mask(indexes, size):
+    """
+    Build the bitmask with the given bits set in time linear in its size, unlike setting them one
+    by one.
+
+    :type indexes: collections.Iterable[int]
+    :type size: int
+    :rtype: int
+    """
+    bits = bytearray((size + 7) // 8)
+    for i in indexes:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, "little")
+
+
+def build_mask(offsets, items, index):
+    """
+    Build mask index of a MaskTable with the given offsets and items.
+
+    :type offsets: tuple[int]
+    :type items: tuple[int]
+    :type index: int
+    :rtype: int
+    """
+    if not 0 <= index < len(offsets) - 1:
+        raise IndexError("mask index out of range")
+    mask = 0
+    for item in items[offsets[index]:offsets[index + 1]]:
+        mask |= 1 << item
+    return mask
+
+
+class _BuiltMasks(dict):
+    """
+    The masks of a MaskTable built so far, building the others as they are looked up.
+    """
+    __slots__ = ("offsets", "items")
+
+    def __init__(self, offsets, items):
+        """
+        :type offsets: tuple[int]
+        :type items: tuple[int]
+        """
+        super().__init__()
+        self.offsets = offsets
+        """:type: tuple[int]"""
+        self.items = items
+        """:type: tuple[int]"""
+
+    def __missing__(self, index):
+        mask = self[index] = build_mask(self.offsets, self.items, index)
+        return mask
+
+
+class MaskTable:
+    """
+    A read-only sequence of bitmasks, mask i having the bits items[offsets[i]:offsets[i+1]] set,
+    that only builds each mask when it is first asked for and then remembers it. A mask is about
+    as wide as the highest bit it has set, so building all of them up front would take time and
+    memory quadratic in the size of the puzzle; this way, only the masks of the part of a puzzle
+    a search actually visits are built.
+    """
+    __slots__ = ("offsets", "items", "_built", "lookup")
+
+    def __init__(self, offsets, items):
+        """
+        :type offsets: tuple[int]
+        :type items: tuple[int]
+        """
+        self.offsets = offsets
+        """:type: tuple[int]"""
+        self.items = items
+        """:type: tuple[int]"""
+        self._built = _BuiltMasks(offsets, items)
+        """:type: _BuiltMasks"""
+        self.lookup = self._built.__getitem__
+        """
+        The same as indexing the table, but without a Python call on top; for hot loops.
 
-        return (first, second) in self.conflict_edge_pairs
+        :type: (int) -> int
+        """
+
+    def build(self, index):
+        """
+        Build mask index without remembering it, for one-off lookups in puzzles too large to
+        remember every mask of.
+
+        :type index: int
+        :rtype: int
+        """
+        return build_mask(self.offsets, self.items, index)
+
+    def __getitem__(self, index):
+        """
+        :type index: int
+        :rtype: int
+        """
+        return self._built[index]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __reduce__(self):
+        # the masks are rebuilt on demand rather than pickled
+        return MaskTable, (self.offsets, self.items)
+
+    def __repr__(self):
+        return "MaskTable({0} masks, {1} built)".format(len(self), len(self._built))
+
+
+class Topology:
+    """
+    The part of a CompiledPuzzle that only depends on how the nodes are linked, not on what kind
+    of nodes they are: the edges, the adjacency and the edge conflicts, in the same form as in
+    CompiledPuzzle. Puzzles whose nodes only differ in their kinds can share a topology (see
+    Puzzle.use_topology()), so that it is only compiled once. It also keeps a frozen copy of the
+    links and conflicts it was compiled from, which such puzzles use as their own (unless it was
+    built with keep_links unset, just to be compiled from).
+
+    Everything is built in time and memory linear in the size of the puzzle; the bitmasks are
+    only built as they are used (see MaskTable).
+    """
+    __slots__ = (
+        "node_ids", "node_indexes", "node_ids_to_adjacent_node_ids", "conflict_edge_keys",
+        "edge_keys", "edge_ones", "edge_twos", "all_edges_mask", "node_edge_masks",
+        "node_neighbor_masks", "neighbor_offsets", "neighbor_nodes", "neighbor_edges",
+        "conflict_offsets", "conflict_edges", "edge_conflict_masks"
+    )
+
+    def __init__(self, puzzle, keep_links=True):
+        """
+        :type puzzle: Puzzle
+        :type keep_links: bool
+        """
+        self.node_ids = tuple(sorted(puzzle.node_ids_to_nodes.keys()))
+        """:type: tuple[int]"""
+        self.node_indexes = {node_id: i for (i, node_id) in enumerate(self.node_ids)}
+        """:type: dict[int, int]"""
+        self.node_ids_to_adjacent_node_ids = None
+        """:type: dict[int, frozenset[int]]|None"""
+        self.conflict_edge_keys = None
+        """:type: frozenset[int]|None"""
+        if keep_links:
+            self.node_ids_to_adjacent_node_ids = {
+                k: frozenset(v) for (k, v) in puzzle.node_ids_to_adjacent_node_ids.items()
+            }
+            self.conflict_edge_keys = frozenset(puzzle.conflict_edge_keys)
+
+        edge_keys = sorted(
+            pack_edge(one_id, two_id)
+            for (one_id, two_ids) in puzzle.node_ids_to_adjacent_node_ids.items()
+            for two_id in two_ids
+        )
+        self.edge_keys = tuple(edge_keys)
+        """:type: tuple[int]"""
+
+        node_indexes = self.node_indexes
+        self.edge_ones = tuple(node_indexes[key >> EDGE_NODE_BITS] for key in edge_keys)
+        """:type: tuple[int]"""
+        self.edge_twos = tuple(node_indexes[key & EDGE_NODE_MASK] for key in edge_keys)
+        """:type: tuple[int]"""
+        self.all_edges_mask = (1 << len(edge_keys)) - 1
+
+        # counting sort: since the edges are sorted by their lower node, then their higher node,
+        # every node meets its neighbors in ascending order
+        degrees = [0 for _ in self.node_ids]
+        for one in self.edge_ones:
+            degrees[one] += 1
+        for two in self.edge_twos:
+            degrees[two] += 1
+        neighbor_offsets = list(accumulate(degrees, initial=0))
+        positions = neighbor_offsets[:-1]
+        neighbor_nodes = [0 for _ in range(neighbor_offsets[-1])]
+        neighbor_edges = [0 for _ in range(neighbor_offsets[-1])]
+        for (i, (one, two)) in enumerate(zip(self.edge_ones, self.edge_twos)):
+            k = positions[one]
+            neighbor_nodes[k] = two
+            neighbor_edges[k] = i
+            positions[one] = k + 1
+            k = positions[two]
+            neighbor_nodes[k] = one
+            neighbor_edges[k] = i
+            positions[two] = k + 1
+        del positions
+        self.neighbor_offsets = tuple(neighbor_offsets)
+        """:type: tuple[int]"""
+        self.neighbor_nodes = tuple(neighbor_nodes)
+        """:type: tuple[int]"""
+        self.neighbor_edges = tuple(neighbor_edges)
+        """:type: tuple[int]"""
+        self.node_edge_masks = MaskTable(self.neighbor_offsets, self.neighbor_edges)
+        """:type: MaskTable"""
+        self.node_neighbor_masks = MaskTable(self.neighbor_offsets, self.neighbor_nodes)
+        """:type: MaskTable"""
+
+        # both directions of each conflict, packed as first * edge count + second and sorted
+        edge_count = len(edge_keys)
+        packed_conflicts = []
+        for pair_key in puzzle.conflict_edge_keys:
+            (first, second) = unpack_edge_pair(pair_key)
+            first_index = bisect_left(edge_keys, first)
+            second_index = bisect_left(edge_keys, second)
+            if first_index == edge_count or edge_keys[first_index] != first or \
+                    second_index == edge_count or edge_keys[second_index] != second:
+                # a conflict with an edge that doesn't exist can never happen
+                continue
+            packed_conflicts.append(first_index * edge_count + second_index)
+            packed_conflicts.append(second_index * edge_count + first_index)
+        packed_conflicts.sort()
+        conflict_counts = [0 for _ in edge_keys]
+        for packed in packed_conflicts:
+            conflict_counts[packed // edge_count] += 1
+        self.conflict_offsets = tuple(accumulate(conflict_counts, initial=0))
+        """:type: tuple[int]"""
+        self.conflict_edges = tuple(packed % edge_count for packed in packed_conflicts)
+        """:type: tuple[int]"""
+        self.edge_conflict_masks = MaskTable(self.conflict_offsets, self.conflict_edges)
+        """:type: MaskTable"""
+
+
+class CompiledPuzzle:
+    """
+    Dense, read-only snapshot of a Puzzle as consumed by the solver.
+
+    Nodes and edges are numbered consecutively from 0 (in ascending order of node ID and edge,
+    respectively); sets of edges are represented as integer bitmasks where bit i stands for edge i.
+    Adjacency is stored in both directions in CSR form: the neighbors of node i are
+    neighbor_nodes[neighbor_offsets[i]:neighbor_offsets[i+1]], connected via the edges at the same
+    positions in neighbor_edges; likewise, the edges crossing edge i are
+    conflict_edges[conflict_offsets[i]:conflict_offsets[i+1]]. The same sets are available as
+    bitmasks in node_edge_masks, node_neighbor_masks and edge_conflict_masks, which are only built
+    as they are used (see MaskTable). These tables are taken from the topology of the puzzle if it
+    has one.
+    """
+    __slots__ = (
+        "node_ids", "node_indexes", "node_kinds", "node_shapes", "node_terminates",
+        "node_multipass_counts", "multipass_nodes", "multipass_node_mask", "shapes",
+        "shape_terminators", "shape_node_counts", "shape_node_masks", "edge_keys", "edge_ones",
+        "edge_twos", "all_edges_mask", "node_edge_masks", "node_neighbor_masks",
+        "neighbor_offsets", "neighbor_nodes", "neighbor_edges", "conflict_offsets",
+        "conflict_edges", "edge_conflict_masks", "zobrist_keys"
+    )
+
+    def __init__(self, puzzle):
+        """
+        :type puzzle: Puzzle
+        """
+        topology = puzzle.topology
+        if topology is None:
+            topology = Topology(puzzle, keep_links=False)
+        self.node_ids = topology.node_ids
+        """:type: tuple[int]"""
+        self.node_indexes = topology.node_indexes
+        """:type: dict[int, int]"""
+
+        node_kinds = []
+        node_shapes = []
+        node_terminates = []
+        node_multipass_counts = []
+        shape_terminators = {}
+        shape_node_counts = {}
+        for (i, node_id) in enumerate(self.node_ids):
+            node = puzzle.node_ids_to_nodes[node_id]
+            if isinstance(node, ShapeNode):
+                node_kinds.append(NODE_KIND_SHAPE)
+                node_shapes.append(node.shape)
+                node_terminates.append(node.terminates)
+                node_multipass_counts.append(0)
+                if node.shape not in shape_terminators:
+                    shape_terminators[node.shape] = []
+                    shape_node_counts[node.shape] = 0
+                shape_node_counts[node.shape] += 1
+                if node.terminates:
+                    shape_terminators[node.shape].append(i)
+            elif isinstance(node, MultipassNode):
+                node_kinds.append(NODE_KIND_MULTIPASS)
+                node_shapes.append(None)
+                node_terminates.append(False)
+                node_multipass_counts.append(node.count)
+            else:
+                node_kinds.append(NODE_KIND_BLOCKED)
+                node_shapes.append(None)
+                node_terminates.append(False)
+                node_multipass_counts.append(0)
+
+        self.node_kinds = tuple(node_kinds)
+        """:type: tuple[int]"""
+        self.node_shapes = tuple(node_shapes)
+        """:type: tuple[int|None]"""
+        self.node_terminates = tuple(node_terminates)
+        """:type: tuple[bool]"""
+        self.node_multipass_counts = tuple(node_multipass_counts)
+        """:type: tuple[int]"""
+        self.multipass_nodes = tuple(
+            i for (i, kind) in enumerate(node_kinds) if kind == NODE_KIND_MULTIPASS
+        )
+        """:type: tuple[int]"""
+        self.shapes = tuple(sorted(shape_terminators.keys()))
+        """:type: tuple[int]"""
+        self.shape_terminators = {
+            shape: tuple(terminators) for (shape, terminators) in shape_terminators.items()
+        }
+        """:type: dict[int, tuple[int]]"""
+        self.shape_node_counts = shape_node_counts
+        """:type: dict[int, int]"""
+        shape_nodes = {shape: [] for shape in self.shapes}
+        for (i, shape) in enumerate(node_shapes):
+            if shape is not None:
+                shape_nodes[shape].append(i)
+        self.shape_node_masks = {
+            shape: indexes_to_mask(indexes, len(node_shapes))
+            for (shape, indexes) in shape_nodes.items()
+        }
+        """:type: dict[int, int]"""
+        self.multipass_node_mask = indexes_to_mask(self.multipass_nodes, len(node_shapes))
+        """:type: int"""
+
+        self.edge_keys = topology.edge_keys
+        """:type: tuple[int]"""
+        self.edge_ones = topology.edge_ones
+        """:type: tuple[int]"""
+        self.edge_twos = topology.edge_twos
+        """:type: tuple[int]"""
+        self.all_edges_mask = topology.all_edges_mask
+        self.node_edge_masks = topology.node_edge_masks
+        """:type: MaskTable"""
+        self.node_neighbor_masks = topology.node_neighbor_masks
+        """:type: MaskTable"""
+        self.neighbor_offsets = topology.neighbor_offsets
+        """:type: tuple[int]"""
+        self.neighbor_nodes = topology.neighbor_nodes
+        """:type: tuple[int]"""
+        self.neighbor_edges = topology.neighbor_edges
+        """:type: tuple[int]"""
+        self.conflict_offsets = topology.conflict_offsets
+        """:type: tuple[int]"""
+        self.conflict_edges = topology.conflict_edges
+        """:type: tuple[int]"""
+        self.edge_conflict_masks = topology.edge_conflict_masks
+        """:type: MaskTable"""
+
+        # random keys for hashing search states: zobrist_keys[node][visits] (0 for no visits)
+        rng = random.Random(ZOBRIST_SEED)
+        self.zobrist_keys = tuple(
+            (0,) + tuple(rng.getrandbits(64) for _ in range(max(count, 1)))
+            for count in self.node_multipass_counts
+        )
+        """:type: tuple[tuple[int]]"""
+
+    @property
+    def node_count(self):
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.edge_keys)
+
+    @property
+    def edges(self):
+        """
+        :rtype: tuple[Edge]
+        """
+        return tuple(Edge.from_key(key) for key in self.edge_keys)
+
+    def find_edge(self, one, two):
+        """
+        :type one: int
+        :type two: int
+        :rtype: int|None
+        """
+        for k in range(self.neighbor_offsets[one], self.neighbor_offsets[one + 1]):
+            if self.neighbor_nodes[k] == two:
+                return self.neighbor_edges[k]
+        return None
+
+    def degree(self, node_index):
+        """
+        :type node_index: int
+        :rtype: int
+        """
+        return self.neighbor_offsets[node_index + 1] - self.neighbor_offsets[node_index]
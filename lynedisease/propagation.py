@@ -0,0 +1,155 @@
+from lynedisease.model import NODE_KIND_BLOCKED, NODE_KIND_MULTIPASS, NODE_KIND_SHAPE
+
+__author__ = 'ondra'
+
+
+class Propagation:
+    """
+    The result of propagate(): which edges can still be part of a solution and which edges are
+    part of every solution.
+    """
+    def __init__(self, compiled):
+        """
+        :type compiled: lynedisease.model.CompiledPuzzle
+        """
+        self.available_edges = compiled.all_edges_mask
+        """:type: int"""
+        self.forced_edges = 0
+        """:type: int"""
+        self.feasible = True
+        """:type: bool"""
+        self.dead_edge_count = 0
+        """:type: int"""
+        self.forced_edge_count = 0
+        """:type: int"""
+
+    def __repr__(self):
+        return "Propagation(feasible={0}, dead_edges={1}, forced_edges={2})".format(
+            self.feasible, self.dead_edge_count, self.forced_edge_count
+        )
+
+
+def required_degree(compiled, node_index):
+    """
+    The number of edges of the node that every solution uses: one for a terminator, two for any
+    other shape node and two per pass for a multipass node.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type node_index: int
+    :rtype: int
+    """
+    kind = compiled.node_kinds[node_index]
+    if kind == NODE_KIND_SHAPE:
+        return 1 if compiled.node_terminates[node_index] else 2
+    elif kind == NODE_KIND_MULTIPASS:
+        return 2 * compiled.node_multipass_counts[node_index]
+    return 0
+
+
+def is_edge_usable(compiled, edge_index):
+    """
+    Check whether an edge can be used by any path at all: it has to connect two nodes of the same
+    shape or a multipass node to another multipass or shape node. An edge between the two
+    terminators of a shape can only be used if the shape has no other nodes.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type edge_index: int
+    :rtype: bool
+    """
+    one = compiled.edge_ones[edge_index]
+    two = compiled.edge_twos[edge_index]
+    (one_kind, two_kind) = (compiled.node_kinds[one], compiled.node_kinds[two])
+    if one_kind == NODE_KIND_BLOCKED or two_kind == NODE_KIND_BLOCKED:
+        return False
+    if one_kind == NODE_KIND_MULTIPASS or two_kind == NODE_KIND_MULTIPASS:
+        return True
+
+    shape = compiled.node_shapes[one]
+    if compiled.node_shapes[two] != shape:
+        return False
+    if compiled.node_terminates[one] and compiled.node_terminates[two]:
+        return compiled.shape_node_counts[shape] == 2
+    return True
+
+
+def propagate(compiled):
+    """
+    Find edges that cannot be part of any solution and edges that have to be part of every
+    solution, repeating until nothing changes anymore:
+
+    * edges that no path can use are dead (see is_edge_usable())
+    * if a node has exactly as many remaining edges as it has to use, all of them are forced
+    * if a node already has as many forced edges as it has to use, its other edges are dead
+    * edges crossing a forced edge are dead
+
+    If a node ends up with too few remaining edges or too many forced edges, the puzzle has no
+    solution and the result is marked as not feasible.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :rtype: Propagation
+    """
+    result = Propagation(compiled)
+    available_edges = result.available_edges
+    forced_edges = 0
+    pending = set()
+
+    for edge_index in range(compiled.edge_count):
+        if not is_edge_usable(compiled, edge_index):
+            available_edges &= ~(1 << edge_index)
+            pending.add(compiled.edge_ones[edge_index])
+            pending.add(compiled.edge_twos[edge_index])
+
+    required = [required_degree(compiled, i) for i in range(compiled.node_count)]
+    pending.update(i for i in range(compiled.node_count) if required[i] > 0)
+
+    # this visits every node, so the masks are built without being remembered, lest they take up
+    # memory quadratic in the size of the puzzle
+    node_edge_masks = compiled.node_edge_masks
+    edge_conflict_masks = compiled.edge_conflict_masks
+    while pending:
+        node_index = pending.pop()
+        node_edges = available_edges & node_edge_masks.build(node_index)
+        node_forced_edges = forced_edges & node_edges
+        edge_count = node_edges.bit_count()
+        forced_count = node_forced_edges.bit_count()
+
+        if edge_count < required[node_index] or forced_count > required[node_index]:
+            result.feasible = False
+            break
+
+        if edge_count == required[node_index]:
+            new_forced_edges = node_edges & ~node_forced_edges
+            dead_edges = 0
+        elif forced_count == required[node_index]:
+            new_forced_edges = 0
+            dead_edges = node_edges & ~node_forced_edges
+        else:
+            continue
+
+        forced_edges |= new_forced_edges
+        while new_forced_edges:
+            edge_bit = new_forced_edges & -new_forced_edges
+            new_forced_edges ^= edge_bit
+            edge_index = edge_bit.bit_length() - 1
+            dead_edges |= edge_conflict_masks.build(edge_index) & available_edges
+            pending.add(compiled.edge_ones[edge_index])
+            pending.add(compiled.edge_twos[edge_index])
+
+        if dead_edges & forced_edges:
+            # two forced edges cross
+            result.feasible = False
+            break
+
+        available_edges &= ~dead_edges
+        while dead_edges:
+            edge_bit = dead_edges & -dead_edges
+            dead_edges ^= edge_bit
+            edge_index = edge_bit.bit_length() - 1
+            pending.add(compiled.edge_ones[edge_index])
+            pending.add(compiled.edge_twos[edge_index])
+
+    result.available_edges = available_edges
+    result.forced_edges = forced_edges
+    result.dead_edge_count = (compiled.all_edges_mask & ~available_edges).bit_count()
+    result.forced_edge_count = forced_edges.bit_count()
+    return result
@@ -1,3 +1,10 @@
+import argparse
+from collections import OrderedDict
+import json
+import sys
+
+import lynedisease.cache as c
+from lynedisease.limits import GaveUp
 import lynedisease.link_shapes as ls
 import lynedisease.model as m
 import lynedisease.solver as s
@@ -5,6 +12,269 @@ import lynedisease.solver as s
 __author__ = 'ondra'
 
 
+def parse_spec(line):
+    """
+    Parse a width:height:spec line into the lattice dimensions and its nodes, row by row.
+
+    :type line: str
+    :rtype: (int, int, list[lynedisease.model.Node|None])
+    """
+    split_line = line.split(":")
+    if len(split_line) != 3 or not split_line[0].isnumeric() or not split_line[1].isnumeric():
+        raise ValueError("format: width:height:spec")
+
+    width = int(split_line[0])
+    height = int(split_line[1])
+
+    if len(split_line[2]) != (width*height):
+        raise ValueError("need {0} characters".format(width*height))
+
+    nodes = []
+
+    for c in split_line[2]:
+        if "a" <= c <= "z":
+            color = ord(c) - ord("a")
+            nodes.append(m.ShapeNode(color, terminates=False))
+        elif "A" <= c <= "Z":
+            color = ord(c) - ord("A")
+            nodes.append(m.ShapeNode(color, terminates=True))
+        elif "1" <= c <= "9":
+            count = ord(c) - ord("0")
+            nodes.append(m.MultipassNode(count))
+        elif c == "_":
+            nodes.append(None)
+        else:
+            raise ValueError("unknown node {0!r}".format(c))
+
+    return width, height, nodes
+
+
+def format_spec(width, height, nodes):
+    """
+    Format the nodes of a lattice, row by row, as a width:height:spec line; the inverse of
+    parse_spec().
+
+    :type width: int
+    :type height: int
+    :type nodes: list[lynedisease.model.Node|None]
+    :rtype: str
+    """
+    chars = []
+    for node in nodes:
+        if node is None:
+            chars.append("_")
+        elif isinstance(node, m.ShapeNode):
+            base = "A" if node.terminates else "a"
+            chars.append(chr(ord(base) + node.shape))
+        elif isinstance(node, m.MultipassNode):
+            chars.append(chr(ord("0") + node.count))
+        else:
+            raise ValueError("unknown node {0!r}".format(node))
+    return "{0}:{1}:{2}".format(width, height, "".join(chars))
+
+
+def lattice_nodes(puzzle, node_ids_to_nodes, width, height):
+    """
+    Place the nodes of a puzzle built by build_puzzle() back into their lattice; the inverse of
+    build_puzzle().
+
+    :type puzzle: lynedisease.model.Puzzle
+    :type node_ids_to_nodes: dict[int, int]
+    :type width: int
+    :type height: int
+    :rtype: list[lynedisease.model.Node|None]
+    """
+    nodes = [None for _ in range(width * height)]
+    for (node_id, position) in node_ids_to_nodes.items():
+        nodes[position] = puzzle.node_ids_to_nodes[node_id]
+    return nodes
+
+
+class TopologyCache:
+    """
+    Remembers the topology of every lattice built with it, keyed by its dimensions and the
+    positions of its holes, so that lattices that only differ in the kinds of their nodes are only
+    linked and compiled once. The most recently used entries are kept.
+    """
+    def __init__(self, max_entries=1024):
+        """
+        :type max_entries: int
+        """
+        self.max_entries = max_entries
+        """:type: int"""
+        self.entries = OrderedDict()
+        """:type: OrderedDict[(int, int, int), lynedisease.model.Topology]"""
+        self.hits = 0
+        """:type: int"""
+        self.misses = 0
+        """:type: int"""
+
+    @property
+    def hit_rate(self):
+        """
+        The fraction of lookups that found a topology (0.0 before the first one).
+
+        :rtype: float
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def lookup(self, key):
+        """
+        :type key: (int, int, int)
+        :rtype: lynedisease.model.Topology|None
+        """
+        topology = self.entries.get(key)
+        if topology is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return topology
+
+    def store(self, key, topology):
+        """
+        :type key: (int, int, int)
+        :type topology: lynedisease.model.Topology
+        """
+        self.entries[key] = topology
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+def hole_mask(nodes):
+    """
+    The positions of the holes in a lattice as a bitmask.
+
+    :type nodes: list[lynedisease.model.Node|None]
+    :rtype: int
+    """
+    return int("0" + "".join("1" if n is None else "0" for n in reversed(nodes)), 2)
+
+
+def build_puzzle(width, height, nodes, topologies=None):
+    """
+    Build a puzzle from a lattice of nodes, returning it along with a mapping from its node IDs to
+    their positions in the lattice. If a TopologyCache is given, the puzzle shares the links and
+    compiled tables of earlier lattices with the same dimensions and holes.
+
+    :type width: int
+    :type height: int
+    :type nodes: list[lynedisease.model.Node|None]
+    :type topologies: TopologyCache|None
+    :rtype: (lynedisease.model.Puzzle, dict[int, int])
+    """
+    puzzle = m.Puzzle()
+
+    positions = [k for (k, n) in enumerate(nodes) if n is not None]
+    added_node_ids = puzzle.add_nodes([nodes[k] for k in positions])
+    node_ids_to_nodes = dict(zip(added_node_ids, positions))
+
+    key = None
+    if topologies is not None:
+        key = (width, height, hole_mask(nodes))
+        topology = topologies.lookup(key)
+        if topology is not None:
+            puzzle.use_topology(topology)
+            return puzzle, node_ids_to_nodes
+
+    node_ids = [None for _ in nodes]
+    for (k, v) in zip(positions, added_node_ids):
+        node_ids[k] = v
+    ls.square_lattice(puzzle, node_ids, width, height)
+
+    if topologies is not None:
+        topology = m.Topology(puzzle)
+        topologies.store(key, topology)
+        puzzle.use_topology(topology)
+
+    return puzzle, node_ids_to_nodes
+
+
+def transform_lattice(width, height, flip_columns, flip_rows, transpose):
+    """
+    Apply one of the eight symmetries of a rectangle to a lattice: mirror its columns and/or rows,
+    then optionally swap rows and columns. Returns the dimensions of the transformed lattice and,
+    for each of its positions, the position in the original lattice it comes from.
+
+    :type width: int
+    :type height: int
+    :type flip_columns: bool
+    :type flip_rows: bool
+    :type transpose: bool
+    :rtype: (int, int, list[int])
+    """
+    (new_width, new_height) = (height, width) if transpose else (width, height)
+
+    positions = []
+    for new_row in range(new_height):
+        for new_column in range(new_width):
+            (column, row) = (new_row, new_column) if transpose else (new_column, new_row)
+            if flip_columns:
+                column = width - 1 - column
+            if flip_rows:
+                row = height - 1 - row
+            positions.append(row * width + column)
+
+    return new_width, new_height, positions
+
+
+def canonical_spec(width, height, spec):
+    """
+    Find the canonical version of a lattice spec among its rotations and reflections, with the
+    shapes relabeled in order of their first appearance. Returns the canonical width:height:spec
+    line, the position in the given lattice of each canonical position, and the given shape of
+    each canonical shape.
+
+    :type width: int
+    :type height: int
+    :type spec: str
+    :rtype: (str, list[int], list[int])
+    """
+    best = None
+    for flip_columns in (False, True):
+        for flip_rows in (False, True):
+            for transpose in (False, True):
+                (new_width, new_height, positions) = transform_lattice(
+                    width, height, flip_columns, flip_rows, transpose
+                )
+
+                shapes = []
+                new_spec = []
+                for position in positions:
+                    char = spec[position]
+                    if "a" <= char <= "z" or "A" <= char <= "Z":
+                        shape = ord(char.lower()) - ord("a")
+                        if shape not in shapes:
+                            shapes.append(shape)
+                        base = "a" if char.islower() else "A"
+                        char = chr(ord(base) + shapes.index(shape))
+                    new_spec.append(char)
+
+                line = "{0}:{1}:{2}".format(new_width, new_height, "".join(new_spec))
+                if best is None or line < best[0]:
+                    best = (line, positions, shapes)
+
+    return best
+
+
+def uncanonicalize_solution(solution, positions, shapes):
+    """
+    Translate a solution of a canonical spec (as lattice positions) back to the lattice it was
+    derived from, using the positions and shapes returned by canonical_spec().
+
+    :type solution: dict[int, list[int]]
+    :type positions: list[int]
+    :type shapes: list[int]
+    :rtype: dict[int, list[int]]
+    """
+    return {
+        shapes[shape]: [positions[p] for p in path]
+        for (shape, path) in solution.items()
+    }
+
+
 def format_solution_table_calc(solution, node_ids_to_nodes):
     """
     :type solution: dict[int, list[int]]
@@ -87,45 +357,163 @@ def format_solution_relative_movement(solution, node_ids_to_nodes):
 
     return new_solution
 
-if __name__ == '__main__':
-    while True:
-        line = input("w:h:line (a-z colors, A-Z terminators, 1-9 multipasses, _ none): ")
-        split_line = line.split(":")
-        if len(split_line) != 3 or not split_line[0].isnumeric() or not split_line[1].isnumeric():
-            print("format: width:height:spec")
+
+def solve_batch(in_file, out_file, workers=None, cache=None, timeout=None, topologies=None):
+    """
+    Solve every width:height:spec line of in_file in parallel, writing one JSON object per line to
+    out_file as soon as each is done. Each object contains the index of the input line and either
+    the solution (shapes mapped to paths of lattice positions, or null if there is none), the
+    reason the solver gave up on the line (if it took longer than timeout seconds) or an error
+    message.
+
+    Lines that are rotations, reflections or shape relabelings of each other are only solved once;
+    the canonical solutions are kept in the given SolutionCache (or a new in-memory one). Lines
+    with the same dimensions and holes share their topology through the given TopologyCache (or
+    a new one).
+
+    :type in_file: io.TextIOBase
+    :type out_file: io.TextIOBase
+    :type workers: int|None
+    :type cache: lynedisease.cache.SolutionCache|None
+    :type timeout: float|None
+    :type topologies: TopologyCache|None
+    """
+    if cache is None:
+        cache = c.SolutionCache()
+    if topologies is None:
+        topologies = TopologyCache()
+
+    # canonical line -> [(line index, positions, shapes)] waiting for its solution
+    waiting = {}
+    # puzzle index -> (canonical line, node IDs to positions)
+    pending = {}
+    puzzle_count = 0
+
+    def write_result(result):
+        out_file.write(json.dumps(result) + "\n")
+        out_file.flush()
+
+    def write_solution(line_index, canonical_solution, positions, shapes):
+        if canonical_solution is None:
+            solution = None
+        else:
+            solution = uncanonicalize_solution(canonical_solution, positions, shapes)
+        write_result({"index": line_index, "solution": solution})
+
+    def puzzles():
+        nonlocal puzzle_count
+        for (line_index, line) in enumerate(in_file):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                (width, height, _) = parse_spec(line)
+            except ValueError as exc:
+                write_result({"index": line_index, "error": str(exc)})
+                continue
+
+            (canonical_line, positions, shapes) = canonical_spec(width, height, line.split(":")[2])
+            key = "lattice:" + canonical_line
+
+            canonical_solution = cache.lookup(key)
+            if canonical_solution is not c.MISSING:
+                cache.hits += 1
+                write_solution(line_index, canonical_solution, positions, shapes)
+                continue
+
+            if key in waiting:
+                # already being solved
+                cache.hits += 1
+                waiting[key].append((line_index, positions, shapes))
+                continue
+
+            cache.misses += 1
+            waiting[key] = [(line_index, positions, shapes)]
+            (puzzle, node_ids_to_nodes) = build_puzzle(
+                *parse_spec(canonical_line), topologies=topologies
+            )
+            pending[puzzle_count] = (key, node_ids_to_nodes)
+            puzzle_count += 1
+            yield puzzle
+
+    for (index, solution) in s.solve_many(
+            puzzles(), workers=workers, return_exceptions=True, timeout=timeout
+    ):
+        (key, node_ids_to_nodes) = pending.pop(index)
+        waiters = waiting.pop(key)
+
+        if isinstance(solution, Exception):
+            for (line_index, _, _) in waiters:
+                write_result({"index": line_index, "error": str(solution)})
+            continue
+
+        if isinstance(solution, GaveUp):
+            # not cached; it might be solved with more time
+            for (line_index, _, _) in waiters:
+                write_result({"index": line_index, "gave_up": solution.reason})
             continue
 
-        width = int(split_line[0])
-        height = int(split_line[1])
+        if solution is None:
+            canonical_solution = None
+        else:
+            canonical_solution = {
+                shape: [node_ids_to_nodes[p] for p in path]
+                for (shape, path) in solution.items()
+            }
+        cache.store(key, canonical_solution)
+
+        for (line_index, positions, shapes) in waiters:
+            write_solution(line_index, canonical_solution, positions, shapes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Solve Lyne puzzles on rectangular lattices.")
+    parser.add_argument(
+        "--batch", metavar="FILE",
+        help="solve each width:height:spec line of FILE (- for stdin), writing JSON lines"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="number of worker processes for --batch (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--cache", metavar="PATH",
+        help="keep the solutions found by --batch in an SQLite database at PATH"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=None,
+        help="give up on a line of --batch after this many seconds"
+    )
+    args = parser.parse_args()
+
+    if args.batch is not None:
+        topologies = TopologyCache()
+        with c.SolutionCache(path=args.cache) as cache:
+            if args.batch == "-":
+                solve_batch(
+                    sys.stdin, sys.stdout, workers=args.workers, cache=cache, timeout=args.timeout,
+                    topologies=topologies
+                )
+            else:
+                with open(args.batch, "r") as f:
+                    solve_batch(
+                        f, sys.stdout, workers=args.workers, cache=cache, timeout=args.timeout,
+                        topologies=topologies
+                    )
+        sys.stderr.write("topology cache: {0} hits, {1} misses ({2:.0%} hit rate)\n".format(
+            topologies.hits, topologies.misses, topologies.hit_rate
+        ))
+        sys.exit(0)
 
-        if len(split_line[2]) != (width*height):
-            print("need {0} characters".format(width*height))
+    while True:
+        line = input("w:h:line (a-z colors, A-Z terminators, 1-9 multipasses, _ none): ")
+        try:
+            (width, height, nodes) = parse_spec(line)
+        except ValueError as exc:
+            print(exc)
             continue
 
-        nodes = []
-
-        for c in split_line[2]:
-            if "a" <= c <= "z":
-                color = ord(c) - ord("a")
-                nodes.append(m.ShapeNode(color, terminates=False))
-            elif "A" <= c <= "Z":
-                color = ord(c) - ord("A")
-                nodes.append(m.ShapeNode(color, terminates=True))
-            elif "1" <= c <= "9":
-                count = ord(c) - ord("0")
-                nodes.append(m.MultipassNode(count))
-            elif c == "_":
-                nodes.append(None)
-
-        puzzle = m.Puzzle()
-
-        node_ids = [(puzzle.add_node(n) if n is not None else None) for n in nodes]
-        ls.square_lattice(puzzle, node_ids, width, height)
-
-        node_ids_to_nodes = {}
-        for (k, v) in enumerate(node_ids):
-            if v is not None:
-                node_ids_to_nodes[v] = k
+        (puzzle, node_ids_to_nodes) = build_puzzle(width, height, nodes)
 
         solution = s.solve(puzzle)
         #print(format_solution_table_calc(solution, node_ids_to_nodes))
@@ -0,0 +1,771 @@
+import heapq
+
+from lynedisease.limits import GaveUp
+from lynedisease.model import NODE_KIND_MULTIPASS, NODE_KIND_SHAPE
+from lynedisease.propagation import propagate, required_degree
+
+try:
+    import pycosat
+except ImportError:
+    pycosat = None
+
+__author__ = 'ondra'
+
+RESTART_INTERVAL = 100
+"""The number of conflicts per unit of the Luby restart sequence."""
+
+ACTIVITY_DECAY = 0.95
+
+STOP_CHECK_INTERVAL = 256
+"""How many conflicts and decisions to go through between checks whether to stop solving."""
+
+INTERRUPTED = "interrupted"
+"""Returned by CDCLSolver.solve() if it was told to stop."""
+
+
+def luby(index):
+    """
+    The index-th element (counting from 1) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, ...
+
+    :type index: int
+    :rtype: int
+    """
+    size = 1
+    while size < index + 1:
+        size = 2 * size + 1
+    while size - 1 != index:
+        size = (size - 1) // 2
+        index %= size
+    return (size + 1) // 2
+
+
+class CDCLSolver:
+    """
+    A small conflict-driven clause learning SAT solver: two watched literals, first-UIP clause
+    learning, activity-based branching with phase saving and Luby restarts. Variables are
+    numbered from 1 and literals are nonzero integers as in the DIMACS format.
+
+    Clauses can be added between calls to solve(), which keeps everything learned so far.
+    """
+    def __init__(self, variable_count):
+        """
+        :type variable_count: int
+        """
+        self.variable_count = variable_count
+        """:type: int"""
+        self.clauses = []
+        """:type: list[list[int]]"""
+        self.watches = {}
+        """:type: dict[int, list[int]]"""
+        for variable in range(1, variable_count + 1):
+            self.watches[variable] = []
+            self.watches[-variable] = []
+
+        # 1 = true, -1 = false, 0 = unassigned
+        self.values = [0 for _ in range(variable_count + 1)]
+        """:type: list[int]"""
+        self.levels = [0 for _ in range(variable_count + 1)]
+        """:type: list[int]"""
+        self.reasons = [None for _ in range(variable_count + 1)]
+        """:type: list[int|None]"""
+        self.phases = [-1 for _ in range(variable_count + 1)]
+        """:type: list[int]"""
+        self.activities = [0.0 for _ in range(variable_count + 1)]
+        """:type: list[float]"""
+        self.activity_increment = 1.0
+        self.heap = [(0.0, variable) for variable in range(1, variable_count + 1)]
+        """:type: list[(float, int)]"""
+
+        self.trail = []
+        """:type: list[int]"""
+        self.trail_limits = []
+        """:type: list[int]"""
+        self.queue_head = 0
+        self.unsatisfiable = False
+        """:type: bool"""
+        self.conflicts = 0
+        """:type: int"""
+        self.decisions = 0
+        """:type: int"""
+
+    def value(self, literal):
+        """
+        :type literal: int
+        :rtype: int
+        """
+        return self.values[literal] if literal > 0 else -self.values[-literal]
+
+    def assign(self, literal, reason):
+        """
+        :type literal: int
+        :type reason: int|None
+        """
+        variable = abs(literal)
+        self.values[variable] = 1 if literal > 0 else -1
+        self.levels[variable] = len(self.trail_limits)
+        self.reasons[variable] = reason
+        self.trail.append(literal)
+
+    def add_clause(self, literals):
+        """
+        Add a clause. Only possible while no decisions are in effect, i.e. before or between calls
+        to solve().
+
+        :type literals: collections.Iterable[int]
+        """
+        if self.unsatisfiable:
+            return
+
+        clause = []
+        for literal in set(literals):
+            if -literal in clause:
+                # tautology
+                return
+            value = self.value(literal)
+            if value > 0:
+                # already satisfied
+                return
+            elif value == 0:
+                clause.append(literal)
+
+        if len(clause) == 0:
+            self.unsatisfiable = True
+        elif len(clause) == 1:
+            self.assign(clause[0], None)
+            if self.propagate() is not None:
+                self.unsatisfiable = True
+        else:
+            self.clauses.append(clause)
+            self.watches[clause[0]].append(len(self.clauses) - 1)
+            self.watches[clause[1]].append(len(self.clauses) - 1)
+
+    def propagate(self):
+        """
+        Assign the literals implied by unit clauses, returning the index of a conflicting clause if
+        one turns up.
+
+        :rtype: int|None
+        """
+        values = self.values
+        clauses = self.clauses
+        watches = self.watches
+        while self.queue_head < len(self.trail):
+            false_literal = -self.trail[self.queue_head]
+            self.queue_head += 1
+
+            watching = watches[false_literal]
+            kept = []
+            position = 0
+            while position < len(watching):
+                clause_index = watching[position]
+                position += 1
+                clause = clauses[clause_index]
+                if clause[0] == false_literal:
+                    clause[0] = clause[1]
+                    clause[1] = false_literal
+
+                first = clause[0]
+                first_value = values[first] if first > 0 else -values[-first]
+                if first_value > 0:
+                    kept.append(clause_index)
+                    continue
+
+                for k in range(2, len(clause)):
+                    literal = clause[k]
+                    if (values[literal] if literal > 0 else -values[-literal]) >= 0:
+                        clause[1] = literal
+                        clause[k] = false_literal
+                        watches[literal].append(clause_index)
+                        break
+                else:
+                    kept.append(clause_index)
+                    if first_value < 0:
+                        kept.extend(watching[position:])
+                        watches[false_literal] = kept
+                        self.queue_head = len(self.trail)
+                        return clause_index
+                    self.assign(first, clause_index)
+
+            watches[false_literal] = kept
+        return None
+
+    def bump(self, variable):
+        """
+        :type variable: int
+        """
+        self.activities[variable] += self.activity_increment
+        if self.activities[variable] > 1e100:
+            self.activities = [activity * 1e-100 for activity in self.activities]
+            self.activity_increment *= 1e-100
+            self.heap = [
+                (-self.activities[v], v) for v in range(1, self.variable_count + 1)
+                if self.values[v] == 0
+            ]
+            heapq.heapify(self.heap)
+        elif self.values[variable] == 0:
+            heapq.heappush(self.heap, (-self.activities[variable], variable))
+
+    def analyze(self, conflict):
+        """
+        Derive a learned clause from a conflict by resolving back to the first unique implication
+        point, returning it (asserting literal first) along with the level to jump back to.
+
+        :type conflict: int
+        :rtype: (list[int], int)
+        """
+        level = len(self.trail_limits)
+        learned = [0]
+        seen = set()
+        pending = 0
+        index = len(self.trail) - 1
+        clause = self.clauses[conflict]
+        while True:
+            for literal in clause:
+                variable = abs(literal)
+                if variable in seen or self.levels[variable] == 0:
+                    continue
+                seen.add(variable)
+                self.bump(variable)
+                if self.levels[variable] == level:
+                    pending += 1
+                else:
+                    learned.append(literal)
+
+            while abs(self.trail[index]) not in seen:
+                index -= 1
+            literal = self.trail[index]
+            index -= 1
+            pending -= 1
+            if pending == 0:
+                break
+            clause = self.clauses[self.reasons[abs(literal)]]
+
+        learned[0] = -literal
+        self.activity_increment /= ACTIVITY_DECAY
+
+        if len(learned) == 1:
+            return learned, 0
+
+        # watch the literal of the highest remaining level second
+        highest = max(range(1, len(learned)), key=lambda k: self.levels[abs(learned[k])])
+        (learned[1], learned[highest]) = (learned[highest], learned[1])
+        return learned, self.levels[abs(learned[1])]
+
+    def backtrack(self, level):
+        """
+        :type level: int
+        """
+        if len(self.trail_limits) <= level:
+            return
+        limit = self.trail_limits[level]
+        for literal in self.trail[limit:]:
+            variable = abs(literal)
+            self.phases[variable] = self.values[variable]
+            self.values[variable] = 0
+            self.reasons[variable] = None
+            heapq.heappush(self.heap, (-self.activities[variable], variable))
+        del self.trail[limit:]
+        del self.trail_limits[level:]
+        self.queue_head = limit
+
+    def pick_variable(self):
+        """
+        :rtype: int|None
+        """
+        while self.heap:
+            (activity, variable) = heapq.heappop(self.heap)
+            if self.values[variable] == 0 and -activity == self.activities[variable]:
+                return variable
+        for variable in range(1, self.variable_count + 1):
+            if self.values[variable] == 0:
+                return variable
+        return None
+
+    def solve(self, should_stop=None, max_decisions=None):
+        """
+        Return a satisfying assignment as a list indexed by variable (index 0 is unused), None if
+        there is none, or INTERRUPTED if should_stop (called every STOP_CHECK_INTERVAL conflicts
+        and decisions) returned True or max_decisions decisions (counted over all calls) had been
+        made first.
+
+        :type should_stop: (() -> bool)|None
+        :type max_decisions: int|None
+        :rtype: list[bool]|str|None
+        """
+        if self.unsatisfiable:
+            return None
+        self.backtrack(0)
+        if self.propagate() is not None:
+            self.unsatisfiable = True
+            return None
+
+        restarts = 0
+        conflicts_until_restart = RESTART_INTERVAL * luby(restarts)
+        steps = 0
+        while True:
+            steps += 1
+            if should_stop is not None and steps % STOP_CHECK_INTERVAL == 0 and should_stop():
+                self.backtrack(0)
+                return INTERRUPTED
+
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                if len(self.trail_limits) == 0:
+                    self.unsatisfiable = True
+                    return None
+
+                (learned, level) = self.analyze(conflict)
+                self.backtrack(level)
+                if len(learned) == 1:
+                    self.assign(learned[0], None)
+                else:
+                    self.clauses.append(learned)
+                    self.watches[learned[0]].append(len(self.clauses) - 1)
+                    self.watches[learned[1]].append(len(self.clauses) - 1)
+                    self.assign(learned[0], len(self.clauses) - 1)
+
+                conflicts_until_restart -= 1
+                if conflicts_until_restart == 0:
+                    restarts += 1
+                    conflicts_until_restart = RESTART_INTERVAL * luby(restarts)
+                    self.backtrack(0)
+                continue
+
+            variable = self.pick_variable()
+            if variable is None:
+                model = [value > 0 for value in self.values]
+                self.backtrack(0)
+                return model
+
+            if max_decisions is not None and self.decisions >= max_decisions:
+                self.backtrack(0)
+                return INTERRUPTED
+            self.decisions += 1
+            self.trail_limits.append(len(self.trail))
+            self.assign(variable if self.phases[variable] > 0 else -variable, None)
+
+
+class PycosatSolver:
+    """
+    The same interface as CDCLSolver, backed by pycosat. Every call to solve() starts from
+    scratch.
+    """
+    def __init__(self, variable_count):
+        """
+        :type variable_count: int
+        """
+        self.variable_count = variable_count
+        self.clauses = []
+        """:type: list[list[int]]"""
+
+    def add_clause(self, literals):
+        """
+        :type literals: collections.Iterable[int]
+        """
+        self.clauses.append(list(literals))
+
+    def solve(self, should_stop=None, max_decisions=None):
+        """
+        :param should_stop: ignored; pycosat cannot be interrupted
+        :param max_decisions: ignored, as should_stop
+        :type should_stop: (() -> bool)|None
+        :type max_decisions: int|None
+        :rtype: list[bool]|None
+        """
+        if any(len(clause) == 0 for clause in self.clauses):
+            return None
+        result = pycosat.solve(self.clauses, vars=self.variable_count)
+        if result == "UNSAT":
+            return None
+        model = [False for _ in range(self.variable_count + 1)]
+        for literal in result:
+            if literal > 0:
+                model[literal] = True
+        return model
+
+
+BACKENDS = {
+    "cdcl": CDCLSolver,
+}
+""":type: dict[str, type]"""
+if pycosat is not None:
+    BACKENDS["pycosat"] = PycosatSolver
+
+
+def default_backend():
+    """
+    :rtype: str
+    """
+    return "pycosat" if "pycosat" in BACKENDS else "cdcl"
+
+
+class Formula:
+    """
+    A CNF formula under construction, with helpers for the cardinality and parity constraints the
+    encoding needs.
+    """
+    def __init__(self):
+        self.variable_count = 0
+        """:type: int"""
+        self.clauses = []
+        """:type: list[list[int]]"""
+
+    def new_variable(self):
+        """
+        :rtype: int
+        """
+        self.variable_count += 1
+        return self.variable_count
+
+    def add(self, *literals):
+        """
+        :type literals: int
+        """
+        self.clauses.append(list(literals))
+
+    def at_most(self, literals, count):
+        """
+        At most count of the literals are true (sequential counter encoding).
+
+        :type literals: list[int]
+        :type count: int
+        """
+        if count >= len(literals):
+            return
+        if count == 0:
+            for literal in literals:
+                self.add(-literal)
+            return
+
+        # counters[j] is true if at least j + 1 of the literals so far are true
+        counters = [self.new_variable() for _ in range(count)]
+        self.add(-literals[0], counters[0])
+        for j in range(1, count):
+            self.add(-counters[j])
+
+        for literal in literals[1:-1]:
+            new_counters = [self.new_variable() for _ in range(count)]
+            self.add(-literal, new_counters[0])
+            for j in range(count):
+                self.add(-counters[j], new_counters[j])
+                if j > 0:
+                    self.add(-literal, -counters[j - 1], new_counters[j])
+            self.add(-literal, -counters[count - 1])
+            counters = new_counters
+
+        self.add(-literals[-1], -counters[count - 1])
+
+    def at_least(self, literals, count):
+        """
+        :type literals: list[int]
+        :type count: int
+        """
+        if count > len(literals):
+            self.add()
+            return
+        self.at_most([-literal for literal in literals], len(literals) - count)
+
+    def exactly(self, literals, count):
+        """
+        :type literals: list[int]
+        :type count: int
+        """
+        self.at_most(literals, count)
+        self.at_least(literals, count)
+
+    def even(self, literals):
+        """
+        An even number of the literals are true (chain of XORs).
+
+        :type literals: list[int]
+        """
+        if len(literals) == 0:
+            return
+        parity = literals[0]
+        for literal in literals[1:]:
+            new_parity = self.new_variable()
+            self.add(-parity, -literal, -new_parity)
+            self.add(parity, literal, -new_parity)
+            self.add(parity, -literal, new_parity)
+            self.add(-parity, literal, new_parity)
+            parity = new_parity
+        self.add(-parity)
+
+
+class Encoding:
+    """
+    The puzzle as a CNF formula. There is a variable for each pair of an edge and a shape that
+    could draw along it, saying whether it does, and one per edge saying whether it is used at
+    all. The clauses say that
+
+    * every edge is used by at most one shape
+    * crossing edges are not both used
+    * terminators have one used edge, other shape nodes two
+    * multipass nodes have two used edges per pass, and an even number for each shape
+
+    What this does not capture is that the edges of a shape have to be connected; instead of
+    encoding that up front, solve_compiled() adds cuts for disconnected cycles as it finds them.
+    """
+    def __init__(self, compiled, propagation):
+        """
+        :type compiled: lynedisease.model.CompiledPuzzle
+        :type propagation: lynedisease.propagation.Propagation
+        """
+        self.compiled = compiled
+        """:type: lynedisease.model.CompiledPuzzle"""
+        self.formula = Formula()
+        """:type: Formula"""
+        self.shape_edge_variables = [{} for _ in range(compiled.edge_count)]
+        """:type: list[dict[int, int]]"""
+        self.edge_variables = [None for _ in range(compiled.edge_count)]
+        """:type: list[int|None]"""
+
+        formula = self.formula
+        for edge_index in range(compiled.edge_count):
+            if not propagation.available_edges >> edge_index & 1:
+                continue
+
+            shapes = self.edge_shapes(edge_index)
+            for shape in shapes:
+                self.shape_edge_variables[edge_index][shape] = formula.new_variable()
+            if len(shapes) == 0:
+                continue
+
+            shape_variables = list(self.shape_edge_variables[edge_index].values())
+            if len(shape_variables) == 1:
+                self.edge_variables[edge_index] = shape_variables[0]
+            else:
+                used = formula.new_variable()
+                self.edge_variables[edge_index] = used
+                formula.add(-used, *shape_variables)
+                for variable in shape_variables:
+                    formula.add(-variable, used)
+                formula.at_most(shape_variables, 1)
+
+            if propagation.forced_edges >> edge_index & 1:
+                formula.add(self.edge_variables[edge_index])
+
+        offsets = compiled.conflict_offsets
+        for edge_index in range(compiled.edge_count):
+            used = self.edge_variables[edge_index]
+            if used is None:
+                continue
+            for other_index in compiled.conflict_edges[offsets[edge_index]:offsets[edge_index + 1]]:
+                if other_index <= edge_index:
+                    continue
+                other_used = self.edge_variables[other_index]
+                if other_used is not None:
+                    formula.add(-used, -other_used)
+
+        for node_index in range(compiled.node_count):
+            edge_indexes = self.node_edges(node_index)
+            kind = compiled.node_kinds[node_index]
+            if kind == NODE_KIND_SHAPE:
+                shape = compiled.node_shapes[node_index]
+                formula.exactly(
+                    [self.shape_edge_variables[e][shape] for e in edge_indexes],
+                    required_degree(compiled, node_index)
+                )
+            elif kind == NODE_KIND_MULTIPASS:
+                formula.exactly(
+                    [self.edge_variables[e] for e in edge_indexes],
+                    required_degree(compiled, node_index)
+                )
+                for shape in compiled.shapes:
+                    formula.even([
+                        self.shape_edge_variables[e][shape] for e in edge_indexes
+                        if shape in self.shape_edge_variables[e]
+                    ])
+
+    def edge_shapes(self, edge_index):
+        """
+        The shapes that could draw along the edge.
+
+        :type edge_index: int
+        :rtype: list[int]
+        """
+        compiled = self.compiled
+        shapes = set(compiled.shapes)
+        for node_index in (compiled.edge_ones[edge_index], compiled.edge_twos[edge_index]):
+            kind = compiled.node_kinds[node_index]
+            if kind == NODE_KIND_SHAPE:
+                shapes &= {compiled.node_shapes[node_index]}
+            elif kind != NODE_KIND_MULTIPASS:
+                return []
+        return sorted(shapes)
+
+    def node_edges(self, node_index):
+        """
+        The edges of the node that have variables.
+
+        :type node_index: int
+        :rtype: list[int]
+        """
+        compiled = self.compiled
+        return [
+            compiled.neighbor_edges[k]
+            for k in range(
+                compiled.neighbor_offsets[node_index], compiled.neighbor_offsets[node_index + 1]
+            )
+            if self.edge_variables[compiled.neighbor_edges[k]] is not None
+        ]
+
+    def shape_edges(self, model, shape):
+        """
+        The edges the model draws in the given shape.
+
+        :type model: list[bool]
+        :type shape: int
+        :rtype: list[int]
+        """
+        return [
+            edge_index for (edge_index, variables) in enumerate(self.shape_edge_variables)
+            if shape in variables and model[variables[shape]]
+        ]
+
+    def detached_cuts(self, model, shape):
+        """
+        Find the parts of the drawing of a shape that are not connected to its terminators and
+        return clauses that forbid each of them from being drawn without a connection to the rest:
+        if an edge within such a part is used, so must be an edge leaving it.
+
+        :type model: list[bool]
+        :type shape: int
+        :rtype: list[list[int]]
+        """
+        compiled = self.compiled
+        edges = self.shape_edges(model, shape)
+        adjacency = {}
+        for edge_index in edges:
+            (one, two) = (compiled.edge_ones[edge_index], compiled.edge_twos[edge_index])
+            adjacency.setdefault(one, []).append(two)
+            adjacency.setdefault(two, []).append(one)
+
+        components = {}
+        for start in adjacency:
+            if start in components:
+                continue
+            components[start] = start
+            pending = [start]
+            while pending:
+                node_index = pending.pop()
+                for other_index in adjacency[node_index]:
+                    if other_index not in components:
+                        components[other_index] = start
+                        pending.append(other_index)
+
+        terminator_component = components.get(compiled.shape_terminators[shape][0])
+        cuts = []
+        for component in set(components.values()):
+            if component == terminator_component:
+                continue
+            members = {n for (n, c) in components.items() if c == component}
+            leaving = []
+            for node_index in members:
+                for edge_index in self.node_edges(node_index):
+                    if shape not in self.shape_edge_variables[edge_index]:
+                        continue
+                    one = compiled.edge_ones[edge_index]
+                    other_index = compiled.edge_twos[edge_index] if one == node_index else one
+                    if other_index not in members:
+                        leaving.append(self.shape_edge_variables[edge_index][shape])
+            for edge_index in edges:
+                if compiled.edge_ones[edge_index] in members:
+                    cuts.append([-self.shape_edge_variables[edge_index][shape]] + leaving)
+        return cuts
+
+    def decode(self, model):
+        """
+        Walk each shape's edges from its first terminator to the other, returning the paths as
+        lists of node indexes.
+
+        :type model: list[bool]
+        :rtype: dict[int, list[int]]
+        """
+        compiled = self.compiled
+        paths = {}
+        for shape in compiled.shapes:
+            adjacency = {}
+            for edge_index in self.shape_edges(model, shape):
+                (one, two) = (compiled.edge_ones[edge_index], compiled.edge_twos[edge_index])
+                adjacency.setdefault(one, []).append((two, edge_index))
+                adjacency.setdefault(two, []).append((one, edge_index))
+
+            # Hierholzer's algorithm, since the path may pass through multipass nodes repeatedly
+            used_edges = set()
+            stack = [compiled.shape_terminators[shape][0]]
+            path = []
+            while stack:
+                node_index = stack[-1]
+                neighbors = adjacency.get(node_index, [])
+                while neighbors and neighbors[-1][1] in used_edges:
+                    neighbors.pop()
+                if neighbors:
+                    (other_index, edge_index) = neighbors.pop()
+                    used_edges.add(edge_index)
+                    stack.append(other_index)
+                else:
+                    path.append(stack.pop())
+            path.reverse()
+            paths[shape] = path
+        return paths
+
+
+def solve_compiled(compiled, backend=None, limits=None):
+    """
+    Solve the puzzle with a SAT solver, returning the path of each shape as a list of node indexes
+    or None if there is no solution. If the limits are exceeded first, GaveUp is returned; the
+    node budget counts the decisions made by the bundled solver, and pycosat can only be stopped
+    between rounds of connectivity cuts.
+
+    :param backend: the name of a SAT solver in BACKENDS (default: pycosat if installed, the
+        bundled CDCL solver otherwise)
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type backend: str|None
+    :type limits: lynedisease.limits.Limits|None
+    :rtype: dict[int, list[int]]|GaveUp|None
+    """
+    if backend is None:
+        backend = default_backend()
+    if backend not in BACKENDS:
+        raise ValueError("unknown SAT backend {0!r}".format(backend))
+
+    propagation = propagate(compiled)
+    if not propagation.feasible:
+        return None
+
+    encoding = Encoding(compiled, propagation)
+    solver = BACKENDS[backend](encoding.formula.variable_count)
+    for clause in encoding.formula.clauses:
+        solver.add_clause(clause)
+
+    def should_stop():
+        return limits is not None and limits.exceeded(getattr(solver, "decisions", 0))
+
+    def gave_up():
+        # the bundled solver stops at the node budget by itself, without asking the limits
+        limits.exceeded(getattr(solver, "decisions", 0))
+        return GaveUp(
+            limits.reason, nodes_expanded=getattr(solver, "decisions", 0), elapsed=limits.elapsed()
+        )
+
+    while True:
+        if should_stop():
+            return gave_up()
+        if limits is None:
+            model = solver.solve()
+        else:
+            model = solver.solve(should_stop, limits.max_nodes)
+        if model is INTERRUPTED:
+            return gave_up()
+        if model is None:
+            return None
+
+        cuts = []
+        for shape in compiled.shapes:
+            cuts.extend(encoding.detached_cuts(model, shape))
+        if len(cuts) == 0:
+            return encoding.decode(model)
+        for cut in cuts:
+            solver.add_clause(cut)
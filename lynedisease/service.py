@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import json
+import multiprocessing
+import os
+
+import lynedisease.cache as c
+from lynedisease.limits import GaveUp
+import lynedisease.rectangular_lattice as rl
+import lynedisease.solver as s
+
+__author__ = 'ondra'
+
+DEFAULT_PORT = 7337
+
+
+class ServiceBusy(Exception):
+    """
+    Raised by SolverService.solve() if too many computations are already waiting for the pool.
+    """
+    pass
+
+
+class SolverService:
+    """
+    Solves puzzles in a pool of worker processes without blocking the event loop.
+
+    Concurrent requests for the same puzzle (by canonical fingerprint, so also rotated or mirrored
+    lattices) are coalesced into one computation, and solutions are remembered in a SolutionCache.
+    At most max_pending computations (by default twice the number of workers) are handed to the
+    pool at any time; up to max_queued further computations (by default four times max_pending)
+    wait for one of them to finish, and requests that would need yet another are rejected with
+    ServiceBusy.
+    """
+    def __init__(
+            self, workers=None, max_pending=None, cache=None, timeout=None, max_nodes=None,
+            max_queued=None
+    ):
+        """
+        :param timeout: the time limit for each computation, as in solver.solve()
+        :param max_nodes: the node budget for each computation, as in solver.solve()
+        :type workers: int|None
+        :type max_pending: int|None
+        :type cache: lynedisease.cache.SolutionCache|None
+        :type timeout: float|None
+        :type max_nodes: int|None
+        :type max_queued: int|None
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if max_pending is None:
+            max_pending = 2 * workers
+        if max_queued is None:
+            max_queued = 4 * max_pending
+
+        # forked workers would inherit the sockets of open connections and keep them from closing
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        """:type: ProcessPoolExecutor"""
+        self.slots = asyncio.Semaphore(max_pending)
+        """:type: asyncio.Semaphore"""
+        self.max_queued = max_queued
+        """:type: int"""
+        self.queued = 0
+        """:type: int"""
+        self.cache = cache if cache is not None else c.SolutionCache()
+        """:type: lynedisease.cache.SolutionCache"""
+        self.timeout = timeout
+        """:type: float|None"""
+        self.max_nodes = max_nodes
+        """:type: int|None"""
+        self.in_flight = {}
+        """:type: dict[str, asyncio.Task]"""
+        self.computations = 0
+        """:type: int"""
+        self.coalesced = 0
+        """:type: int"""
+        self.rejected = 0
+        """:type: int"""
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def compute(self, puzzle, fingerprint, compiled, order, shape_labels):
+        """
+        Solve the puzzle in the pool, returning its canonical solution (None if it has none) or
+        GaveUp with canonical partial paths. The computation must have been counted in queued.
+
+        :type puzzle: lynedisease.model.Puzzle
+        :type fingerprint: str
+        :type compiled: lynedisease.model.CompiledPuzzle
+        :type order: list[int]
+        :type shape_labels: dict[int, int]
+        :rtype: dict[int, list[int]]|GaveUp|None
+        """
+        try:
+            await self.slots.acquire()
+        finally:
+            self.queued -= 1
+        try:
+            self.computations += 1
+            solution = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                functools.partial(s.solve, puzzle, timeout=self.timeout, max_nodes=self.max_nodes)
+            )
+        finally:
+            self.slots.release()
+
+        if isinstance(solution, GaveUp):
+            # not cached; it might be solved with more time
+            solution.partial = self.cache.to_canonical(
+                solution.partial, compiled, order, shape_labels
+            )
+            return solution
+        if solution is not None:
+            solution = self.cache.to_canonical(solution, compiled, order, shape_labels)
+        self.cache.store(fingerprint, solution)
+        return solution
+
+    def prepare(self, puzzle):
+        """
+        Compile and canonicalize the puzzle; run in a thread, since this takes a while for large
+        puzzles.
+
+        :type puzzle: lynedisease.model.Puzzle
+        :rtype: (lynedisease.model.CompiledPuzzle, str, list[int], dict[int, int])
+        """
+        compiled = puzzle.compile()
+        s.validate(compiled)
+        (fingerprint, order, shape_labels) = self.cache.canonicalize(compiled)
+        return compiled, fingerprint, order, shape_labels
+
+    async def solve(self, puzzle):
+        """
+        Like solver.solve(), but raises ServiceBusy if the puzzle would have to wait for the pool
+        behind too many others.
+
+        :type puzzle: lynedisease.model.Puzzle
+        :rtype: dict[int, list[int]]|GaveUp|None
+        """
+        loop = asyncio.get_running_loop()
+        (compiled, fingerprint, order, shape_labels) = await loop.run_in_executor(
+            None, self.prepare, puzzle
+        )
+
+        canonical_solution = self.cache.lookup(fingerprint)
+        if canonical_solution is not c.MISSING:
+            self.cache.hits += 1
+        else:
+            task = self.in_flight.get(fingerprint)
+            if task is None:
+                if self.queued >= self.max_queued:
+                    self.rejected += 1
+                    raise ServiceBusy("too many puzzles waiting to be solved")
+                self.cache.misses += 1
+                self.queued += 1
+                task = asyncio.ensure_future(
+                    self.compute(puzzle, fingerprint, compiled, order, shape_labels)
+                )
+                self.in_flight[fingerprint] = task
+                task.add_done_callback(lambda _: self.in_flight.pop(fingerprint, None))
+            else:
+                self.coalesced += 1
+            # one waiter giving up must not cancel the computation for the others
+            canonical_solution = await asyncio.shield(task)
+
+        if canonical_solution is None:
+            return None
+        if isinstance(canonical_solution, GaveUp):
+            partial = self.cache.from_canonical(
+                canonical_solution.partial, compiled, order, shape_labels
+            )
+            return GaveUp(
+                canonical_solution.reason, partial, canonical_solution.nodes_expanded,
+                canonical_solution.elapsed
+            )
+        return self.cache.from_canonical(canonical_solution, compiled, order, shape_labels)
+
+
+_default_service = None
+""":type: SolverService|None"""
+
+
+async def solve_async(puzzle, service=None):
+    """
+    Solve the puzzle without blocking the event loop, in the given SolverService or a default one
+    with a worker process per CPU.
+
+    :type puzzle: lynedisease.model.Puzzle
+    :type service: SolverService|None
+    :rtype: dict[int, list[int]]|GaveUp|None
+    """
+    global _default_service
+    if service is None:
+        if _default_service is None:
+            _default_service = SolverService()
+        service = _default_service
+    return await service.solve(puzzle)
+
+
+async def answer_line(service, line):
+    """
+    Solve a width:height:spec line, returning the response for it: the solution (shapes mapped
+    to paths of lattice positions, or null if there is none), the reason the solver gave up, the
+    reason the service is too busy to take the line or an error message.
+
+    :type service: SolverService
+    :type line: str
+    :rtype: dict
+    """
+    try:
+        (puzzle, node_ids_to_nodes) = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: rl.build_puzzle(*rl.parse_spec(line))
+        )
+        solution = await service.solve(puzzle)
+    except ServiceBusy as exc:
+        return {"busy": str(exc)}
+    except Exception as exc:
+        # anything from a broken pool to a bug in the solver; the connection lives on
+        return {"error": str(exc) or type(exc).__name__}
+
+    if isinstance(solution, GaveUp):
+        return {"gave_up": solution.reason}
+    if solution is not None:
+        solution = {
+            shape: [node_ids_to_nodes[node_id] for node_id in path]
+            for (shape, path) in solution.items()
+        }
+    return {"solution": solution}
+
+
+async def handle_connection(service, reader, writer):
+    """
+    Answer the width:height:spec lines sent over a connection, one JSON object per line, in
+    order. Since the next line is only read once the previous one has been answered, a client
+    that sends faster than the pool can solve is slowed down by the socket buffers.
+
+    :type service: SolverService
+    :type reader: asyncio.StreamReader
+    :type writer: asyncio.StreamWriter
+    """
+    try:
+        while True:
+            line = await reader.readline()
+            if len(line) == 0:
+                break
+            line = line.decode("utf-8").strip()
+            if len(line) == 0:
+                continue
+            response = await answer_line(service, line)
+            writer.write((json.dumps(response) + "\n").encode("utf-8"))
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(service, host="127.0.0.1", port=DEFAULT_PORT):
+    """
+    Serve width:height:spec lines over TCP until cancelled.
+
+    :type service: SolverService
+    :type host: str
+    :type port: int
+    """
+    server = await asyncio.start_server(
+        functools.partial(handle_connection, service), host, port
+    )
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Solve width:height:spec lines sent over TCP, answering with JSON lines."
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1",
+        help="address to listen on (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT,
+        help="port to listen on (default: {0})".format(DEFAULT_PORT)
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="number of worker processes (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--max-pending", type=int, default=None,
+        help="number of puzzles handed to the workers at a time (default: twice the workers)"
+    )
+    parser.add_argument(
+        "--max-queued", type=int, default=None,
+        help="number of puzzles waiting for the workers before further ones are refused as busy "
+             "(default: four times --max-pending)"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=None,
+        help="give up on a puzzle after this many seconds"
+    )
+    parser.add_argument(
+        "--cache", metavar="PATH",
+        help="keep the solutions in an SQLite database at PATH"
+    )
+    args = parser.parse_args()
+
+    async def main():
+        with c.SolutionCache(path=args.cache) as cache, SolverService(
+                workers=args.workers, max_pending=args.max_pending, cache=cache,
+                timeout=args.timeout, max_queued=args.max_queued
+        ) as service:
+            await serve(service, args.host, args.port)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
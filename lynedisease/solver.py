@@ -1,215 +1,1607 @@
-from lynedisease.model import Edge, MultipassNode, ShapeNode
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import multiprocessing
+import os
+import queue
+
+from lynedisease.model import NODE_KIND_MULTIPASS, NODE_KIND_SHAPE
+from lynedisease.propagation import propagate
+from lynedisease.limits import GAVE_UP_MAX_NODES, GaveUp, Limits
+import lynedisease.sat as sat
+from lynedisease.stats import PRUNE_EDGE_BOUND, PRUNE_FORCED_EDGE, PRUNE_INFEASIBLE_NODE, \
+    PRUNE_MULTIPASS_FULL, PRUNE_MULTIPASS_MISMATCH, PRUNE_PREMATURE_TERMINATION, \
+    PRUNE_SHAPE_CONFLICT, PRUNE_TRANSPOSITION, PRUNE_DISCONNECTED
+from lynedisease.transposition import DEFAULT_MAX_ENTRIES, SharedTranspositionTable, \
+    TranspositionTable
 
 __author__ = 'ondra'
 
+STOP_CHECK_INTERVAL = 1024
+"""How many search steps to take between checks whether the search should stop."""
 
-def copy_add_node_to_shape_path(shapes_to_paths, shape, node_id):
-    ret = {}
-    for (k, vs) in shapes_to_paths.items():
-        ret[k] = vs.copy()
-        if k == shape:
-            ret[k].append(node_id)
-    return ret
+LIMITS_POLL_INTERVAL = 0.05
+"""
+How many seconds solve_parallel() waits for its workers between checks of its limits and of the
+subproblems its workers have given away.
+"""
 
 
-def remove_edge_and_conflicting_edges(puzzle, available_edges, new_edge):
-    ret = set()
-    for edge in available_edges:
-        if edge == new_edge:
-            continue
-        conflict = False
-        for pair in puzzle.conflict_edge_pairs:
-            if new_edge in pair and edge in pair:
-                conflict = True
-                break
-        if conflict:
+def usable_degree(compiled, node_index, available_edges=None):
+    """
+    Count the edges of a node that a path through it could use: those leading to multipass nodes
+    or, for a shape node, to nodes of its own shape.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type node_index: int
+    :type available_edges: int|None
+    :rtype: int
+    """
+    offsets = compiled.neighbor_offsets
+    shape = compiled.node_shapes[node_index]
+    degree = 0
+    for k in range(offsets[node_index], offsets[node_index + 1]):
+        if available_edges is not None and not available_edges >> compiled.neighbor_edges[k] & 1:
             continue
+        other_index = compiled.neighbor_nodes[k]
+        other_kind = compiled.node_kinds[other_index]
+        if other_kind == NODE_KIND_MULTIPASS:
+            degree += 1
+        elif other_kind == NODE_KIND_SHAPE and (
+                shape is None or compiled.node_shapes[other_index] == shape
+        ):
+            degree += 1
+    return degree
 
-        ret.add(edge)
 
-    return ret
+def shapes_ascending(compiled):
+    """
+    Draw the shapes in ascending order.
 
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :rtype: list[int]
+    """
+    return list(compiled.shapes)
 
-def remove_edges_containing_node(available_edges, node_id):
-    ret = set()
-    for edge in available_edges:
-        if node_id in edge:
-            continue
-        ret.add(edge)
-    return ret
 
+def shapes_most_constrained(compiled):
+    """
+    Draw the shapes with the fewest usable edges per node first.
 
-def solve_step(
-        puzzle, shapes_to_do, shapes_to_paths, shape_terminators, available_edges, multipass_counts
-):
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :rtype: list[int]
     """
-    :type puzzle: lynedisease.model.Puzzle
-    :type shapes_to_do: list[int]
-    :type shapes_to_paths: dict[int, list[int]]
-    :type shape_terminators: dict[int, set[int]]
-    :type available_edges: set[Edge]
-    :type multipass_counts: dict[int, int]
-    return dict[int, list[int]]|None
-    """
-
-    #print(
-    #    "solve_step",
-    #    "  shapes_to_do={0}".format(shapes_to_do),
-    #    "  shape_terminators={0}".format(shape_terminators),
-    #    "  shapes_to_paths={0}".format(shapes_to_paths),
-    #    "  available_edges={0}".format(available_edges),
-    #    "  multipass_counts={0}".format(multipass_counts),
-    #    sep="\n"
-    #)
-
-    if len(shapes_to_do) == 0:
-        # check the multipass counts
-        for (node_id, node) in puzzle.node_ids_to_nodes.items():
-            if isinstance(node, MultipassNode):
-                if multipass_counts[node_id] != node.count:
-                    # humbug!
-                    return None
-
-        # well, we're done here
-        return shapes_to_paths
-
-    shape = shapes_to_do[0]
-
-    if len(shapes_to_paths[shape]) == 0:
-        # start at a terminator
-        terminator = next(iter(shape_terminators[shape]))
-        shapes_to_paths[shape] = [terminator]
-
-    # go to the last node
-    node_id = shapes_to_paths[shape][-1]
-    node = puzzle.node_ids_to_nodes[node_id]
-
-    # if it's a shape node, make sure it's never visited again
-    if isinstance(node, ShapeNode):
-        filtered_available_edges = remove_edges_containing_node(available_edges, node_id)
-    else:
-        filtered_available_edges = available_edges.copy()
-
-    # let's see where we can go
-    for edge in available_edges:
-        sub_available_edges = filtered_available_edges
-
-        if node_id not in edge:
-            continue
+    shape_degrees = {shape: 0 for shape in compiled.shapes}
+    for (node_index, shape) in enumerate(compiled.node_shapes):
+        if shape is not None:
+            shape_degrees[shape] += usable_degree(compiled, node_index)
+    return sorted(
+        compiled.shapes,
+        key=lambda shape: shape_degrees[shape] / compiled.shape_node_counts[shape]
+    )
+
+
+def first_terminator(compiled, shape):
+    """
+    Start each shape at its first terminator.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type shape: int
+    :rtype: int
+    """
+    return compiled.shape_terminators[shape][0]
+
+
+def least_connected_terminator(compiled, shape):
+    """
+    Start each shape at the terminator with fewer usable edges.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type shape: int
+    :rtype: int
+    """
+    return min(
+        compiled.shape_terminators[shape],
+        key=lambda node_index: usable_degree(compiled, node_index)
+    )
+
+
+def moves_unordered(state, moves):
+    """
+    Try the moves in the order in which the neighbors are stored.
+
+    :type state: SearchState
+    :type moves: list[(int, int, bool, int)]
+    :rtype: list[(int, int, bool, int)]
+    """
+    return moves
+
+
+def moves_fewest_exits(state, moves):
+    """
+    Try the moves to the nodes with the fewest remaining edges first (Warnsdorff's rule).
+
+    :type state: SearchState
+    :type moves: list[(int, int, bool, int)]
+    :rtype: list[(int, int, bool, int)]
+    """
+    node_edge_mask = state.compiled.node_edge_masks.lookup
+    moves.sort(key=lambda move: (move[1] & node_edge_mask(move[0])).bit_count())
+    return moves
+
+
+class Ordering:
+    """
+    The strategies that decide in which order the search tries its options: the order in which
+    the shapes are drawn, the terminator from which each shape is drawn, and the order in which
+    the moves from a node are tried.
+
+    If bidirectional is set, the path of each shape is instead grown from both of its terminators
+    at once: every step extends whichever end has fewer moves, and the shape is complete once the
+    two ends meet. The terminator chosen for a shape then only decides which end is preferred when
+    both have as many moves.
+    """
+    def __init__(
+            self, order_shapes=shapes_ascending, choose_terminator=first_terminator,
+            order_moves=moves_unordered, bidirectional=False
+    ):
+        """
+        :type order_shapes: (lynedisease.model.CompiledPuzzle) -> list[int]
+        :type choose_terminator: (lynedisease.model.CompiledPuzzle, int) -> int
+        :type order_moves: (SearchState, list[(int, int, bool, int)]) ->
+            list[(int, int, bool, int)]
+        :type bidirectional: bool
+        """
+        self.order_shapes = order_shapes
+        self.choose_terminator = choose_terminator
+        self.order_moves = order_moves
+        self.bidirectional = bidirectional
+
+
+ORDERINGS = {
+    "plain": Ordering(),
+    "constrained": Ordering(shapes_most_constrained, least_connected_terminator),
+    "warnsdorff": Ordering(order_moves=moves_fewest_exits),
+    "constrained-warnsdorff": Ordering(
+        shapes_most_constrained, least_connected_terminator, moves_fewest_exits
+    ),
+    "bidirectional": Ordering(bidirectional=True),
+    "constrained-warnsdorff-bidirectional": Ordering(
+        shapes_most_constrained, least_connected_terminator, moves_fewest_exits, True
+    ),
+}
+""":type: dict[str, Ordering]"""
+
+DEFAULT_ORDERING = "constrained-warnsdorff"
+
+
+def get_ordering(ordering):
+    """
+    :type ordering: Ordering|str|None
+    :rtype: Ordering
+    """
+    if ordering is None:
+        ordering = DEFAULT_ORDERING
+    if isinstance(ordering, str):
+        return ORDERINGS[ordering]
+    return ordering
+
+
+class SearchState:
+    """
+    Mutable state of the search; every move is undone on the way back out.
+    """
+    def __init__(self, compiled, shapes=None, start_terminators=None, bidirectional=False):
+        """
+        :param shapes: the order in which the shapes are drawn (default: ascending)
+        :param start_terminators: the terminator at which each shape is started, in the same order
+            (default: the first terminator of each shape)
+        :param bidirectional: whether the path of each shape is grown from both of its terminators
+        :type compiled: lynedisease.model.CompiledPuzzle
+        :type shapes: collections.Iterable[int]|None
+        :type start_terminators: collections.Iterable[int]|None
+        :type bidirectional: bool
+        """
+        self.compiled = compiled
+        """:type: lynedisease.model.CompiledPuzzle"""
+        self.shapes = tuple(shapes) if shapes is not None else compiled.shapes
+        """:type: tuple[int]"""
+        if start_terminators is None:
+            start_terminators = (compiled.shape_terminators[shape][0] for shape in self.shapes)
+        self.start_terminators = tuple(start_terminators)
+        """:type: tuple[int]"""
+        self.shape_index = 0
+        """:type: int"""
+        self.available_edges = compiled.all_edges_mask
+        """:type: int"""
+        self.visit_counts = [0 for _ in compiled.node_ids]
+        """:type: list[int]"""
+        self.path = []
+        """:type: list[int]"""
+        self.shape_path_starts = []
+        """:type: list[int]"""
+        self.shape_remaining_nodes = dict(compiled.shape_node_counts)
+        """:type: dict[int, int]"""
+        self.remaining_shape_nodes = sum(compiled.shape_node_counts.values())
+        """:type: int"""
+        self.remaining_multipasses = sum(compiled.node_multipass_counts)
+        """:type: int"""
+        self.visit_hash = 0
+        """:type: int"""
+        self.unvisited_shape_nodes = sum(compiled.shape_node_masks.values())
+        """:type: int"""
+        self.open_multipass_nodes = compiled.multipass_node_mask
+        """:type: int"""
+        self.bidirectional = bidirectional
+        """:type: bool"""
+        # when growing from both terminators, which end each node of the path was added to (0 for
+        # the starting terminator's) and the last node at either end of the shape being drawn
+        self.path_ends = [] if bidirectional else None
+        """:type: list[int]|None"""
+        self.heads = None
+        """:type: tuple[int]|None"""
+
+    @classmethod
+    def from_snapshot(cls, compiled, snapshot):
+        """
+        Recreate a state from the output of snapshot().
+
+        :type compiled: lynedisease.model.CompiledPuzzle
+        :type snapshot: (int, tuple[int], tuple[int], int, tuple[int], tuple[int], tuple[int]|None)
+        :rtype: SearchState
+        """
+        (
+            shape_index, path, shape_path_starts, available_edges, shapes, start_terminators,
+            path_ends
+        ) = snapshot
+        state = cls(compiled, shapes, start_terminators, path_ends is not None)
+        for node_index in path:
+            state.push_node(node_index)
+        state.shape_index = shape_index
+        state.shape_path_starts = list(shape_path_starts)
+        state.available_edges = available_edges
+        if path_ends is not None:
+            state.path_ends = list(path_ends)
+            if shape_index < len(state.shapes):
+                heads = [None, None]
+                start = shape_path_starts[-1]
+                for (node_index, end) in zip(path[start:], path_ends[start:]):
+                    heads[end] = node_index
+                state.heads = tuple(heads)
+        return state
+
+    def snapshot(self):
+        """
+        Compact, picklable copy of this state; the counters are derived from the path.
+
+        :rtype: (int, tuple[int], tuple[int], int, tuple[int], tuple[int], tuple[int]|None)
+        """
+        path_ends = tuple(self.path_ends) if self.path_ends is not None else None
+        return self.shape_index, tuple(self.path), tuple(self.shape_path_starts), \
+            self.available_edges, self.shapes, self.start_terminators, path_ends
+
+    def push_node(self, node_index):
+        """
+        Append a node to the current path, updating the visit counters.
+
+        :type node_index: int
+        """
+        kind = self.compiled.node_kinds[node_index]
+        visits = self.visit_counts[node_index]
+        if kind == NODE_KIND_SHAPE:
+            self.shape_remaining_nodes[self.compiled.node_shapes[node_index]] -= 1
+            self.remaining_shape_nodes -= 1
+            self.unvisited_shape_nodes &= ~(1 << node_index)
+        elif kind == NODE_KIND_MULTIPASS:
+            self.remaining_multipasses -= 1
+            if visits + 1 >= self.compiled.node_multipass_counts[node_index]:
+                self.open_multipass_nodes &= ~(1 << node_index)
+        keys = self.compiled.zobrist_keys[node_index]
+        self.visit_hash ^= keys[visits] ^ keys[visits + 1]
+        self.visit_counts[node_index] = visits + 1
+        self.path.append(node_index)
+
+    def pop_node(self):
+        """
+        Remove the last node from the current path, reverting push_node.
+        """
+        node_index = self.path.pop()
+        kind = self.compiled.node_kinds[node_index]
+        visits = self.visit_counts[node_index]
+        if kind == NODE_KIND_SHAPE:
+            self.shape_remaining_nodes[self.compiled.node_shapes[node_index]] += 1
+            self.remaining_shape_nodes += 1
+            if visits == 1:
+                self.unvisited_shape_nodes |= 1 << node_index
+        elif kind == NODE_KIND_MULTIPASS:
+            self.remaining_multipasses += 1
+            if visits <= self.compiled.node_multipass_counts[node_index]:
+                self.open_multipass_nodes |= 1 << node_index
+        keys = self.compiled.zobrist_keys[node_index]
+        self.visit_hash ^= keys[visits] ^ keys[visits - 1]
+        self.visit_counts[node_index] = visits - 1
+
+    def extend_end(self, end, node_index):
+        """
+        Append a node to one end of the path of the shape being drawn from both terminators.
+
+        :param end: 0 for the end that started at the starting terminator, 1 for the other one
+        :type end: int
+        :type node_index: int
+        """
+        self.push_node(node_index)
+        self.path_ends.append(end)
+        if end == 0:
+            self.heads = (node_index, self.heads[1])
+        else:
+            self.heads = (self.heads[0], node_index)
+
+    def transposition_key(self):
+        """
+        A hash of everything that decides whether the search can still succeed from this state:
+        the remaining edges, how often each node has been visited (Zobrist-hashed incrementally
+        by push_node and pop_node), the end (or both ends) of the path and the shape being drawn.
+
+        :rtype: int
+        """
+        head = self.heads if self.bidirectional else self.path[-1]
+        return hash((self.available_edges, self.visit_hash, head, self.shape_index))
+
+    def required_edges(self):
+        """
+        Lower bound on the number of edges still needed to finish all shapes. Every edge enters
+        exactly one node, so count the entries still to be made: each unvisited node of the shape
+        being drawn, all but the starting terminator of every later shape, and each outstanding
+        pass through a multipass node. A shape drawn from both ends has both terminators visited
+        from the start, but needs one more edge to join its ends.
 
-        other_id = edge.other_node(node_id)
-        other = puzzle.node_ids_to_nodes[other_id]
+        :rtype: int
+        """
+        later_shapes = len(self.compiled.shapes) - self.shape_index - 1
+        required = self.remaining_shape_nodes - later_shapes + self.remaining_multipasses
+        if self.bidirectional:
+            required += 1
+        return required
+
+    def is_node_feasible(self, node_index):
+        """
+        Check whether enough edges remain around a node to satisfy it: an unvisited shape node
+        still has to be entered (and left, unless it is a terminator), and a multipass node needs
+        two edges per outstanding pass plus one to leave for each end of the path currently inside
+        it.
+
+        :type node_index: int
+        :rtype: bool
+        """
+        compiled = self.compiled
+        kind = compiled.node_kinds[node_index]
+        if kind == NODE_KIND_SHAPE:
+            if self.visit_counts[node_index] > 0:
+                return True
+            needed = 1 if compiled.node_terminates[node_index] else 2
+        elif kind == NODE_KIND_MULTIPASS:
+            remaining = compiled.node_multipass_counts[node_index] - self.visit_counts[node_index]
+            needed = 2 * remaining
+            if self.bidirectional:
+                needed += self.heads.count(node_index)
+            elif self.path[-1] == node_index:
+                needed += 1
+        else:
+            return True
+
+        node_edges = self.available_edges & compiled.node_edge_masks.lookup(node_index)
+        return node_edges.bit_count() >= needed
+
+    def are_nodes_feasible(self, removed_edges):
+        """
+        Check the feasibility of the nodes at either end of the given edges, which are the only
+        ones whose situation changed in the last move.
+
+        :type removed_edges: int
+        :rtype: bool
+        """
+        compiled = self.compiled
+        while removed_edges:
+            edge_bit = removed_edges & -removed_edges
+            removed_edges ^= edge_bit
+            edge_index = edge_bit.bit_length() - 1
+            if not self.is_node_feasible(compiled.edge_ones[edge_index]):
+                return False
+            if not self.is_node_feasible(compiled.edge_twos[edge_index]):
+                return False
+        return True
+
+    def is_shape_connected(self, shape, start, goal=None):
+        """
+        Check whether every unvisited node of the shape can still be reached from start, the head
+        of its path, by passing only through unvisited nodes of the shape and multipass nodes with
+        passes left. This ignores which edges are still available, so it only needs one bitwise
+        sweep per step away from start.
+
+        :param goal: another node that has to be reached, such as the head of the other end of a
+            path drawn from both ends
+        :type shape: int
+        :type start: int
+        :type goal: int|None
+        :rtype: bool
+        """
+        compiled = self.compiled
+        neighbor_mask = compiled.node_neighbor_masks.lookup
+        targets = self.unvisited_shape_nodes & compiled.shape_node_masks[shape]
+        if goal is not None:
+            targets |= 1 << goal
+        passable = targets | self.open_multipass_nodes
+
+        reached = 1 << start
+        frontier = reached
+        while targets & reached != targets:
+            if not frontier:
+                return False
+            neighbors = 0
+            while frontier:
+                node_bit = frontier & -frontier
+                frontier ^= node_bit
+                neighbors |= neighbor_mask(node_bit.bit_length() - 1)
+            frontier = neighbors & passable & ~reached
+            reached |= frontier
+        return True
+
+    def are_later_shapes_connected(self):
+        """
+        Check is_shape_connected() for every shape after the one being drawn, from its starting
+        terminator.
+
+        :rtype: bool
+        """
+        for shape_index in range(self.shape_index + 1, len(self.shapes)):
+            if not self.is_shape_connected(
+                    self.shapes[shape_index], self.start_terminators[shape_index]
+            ):
+                return False
+        return True
+
+    def shape_paths(self):
+        """
+        The path of each shape drawn so far as node indexes, from its starting terminator. The path
+        of a shape grown from both ends is put together from the nodes added to either end; until
+        the ends meet, it jumps from the last node of the first end to that of the other end.
+
+        :rtype: list[list[int]]
+        """
+        stops = self.shape_path_starts[1:] + [len(self.path)]
+        paths = []
+        for (start, stop) in zip(self.shape_path_starts, stops):
+            if self.path_ends is None:
+                paths.append(self.path[start:stop])
+                continue
+
+            ends = self.path_ends[start:stop]
+            nodes = self.path[start:stop]
+            forward = [node_index for (node_index, end) in zip(nodes, ends) if end == 0]
+            backward = [node_index for (node_index, end) in zip(nodes, ends) if end == 1]
+            backward.reverse()
+            paths.append(forward + backward)
+        return paths
+
+    def shape_edge_masks(self):
+        """
+        The edges used by the path of each shape so far.
+
+        :rtype: tuple[int]
+        """
+        masks = []
+        for path in self.shape_paths():
+            mask = 0
+            for i in range(1, len(path)):
+                mask |= 1 << self.compiled.find_edge(path[i - 1], path[i])
+            masks.append(mask)
+        return tuple(masks)
+
+    def shapes_to_paths(self, compiled):
+        """
+        :type compiled: lynedisease.model.CompiledPuzzle
+        :rtype: dict[int, list[int]]
+        """
+        ret = {}
+        for (shape, path) in zip(self.shapes, self.shape_paths()):
+            ret[shape] = [compiled.node_ids[i] for i in path]
+        return ret
+
+
+class SearchFrame:
+    """
+    One level of the explicit search stack: the moves available from a node and everything needed
+    to rewind the state to how it was when they were computed.
+    """
+    __slots__ = (
+        'shape_index', 'path_length', 'shape_count', 'available_edges', 'heads', 'moves',
+        'position', 'key', 'solution_count'
+    )
+
+    def __init__(self, state, moves, key=None, solution_count=0):
+        """
+        :param key: the transposition key of the state, if it is to be remembered as dead
+        :param solution_count: the number of solutions found before this frame was created
+        :type state: SearchState
+        :type moves: list[(int, int, bool, int)]
+        :type key: int|None
+        :type solution_count: int
+        """
+        self.shape_index = state.shape_index
+        self.path_length = len(state.path)
+        self.shape_count = len(state.shape_path_starts)
+        self.available_edges = state.available_edges
+        self.heads = state.heads
+        self.moves = moves
+        self.position = 0
+        self.key = key
+        self.solution_count = solution_count
+
+    def rewind(self, state):
+        """
+        Undo every move made since this frame was created.
+
+        :type state: SearchState
+        """
+        while len(state.path) > self.path_length:
+            state.pop_node()
+        del state.shape_path_starts[self.shape_count:]
+        state.shape_index = self.shape_index
+        state.available_edges = self.available_edges
+        if state.bidirectional:
+            del state.path_ends[self.path_length:]
+            state.heads = self.heads
+
+
+class Search:
+    """
+    Depth-first search for solutions, driven by an explicit stack of SearchFrames so that the
+    length of the paths is not limited by Python's recursion limit.
+    """
+    def __init__(
+            self, compiled, state=None, should_stop=None, ordering=None, propagation=None,
+            transpositions=None, stats=None, limits=None
+    ):
+        """
+        :param state: the state to continue from (default: a new state whose shapes and start
+            terminators are chosen by the ordering)
+        :param should_stop: called every STOP_CHECK_INTERVAL steps; the search ends once it returns
+            True
+        :param ordering: an Ordering or the name of one in ORDERINGS (default: DEFAULT_ORDERING)
+        :param propagation: the result of propagate() for this puzzle, if already known
+        :param transpositions: the table in which to remember dead states (default: none)
+        :param stats: statistics to fill in while searching (default: none are collected)
+        :param limits: checked along with should_stop; once one is exceeded, the search ends with
+            its reason in limits.reason and the deepest state reached in deepest
+        :type compiled: lynedisease.model.CompiledPuzzle
+        :type state: SearchState|None
+        :type should_stop: (() -> bool)|None
+        :type ordering: Ordering|str|None
+        :type propagation: lynedisease.propagation.Propagation|None
+        :type transpositions: lynedisease.transposition.TranspositionTable|None
+        :type stats: lynedisease.stats.SearchStats|None
+        :type limits: lynedisease.limits.Limits|None
+        """
+        self.compiled = compiled
+        """:type: lynedisease.model.CompiledPuzzle"""
+        self.ordering = get_ordering(ordering)
+        """:type: Ordering"""
+        self.stats = stats
+        """:type: lynedisease.stats.SearchStats|None"""
+        self.prunes = None
+        """:type: collections.Counter[str]|None"""
+        if stats is not None:
+            stats.start()
+            self.prunes = stats.prunes
+            # shadow the helpers with timed versions
+            self.moves = stats.timed("moves", self.moves)
+            self.make_move = stats.timed("make_move", self.make_move)
+            self.is_solved = stats.timed("is_solved", self.is_solved)
+            if propagation is None:
+                propagation = stats.timed("propagate", propagate)(compiled)
+
+        self.propagation = propagation if propagation is not None else propagate(compiled)
+        """:type: lynedisease.propagation.Propagation"""
+        self.exhausted = not self.propagation.feasible
+        """:type: bool"""
+        self.seeded_moves = 0
+        """:type: int"""
+        if state is None:
+            shapes = self.ordering.order_shapes(compiled)
+            state = SearchState(
+                compiled, shapes,
+                [self.ordering.choose_terminator(compiled, shape) for shape in shapes],
+                self.ordering.bidirectional
+            )
+            state.available_edges &= self.propagation.available_edges
+        self.state = state
+        """:type: SearchState"""
+        self.should_stop = should_stop
+        """:type: (() -> bool)|None"""
+        self.transpositions = transpositions
+        """:type: lynedisease.transposition.TranspositionTable|None"""
+        self.limits = limits
+        """:type: lynedisease.limits.Limits|None"""
+        self.stopped = False
+        """:type: bool"""
+        self.nodes_expanded = 0
+        """:type: int"""
+        self.deepest = None
+        """
+        :type: (int, tuple[int], tuple[int], int, tuple[int], tuple[int], tuple[int]|None)|None
+        """
+        # the stack of solutions(), while it is running
+        self.frames = []
+        """:type: list[SearchFrame]"""
+        # the counters of the transposition table when they were last added to the statistics
+        self.counted_transpositions = (0, 0, 0)
+        """:type: (int, int, int)"""
+        if transpositions is not None:
+            self.counted_transpositions = (
+                transpositions.hits, transpositions.misses, transpositions.evictions
+            )
+
+        if len(self.state.path) == 0:
+            self.start_shape(0)
+            if not self.exhausted:
+                self.seed()
+
+        if stats is not None:
+            stats.dead_edges = self.propagation.dead_edge_count
+            stats.forced_edges = self.propagation.forced_edge_count
+            stats.seeded_moves = self.seeded_moves
+            stats.stop()
+
+    def seed(self):
+        """
+        Make moves for as long as there is only one move to make, so that forced edges extend the
+        paths before the search proper starts.
+        """
+        while not self.is_complete():
+            moves = self.moves()
+            if len(moves) != 1:
+                return
+            self.seeded_moves += 1
+            if not self.make_move(moves[0]):
+                self.exhausted = True
+                return
+
+    def count_transpositions(self):
+        """
+        Add the lookups and evictions in the transposition table since the last call to the
+        statistics.
+        """
+        table = self.transpositions
+        if self.stats is None or table is None:
+            return
+        (hits, misses, evictions) = self.counted_transpositions
+        self.stats.transposition_hits += table.hits - hits
+        self.stats.transposition_misses += table.misses - misses
+        self.stats.transposition_evictions += table.evictions - evictions
+        self.counted_transpositions = (table.hits, table.misses, table.evictions)
+
+    def start_shape(self, shape_index):
+        """
+        Start the path of the given shape at one of its terminators (or both of them, when growing
+        from both ends), if there is such a shape.
+
+        :type shape_index: int
+        """
+        state = self.state
+        if shape_index < len(state.shapes):
+            state.shape_path_starts.append(len(state.path))
+            start_terminator = state.start_terminators[shape_index]
+            state.push_node(start_terminator)
+            if state.bidirectional:
+                (one, two) = self.compiled.shape_terminators[state.shapes[shape_index]]
+                end_terminator = two if one == start_terminator else one
+                state.push_node(end_terminator)
+                state.path_ends.extend((0, 1))
+                state.heads = (start_terminator, end_terminator)
+
+    def is_complete(self):
+        """
+        :rtype: bool
+        """
+        return self.state.shape_index == len(self.compiled.shapes)
+
+    def moves(self):
+        """
+        List the moves from the end of the current path as (node index, remaining available edges,
+        whether the move completes the shape, end of the path) tuples. When growing from both
+        ends, these are the moves from the end that has fewer of them.
+
+        :rtype: list[(int, int, bool, int)]
+        """
+        compiled = self.compiled
+        state = self.state
+        if state.bidirectional:
+            moves = self.end_moves(0)
+            if len(moves) > 0:
+                other_moves = self.end_moves(1)
+                if len(other_moves) < len(moves):
+                    moves = other_moves
+            return self.ordering.order_moves(state, moves)
+
+        shape = state.shapes[state.shape_index]
+        forced_edges = self.propagation.forced_edges
+        prunes = self.prunes
+        node_edge_mask = compiled.node_edge_masks.lookup
+        edge_conflict_mask = compiled.edge_conflict_masks.lookup
+
+        # go to the last node
+        node_index = state.path[-1]
+        available_edges = state.available_edges
+
+        # if it's a shape node, make sure it's never visited again
+        if compiled.node_kinds[node_index] == NODE_KIND_SHAPE:
+            filtered_available_edges = available_edges & ~node_edge_mask(node_index)
+        else:
+            filtered_available_edges = available_edges
+
+        # let's see where we can go
+        ret = []
+        for neighbor in range(
+                compiled.neighbor_offsets[node_index], compiled.neighbor_offsets[node_index + 1]
+        ):
+            edge_index = compiled.neighbor_edges[neighbor]
+            edge_bit = 1 << edge_index
+            if not available_edges & edge_bit:
+                continue
+
+            other_index = compiled.neighbor_nodes[neighbor]
+            other_kind = compiled.node_kinds[other_index]
+
+            sub_available_edges = \
+                filtered_available_edges & ~edge_bit & ~edge_conflict_mask(edge_index)
+            if forced_edges & available_edges & ~sub_available_edges & ~edge_bit:
+                # this would give up an edge that every solution needs
+                if prunes is not None:
+                    prunes[PRUNE_FORCED_EDGE] += 1
+                continue
+
+            if other_kind == NODE_KIND_SHAPE:
+                if compiled.node_shapes[other_index] != shape:
+                    if prunes is not None:
+                        prunes[PRUNE_SHAPE_CONFLICT] += 1
+                    continue
 
-        if isinstance(other, ShapeNode):
-            if other.shape == shape:
                 # link potential!
-                if other.terminates:
+                if compiled.node_terminates[other_index]:
                     # this would terminate the path
                     # check if we thereby hit all nodes of this shape
-                    all_hit = True
-                    for (third_id, third) in puzzle.node_ids_to_nodes.items():
-                        if isinstance(third, ShapeNode) \
-                                and third.shape == shape \
-                                and third_id != other_id \
-                                and third_id not in shapes_to_paths[shape]:
-                            all_hit = False
-                            break
-
-                    if all_hit:
-                        # shape completed!
-                        sub_shapes_to_do = shapes_to_do[1:]
-
-                        # sub this
-                        sub_shapes_to_paths = copy_add_node_to_shape_path(
-                            shapes_to_paths, shape, other_id
-                        )
-                        sub_available_edges = remove_edge_and_conflicting_edges(
-                            puzzle, sub_available_edges, edge
-                        )
-                        sub_ret = solve_step(
-                            puzzle, sub_shapes_to_do, sub_shapes_to_paths, shape_terminators,
-                            sub_available_edges, multipass_counts
-                        )
-                        if sub_ret is not None:
-                            return sub_ret
-                    # otherwise, do nothing -- premature termination leads us nowhere
+                    if state.shape_remaining_nodes[shape] != 1:
+                        # premature termination leads us nowhere
+                        if prunes is not None:
+                            prunes[PRUNE_PREMATURE_TERMINATION] += 1
+                        continue
+
+                    # shape completed!
+                    sub_available_edges &= ~node_edge_mask(other_index)
+                    if forced_edges & available_edges & ~sub_available_edges & ~edge_bit:
+                        if prunes is not None:
+                            prunes[PRUNE_FORCED_EDGE] += 1
+                        continue
+                    ret.append((other_index, sub_available_edges, True, 0))
                 else:
                     # try this one
-                    sub_shapes_to_paths = copy_add_node_to_shape_path(
-                        shapes_to_paths, shape, other_id
-                    )
-                    sub_available_edges = remove_edge_and_conflicting_edges(
-                        puzzle, sub_available_edges, edge
-                    )
-                    sub_ret = solve_step(
-                        puzzle, shapes_to_do, sub_shapes_to_paths, shape_terminators,
-                        sub_available_edges, multipass_counts
-                    )
-                    if sub_ret is not None:
-                        return sub_ret
-
-        elif isinstance(other, MultipassNode):
-            # increase the counter
-            sub_multipass_counts = multipass_counts.copy()
-            sub_multipass_counts[other_id] += 1
-
-            # go
-            sub_shapes_to_paths = copy_add_node_to_shape_path(
-                shapes_to_paths, shape, other_id
-            )
-            sub_available_edges = remove_edge_and_conflicting_edges(
-                puzzle, sub_available_edges, edge
-            )
-            sub_ret = solve_step(
-                puzzle, shapes_to_do, sub_shapes_to_paths, shape_terminators, sub_available_edges,
-                sub_multipass_counts
+                    ret.append((other_index, sub_available_edges, False, 0))
+
+            elif other_kind == NODE_KIND_MULTIPASS:
+                if state.visit_counts[other_index] >= compiled.node_multipass_counts[other_index]:
+                    # already passed through often enough
+                    if prunes is not None:
+                        prunes[PRUNE_MULTIPASS_FULL] += 1
+                    continue
+
+                # pass through
+                ret.append((other_index, sub_available_edges, False, 0))
+
+        return self.ordering.order_moves(state, ret)
+
+    def end_moves(self, end):
+        """
+        List the moves from one end of a path grown from both ends, in the same format as moves().
+        A move onto the last node of the other end joins the two ends, which completes the shape
+        once all of its nodes have been visited; if that node is a multipass node, passing
+        through it once more is another option.
+
+        :type end: int
+        :rtype: list[(int, int, bool, int)]
+        """
+        compiled = self.compiled
+        state = self.state
+        shape = state.shapes[state.shape_index]
+        forced_edges = self.propagation.forced_edges
+        prunes = self.prunes
+        node_edge_mask = compiled.node_edge_masks.lookup
+        edge_conflict_mask = compiled.edge_conflict_masks.lookup
+
+        node_index = state.heads[end]
+        other_head = state.heads[1 - end]
+        available_edges = state.available_edges
+
+        # if it's a shape node, make sure it's never visited again
+        if compiled.node_kinds[node_index] == NODE_KIND_SHAPE:
+            filtered_available_edges = available_edges & ~node_edge_mask(node_index)
+        else:
+            filtered_available_edges = available_edges
+
+        ret = []
+        for neighbor in range(
+                compiled.neighbor_offsets[node_index], compiled.neighbor_offsets[node_index + 1]
+        ):
+            edge_index = compiled.neighbor_edges[neighbor]
+            edge_bit = 1 << edge_index
+            if not available_edges & edge_bit:
+                continue
+
+            other_index = compiled.neighbor_nodes[neighbor]
+            other_kind = compiled.node_kinds[other_index]
+
+            sub_available_edges = \
+                filtered_available_edges & ~edge_bit & ~edge_conflict_mask(edge_index)
+            if forced_edges & available_edges & ~sub_available_edges & ~edge_bit:
+                # this would give up an edge that every solution needs
+                if prunes is not None:
+                    prunes[PRUNE_FORCED_EDGE] += 1
+                continue
+
+            if other_index == other_head:
+                if state.shape_remaining_nodes[shape] != 0:
+                    # the ends would meet before all nodes of this shape have been visited
+                    if prunes is not None:
+                        prunes[PRUNE_PREMATURE_TERMINATION] += 1
+                else:
+                    # shape completed!
+                    joined_available_edges = sub_available_edges
+                    if other_kind == NODE_KIND_SHAPE:
+                        joined_available_edges &= ~node_edge_mask(other_index)
+                    if forced_edges & available_edges & ~joined_available_edges & ~edge_bit:
+                        if prunes is not None:
+                            prunes[PRUNE_FORCED_EDGE] += 1
+                    else:
+                        ret.append((other_index, joined_available_edges, True, end))
+                if other_kind == NODE_KIND_SHAPE:
+                    continue
+
+            if other_kind == NODE_KIND_SHAPE:
+                if compiled.node_shapes[other_index] != shape:
+                    if prunes is not None:
+                        prunes[PRUNE_SHAPE_CONFLICT] += 1
+                    continue
+
+                # both terminators are already visited, so this one is inside the path
+                ret.append((other_index, sub_available_edges, False, end))
+
+            elif other_kind == NODE_KIND_MULTIPASS:
+                if state.visit_counts[other_index] >= compiled.node_multipass_counts[other_index]:
+                    # already passed through often enough
+                    if prunes is not None:
+                        prunes[PRUNE_MULTIPASS_FULL] += 1
+                    continue
+
+                # pass through
+                ret.append((other_index, sub_available_edges, False, end))
+
+        return ret
+
+    def is_solved(self):
+        """
+        Check the multipass counts once all shapes have been completed.
+
+        :rtype: bool
+        """
+        visit_counts = self.state.visit_counts
+        for node_index in self.compiled.multipass_nodes:
+            if visit_counts[node_index] != self.compiled.node_multipass_counts[node_index]:
+                # humbug!
+                return False
+        return True
+
+    def make_move(self, move):
+        """
+        Make one of the moves returned by moves(). Returns False if the resulting state is known
+        to be a dead end; the move has to be undone by rewinding in any case.
+
+        :type move: (int, int, bool, int)
+        :rtype: bool
+        """
+        state = self.state
+        (other_index, sub_available_edges, completes_shape, end) = move
+        available_edges = state.available_edges
+        open_multipass_nodes = state.open_multipass_nodes
+
+        if not state.bidirectional:
+            state.push_node(other_index)
+        elif not completes_shape:
+            state.extend_end(end, other_index)
+        else:
+            # the ends meet at a node that has already been visited; nobody is left inside it
+            state.heads = ()
+        state.available_edges = sub_available_edges
+        if completes_shape:
+            state.shape_index += 1
+            self.start_shape(state.shape_index)
+
+        if not state.are_nodes_feasible(available_edges & ~sub_available_edges):
+            if self.prunes is not None:
+                self.prunes[PRUNE_INFEASIBLE_NODE] += 1
+            return False
+
+        if self.is_complete():
+            if self.is_solved():
+                return True
+            if self.prunes is not None:
+                self.prunes[PRUNE_MULTIPASS_MISMATCH] += 1
+            return False
+
+        # are there enough edges left to make all the remaining visits?
+        if sub_available_edges.bit_count() < state.required_edges():
+            if self.prunes is not None:
+                self.prunes[PRUNE_EDGE_BOUND] += 1
+            return False
+
+        # can the path still reach all the nodes of its shape?
+        shape = state.shapes[state.shape_index]
+        if state.bidirectional:
+            connected = state.is_shape_connected(shape, state.heads[0], state.heads[1])
+        else:
+            connected = state.is_shape_connected(shape, state.path[-1])
+        if connected:
+            # the later shapes only lose nodes to pass through when a multipass node fills up
+            if not completes_shape and open_multipass_nodes == state.open_multipass_nodes:
+                return True
+            if state.are_later_shapes_connected():
+                return True
+        if self.prunes is not None:
+            self.prunes[PRUNE_DISCONNECTED] += 1
+        return False
+
+    def solutions(self):
+        """
+        Generate the solutions of the puzzle. Whenever this generator yields, the search state
+        holds a complete solution; it is modified again once the generator is resumed.
+
+        :rtype: collections.Iterable[None]
+        """
+        state = self.state
+        stats = self.stats
+
+        if self.exhausted:
+            return
+
+        if self.is_complete():
+            if self.is_solved():
+                if stats is not None:
+                    stats.solutions += 1
+                yield
+            return
+
+        transpositions = self.transpositions
+        limits = self.limits
+        checks_stop = self.should_stop is not None or limits is not None
+        # the node budget is cheap enough to check on every expansion, unlike the clock
+        max_nodes = limits.max_nodes if limits is not None else None
+        solution_count = 0
+        steps = 0
+        # kept in locals while searching and written back whenever control leaves the loop
+        nodes_expanded = self.nodes_expanded + 1
+        deepest_length = -1
+        if stats is not None:
+            stats.start()
+            stats.expanded(len(state.path))
+        if limits is not None:
+            if self.deepest is None:
+                self.deepest = state.snapshot()
+            deepest_length = len(self.deepest[1])
+            if limits.exceeded(nodes_expanded):
+                # cancelled or out of nodes before the search even started
+                self.stopped = True
+                self.nodes_expanded = nodes_expanded
+                if stats is not None:
+                    stats.stop()
+                return
+        frames = self.frames = [SearchFrame(state, self.moves())]
+        while frames:
+            steps += 1
+            if checks_stop and steps % STOP_CHECK_INTERVAL == 0:
+                self.nodes_expanded = nodes_expanded
+                if (self.should_stop is not None and self.should_stop()) or \
+                        (limits is not None and limits.exceeded(nodes_expanded)):
+                    self.stopped = True
+                    frames[0].rewind(state)
+                    break
+
+            frame = frames[-1]
+            frame.rewind(state)
+            if frame.position == len(frame.moves):
+                # exhausted; backtrack
+                frames.pop()
+                if stats is not None:
+                    stats.backtracks[state.shapes[frame.shape_index]] += 1
+                if frame.key is not None and frame.solution_count == solution_count:
+                    # nothing to be found from here
+                    transpositions.add_dead(frame.key)
+                continue
+
+            move = frame.moves[frame.position]
+            frame.position += 1
+
+            if not self.make_move(move):
+                continue
+
+            if self.is_complete():
+                # well, we're done here
+                solution_count += 1
+                if stats is not None:
+                    stats.solutions += 1
+                    stats.stop()
+                    self.count_transpositions()
+                self.nodes_expanded = nodes_expanded
+                yield
+                if stats is not None:
+                    stats.start()
+                continue
+
+            if transpositions is None:
+                key = None
+            else:
+                key = state.transposition_key()
+                if transpositions.is_dead(key):
+                    if self.prunes is not None:
+                        self.prunes[PRUNE_TRANSPOSITION] += 1
+                    continue
+
+            if stats is not None:
+                stats.expanded(len(state.path))
+            nodes_expanded += 1
+            if len(state.path) > deepest_length >= 0:
+                self.deepest = state.snapshot()
+                deepest_length = len(state.path)
+            if max_nodes is not None and nodes_expanded >= max_nodes:
+                limits.exceeded(nodes_expanded)
+                self.stopped = True
+                frames[0].rewind(state)
+                break
+            frames.append(SearchFrame(state, self.moves(), key, solution_count))
+
+        self.nodes_expanded = nodes_expanded
+        if stats is not None:
+            stats.stop()
+            self.count_transpositions()
+
+    def distinct_solutions(self):
+        """
+        Like solutions(), but skips solutions that draw the same lines as one generated before and
+        only differ in the direction in which the path goes around a loop through a multipass
+        node.
+
+        :rtype: collections.Iterable[None]
+        """
+        if len(self.compiled.multipass_nodes) == 0:
+            # without multipass nodes, there are no loops
+            for _ in self.solutions():
+                yield
+            return
+
+        seen = set()
+        for _ in self.solutions():
+            edge_masks = self.state.shape_edge_masks()
+            if edge_masks in seen:
+                continue
+            seen.add(edge_masks)
+            yield
+
+    def donate(self):
+        """
+        Give away the moves not tried yet on the shallowest level of the running search that has
+        any (except the next one, if that is the current level), returning the snapshots of the
+        states they lead to, in the same form as split(). This search goes on without them, so
+        searching the snapshots separately covers the rest of its tree. Only to be called from
+        should_stop.
+
+        :rtype: list[(int, tuple[int], tuple[int], int, tuple[int], tuple[int], tuple[int]|None)]
+        """
+        frames = self.frames
+        for (depth, frame) in enumerate(frames):
+            start = frame.position + (1 if depth == len(frames) - 1 else 0)
+            if start < len(frame.moves):
+                break
+        else:
+            return []
+
+        original = self.state
+        self.state = SearchState.from_snapshot(self.compiled, original.snapshot())
+        snapshots = []
+        try:
+            for move in frame.moves[start:]:
+                frame.rewind(self.state)
+                if self.make_move(move):
+                    snapshots.append(self.state.snapshot())
+        finally:
+            self.state = original
+        del frame.moves[start:]
+
+        # these levels are no longer searched in full here, so they are not known to be dead
+        for frame in frames[:depth + 1]:
+            frame.key = None
+        return snapshots
+
+    def split(self, count, max_depth=32):
+        """
+        Expand the top of the search tree breadth-first until it has been split into at least
+        count independent subproblems, returning their snapshots. Each of them can be searched
+        separately by passing SearchState.from_snapshot() to a new Search. Complete solutions
+        found on the way are returned as subproblems too. The state of this search is left as
+        it was.
+
+        :type count: int
+        :type max_depth: int
+        :rtype: list[(int, tuple[int], tuple[int], int, tuple[int], tuple[int], tuple[int]|None)]
+        """
+        if self.exhausted:
+            return []
+
+        original = self.state.snapshot()
+        frontier = [original]
+        for _ in range(max_depth):
+            if len(frontier) >= count:
+                break
+
+            next_frontier = []
+            expanded = False
+            for snapshot in frontier:
+                self.state = SearchState.from_snapshot(self.compiled, snapshot)
+                if self.is_complete():
+                    next_frontier.append(snapshot)
+                    continue
+
+                expanded = True
+                frame = SearchFrame(self.state, self.moves())
+                for move in frame.moves:
+                    if self.make_move(move):
+                        next_frontier.append(self.state.snapshot())
+                    frame.rewind(self.state)
+
+            frontier = next_frontier
+            if not expanded:
+                break
+
+        self.state = SearchState.from_snapshot(self.compiled, original)
+        return frontier
+
+
+_worker_compiled = None
+""":type: lynedisease.model.CompiledPuzzle|None"""
+_worker_ordering = None
+""":type: Ordering|None"""
+_worker_propagation = None
+""":type: lynedisease.propagation.Propagation|None"""
+_worker_transpositions = None
+""":type: SharedTranspositionTable|None"""
+_worker_stop_event = None
+""":type: multiprocessing.Event|None"""
+_worker_node_counter = None
+""":type: multiprocessing.Value|None"""
+_worker_max_nodes = None
+""":type: int|None"""
+_worker_idle_count = None
+""":type: multiprocessing.Value|None"""
+_worker_donations = None
+""":type: multiprocessing.Queue|None"""
+
+
+def _init_worker(
+        compiled, ordering, propagation, transpositions, stop_event, node_counter=None,
+        max_nodes=None, idle_count=None, donations=None
+):
+    global _worker_compiled, _worker_ordering, _worker_propagation, _worker_transpositions, \
+        _worker_stop_event, _worker_node_counter, _worker_max_nodes, _worker_idle_count, \
+        _worker_donations
+    _worker_compiled = compiled
+    _worker_ordering = ordering
+    _worker_propagation = propagation
+    _worker_transpositions = transpositions
+    _worker_stop_event = stop_event
+    _worker_node_counter = node_counter
+    _worker_max_nodes = max_nodes
+    _worker_idle_count = idle_count
+    _worker_donations = donations
+    if donations is not None:
+        # only given up on once the pool shuts down, when nobody reads them any more
+        donations.cancel_join_thread()
+
+
+def _solve_subproblem(snapshot):
+    """
+    Search a subproblem, returning the snapshot of its first solution (or None), whether the search
+    was stopped before it was done, the deepest state reached if the nodes are being counted, and
+    how many subproblems were given away to idle workers along the way.
+
+    :type snapshot: (int, tuple[int], tuple[int], int, tuple[int], tuple[int], tuple[int]|None)
+    :rtype: ((int, tuple[int], tuple[int], int, tuple[int], tuple[int], tuple[int]|None)|None,
+        bool, tuple|None, int)
+    """
+    if _worker_stop_event.is_set():
+        return None, True, None, 0
+
+    reported_nodes = 0
+    donated = 0
+
+    def report_nodes():
+        """
+        Add the nodes expanded since the last report to the counter shared by all workers,
+        returning the new total.
+        """
+        nonlocal reported_nodes
+        with _worker_node_counter.get_lock():
+            _worker_node_counter.value += search.nodes_expanded - reported_nodes
+            total = _worker_node_counter.value
+        reported_nodes = search.nodes_expanded
+        return total
+
+    def should_stop():
+        nonlocal donated
+        if _worker_idle_count is not None and _worker_idle_count.value > 0:
+            # hand some of the work to the idle workers, through the parent
+            snapshots = search.donate()
+            if len(snapshots) > 0:
+                with _worker_idle_count.get_lock():
+                    _worker_idle_count.value = max(0, _worker_idle_count.value - len(snapshots))
+                for donation in snapshots:
+                    _worker_donations.put(donation)
+                donated += len(snapshots)
+
+        if _worker_node_counter is not None:
+            total = report_nodes()
+            if _worker_max_nodes is not None and total >= _worker_max_nodes:
+                return True
+        return _worker_stop_event.is_set()
+
+    state = SearchState.from_snapshot(_worker_compiled, snapshot)
+    # with the nodes counted, empty limits, just so that the deepest state is tracked
+    search = Search(
+        _worker_compiled, state, should_stop=should_stop, ordering=_worker_ordering,
+        propagation=_worker_propagation, transpositions=_worker_transpositions,
+        limits=Limits() if _worker_node_counter is not None else None
+    )
+    try:
+        for _ in search.solutions():
+            return state.snapshot(), False, search.deepest, donated
+        return None, search.stopped, search.deepest, donated
+    finally:
+        if _worker_node_counter is not None:
+            report_nodes()
+
+
+def make_transposition_table(max_transpositions):
+    """
+    :type max_transpositions: int
+    :rtype: TranspositionTable|None
+    """
+    if max_transpositions <= 0:
+        return None
+    return TranspositionTable(max_transpositions)
+
+
+def solve_parallel(
+        compiled, workers, subproblems_per_worker=4, ordering=None,
+        max_transpositions=DEFAULT_MAX_ENTRIES, stats=None, limits=None
+):
+    """
+    Split the search into subproblems and solve them in a pool of worker processes, returning the
+    state of the first solution found. Since some subproblems take far longer than others, workers
+    that are still busy while others are idle give away the moves they have not tried yet near
+    the top of their search (see Search.donate()), which are queued as further subproblems. The
+    workers share one table of dead states in shared memory (see SharedTranspositionTable). Only the
+    splitting is counted in the stats, not the work done by the workers.
+
+    With limits, the workers add up the nodes they expand in a shared counter and stop once the
+    node budget is spent; the time limit and cancellation token are checked every
+    LIMITS_POLL_INTERVAL seconds. If one of them is exceeded, GaveUp is returned.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    :type workers: int
+    :type subproblems_per_worker: int
+    :type ordering: Ordering|str|None
+    :type max_transpositions: int
+    :type stats: lynedisease.stats.SearchStats|None
+    :type limits: Limits|None
+    :rtype: SearchState|GaveUp|None
+    """
+    ordering = get_ordering(ordering)
+    search = Search(compiled, ordering=ordering, stats=stats)
+    subproblems = search.split(workers * subproblems_per_worker)
+    if len(subproblems) == 0:
+        return None
+
+    deepest = search.state.snapshot()
+    stopped = False
+    # dead states are dead in every subproblem, so the table is shared by all of the workers
+    transpositions = None
+    if max_transpositions > 0:
+        transpositions = SharedTranspositionTable(max_transpositions)
+    stop_event = multiprocessing.Event()
+    idle_count = multiprocessing.Value("i", 0)
+    donations = multiprocessing.Queue()
+    node_counter = None
+    if limits is not None:
+        node_counter = multiprocessing.Value("q", search.nodes_expanded)
+
+    def gave_up():
+        limits.exceeded(node_counter.value)
+        partial = SearchState.from_snapshot(compiled, deepest).shapes_to_paths(compiled)
+        return GaveUp(
+            limits.reason or GAVE_UP_MAX_NODES, partial, node_counter.value, limits.elapsed()
+        )
+
+    if limits is not None and limits.exceeded(node_counter.value):
+        return gave_up()
+
+    with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(
+                compiled, ordering, search.propagation, transpositions, stop_event,
+                node_counter, limits.max_nodes if limits is not None else None, idle_count,
+                donations
             )
-            if sub_ret is not None:
-                return sub_ret
-
-
-def solve(puzzle):
-    """:type puzzle: lynedisease.model.Puzzle"""
-    # calculate edge set
-    available_edges = set()
-    for (node_id, adjacent_ids) in puzzle.node_ids_to_adjacent_node_ids.items():
-        for adjacent_id in adjacent_ids:
-            available_edges.add(Edge(node_id, adjacent_id))
-
-    # find terminators
-    shapes = set()
-    shape_terminators = {}
-    multipass_counts = {}
-    for (node_id, node) in puzzle.node_ids_to_nodes.items():
-        if isinstance(node, ShapeNode):
-            shapes.add(node.shape)
-            if node.terminates:
-                if node.shape not in shape_terminators:
-                    shape_terminators[node.shape] = set()
-                shape_terminators[node.shape].add(node_id)
-        elif isinstance(node, MultipassNode):
-            multipass_counts[node_id] = 0
-
-    # validate that
-    if len(shapes) != len(shape_terminators):
+    ) as executor:
+        futures = [executor.submit(_solve_subproblem, subproblem) for subproblem in subproblems]
+        pending = set(futures)
+        # subproblems announced by the finished ones as given away, and those received so far
+        donated = 0
+        received = 0
+        try:
+            while pending or received < donated:
+                if limits is not None and limits.exceeded(node_counter.value):
+                    return gave_up()
+
+                while True:
+                    try:
+                        # with nothing running, the rest is still on its way through the queue
+                        donation = donations.get(
+                            block=len(pending) == 0, timeout=LIMITS_POLL_INTERVAL
+                        )
+                    except queue.Empty:
+                        break
+                    received += 1
+                    future = executor.submit(_solve_subproblem, donation)
+                    futures.append(future)
+                    pending.add(future)
+                idle_count.value = max(0, workers - len(pending))
+                if len(pending) == 0:
+                    continue
+
+                (done, pending) = wait(
+                    pending, timeout=LIMITS_POLL_INTERVAL, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    (snapshot, subproblem_stopped, subproblem_deepest, subproblem_donated) = \
+                        future.result()
+                    if snapshot is not None:
+                        return SearchState.from_snapshot(compiled, snapshot)
+                    donated += subproblem_donated
+                    stopped = stopped or subproblem_stopped
+                    if subproblem_deepest is not None and \
+                            len(subproblem_deepest[1]) > len(deepest[1]):
+                        deepest = subproblem_deepest
+
+            if stopped:
+                # the workers ran out of nodes
+                return gave_up()
+        finally:
+            # tell the running workers to give up and drop the queued subproblems
+            stop_event.set()
+            for future in futures:
+                future.cancel()
+
+    return None
+
+
+def validate(compiled):
+    """
+    Make sure that every shape has exactly two terminators, raising ValueError otherwise.
+
+    :type compiled: lynedisease.model.CompiledPuzzle
+    """
+    unterminated_shapes = [
+        shape for (shape, terminators) in compiled.shape_terminators.items()
+        if len(terminators) == 0
+    ]
+    if len(unterminated_shapes) > 0:
         raise ValueError(
             "some shapes are without terminators! (shapes: {0}, terminated shapes: {1})".format(
-                sorted(shapes), sorted(shape_terminators.keys())
+                list(compiled.shapes),
+                [shape for shape in compiled.shapes if shape not in unterminated_shapes]
             )
         )
 
     # check for correct termination
-    for (shape, terminators) in shape_terminators.items():
+    for (shape, terminators) in compiled.shape_terminators.items():
         if len(terminators) != 2:
             raise ValueError("shape {0} has {1} terminators".format(shape, len(terminators)))
 
-    # empty paths
-    shapes_to_paths = {}
-    for shape in shapes:
-        shapes_to_paths[shape] = []
+
+def solve(
+        puzzle, workers=None, ordering=None, engine="search",
+        max_transpositions=DEFAULT_MAX_ENTRIES, stats=None, timeout=None, max_nodes=None,
+        cancel=None
+):
+    """
+    Solve the puzzle, returning the path of each shape as a list of node IDs, None if it has no
+    solution, or GaveUp if one of the limits (timeout, max_nodes, cancel) was hit first. The
+    cancellation token is checked before starting and, without workers, the node budget on every
+    expansion; otherwise the limits are only checked every so often, so they may be overshot a
+    little.
+
+    :param workers: if greater than 1, split the search across that many processes
+    :param ordering: an Ordering or the name of one in ORDERINGS (default: DEFAULT_ORDERING)
+    :param engine: "search" for the depth-first search, "sat" to hand the puzzle to a SAT solver
+        (workers, ordering and max_transpositions only apply to the search)
+    :param max_transpositions: how many dead states the search remembers (0 to disable)
+    :param stats: statistics to fill in while solving (only the wall time for the SAT engine)
+    :param timeout: give up after this many seconds
+    :param max_nodes: give up after expanding this many search nodes (for the SAT engine, after
+        making this many decisions)
+    :param cancel: give up once this token has been cancelled
+    :type puzzle: lynedisease.model.Puzzle
+    :type workers: int|None
+    :type ordering: Ordering|str|None
+    :type engine: str
+    :type max_transpositions: int
+    :type stats: lynedisease.stats.SearchStats|None
+    :type timeout: float|None
+    :type max_nodes: int|None
+    :type cancel: lynedisease.limits.CancellationToken|None
+    :rtype: dict[int, list[int]]|GaveUp|None
+    """
+    limits = None
+    if timeout is not None or max_nodes is not None or cancel is not None:
+        limits = Limits(timeout, max_nodes, cancel)
+
+    compiled = puzzle.compile()
+    validate(compiled)
+
+    if engine == "sat":
+        if stats is not None:
+            stats.start()
+        paths = sat.solve_compiled(compiled, limits=limits)
+        if stats is not None:
+            stats.stop()
+        if paths is None or isinstance(paths, GaveUp):
+            return paths
+        return {
+            shape: [compiled.node_ids[node_index] for node_index in path]
+            for (shape, path) in paths.items()
+        }
+    elif engine != "search":
+        raise ValueError("unknown engine {0!r}".format(engine))
 
     # go
-    return solve_step(
-        puzzle, sorted(shapes), shapes_to_paths, shape_terminators, available_edges,
-        multipass_counts
+    if workers is not None and workers > 1:
+        state = solve_parallel(
+            compiled, workers, ordering=ordering, max_transpositions=max_transpositions,
+            stats=stats, limits=limits
+        )
+        if state is None or isinstance(state, GaveUp):
+            return state
+        return state.shapes_to_paths(compiled)
+
+    search = Search(
+        compiled, ordering=ordering,
+        transpositions=make_transposition_table(max_transpositions), stats=stats, limits=limits
+    )
+    for _ in search.solutions():
+        return search.state.shapes_to_paths(compiled)
+    if search.stopped:
+        partial = SearchState.from_snapshot(compiled, search.deepest).shapes_to_paths(compiled)
+        return GaveUp(limits.reason, partial, search.nodes_expanded, limits.elapsed())
+    return None
+
+
+def iter_solutions(puzzle, ordering=None, max_transpositions=DEFAULT_MAX_ENTRIES, stats=None):
+    """
+    Generate all solutions of the puzzle, lazily and in the same format as solve(). Solutions that
+    draw the same lines are only generated once.
+
+    :type puzzle: lynedisease.model.Puzzle
+    :type ordering: Ordering|str|None
+    :type max_transpositions: int
+    :type stats: lynedisease.stats.SearchStats|None
+    :rtype: collections.Iterable[dict[int, list[int]]]
+    """
+    compiled = puzzle.compile()
+    validate(compiled)
+
+    search = Search(
+        compiled, ordering=ordering,
+        transpositions=make_transposition_table(max_transpositions), stats=stats
     )
+    for _ in search.distinct_solutions():
+        yield search.state.shapes_to_paths(compiled)
+
+
+def count_solutions(
+        puzzle, limit=None, ordering=None, max_transpositions=DEFAULT_MAX_ENTRIES, stats=None
+):
+    """
+    Count the solutions of the puzzle as generated by iter_solutions(), stopping once limit
+    solutions have been found. To check whether a puzzle has a unique solution, compare
+    count_solutions(puzzle, limit=2) to 1.
+
+    :type puzzle: lynedisease.model.Puzzle
+    :type limit: int|None
+    :type ordering: Ordering|str|None
+    :type max_transpositions: int
+    :type stats: lynedisease.stats.SearchStats|None
+    :rtype: int
+    """
+    compiled = puzzle.compile()
+    validate(compiled)
+
+    search = Search(
+        compiled, ordering=ordering,
+        transpositions=make_transposition_table(max_transpositions), stats=stats
+    )
+    count = 0
+    for _ in search.distinct_solutions():
+        count += 1
+        if limit is not None and count >= limit:
+            break
+    return count
+
+
+def solve_many(
+        puzzles, workers=None, max_pending=None, return_exceptions=False, timeout=None,
+        max_nodes=None
+):
+    """
+    Solve puzzles in a pool of worker processes, yielding (index, solution) pairs in the order in
+    which the solutions are found; index is the position of the puzzle in the input. The input is
+    consumed lazily, with at most max_pending puzzles (by default twice the number of workers)
+    queued at any time.
+
+    :param return_exceptions: if True, yield the exception raised while solving a puzzle in place
+        of its solution instead of raising it
+    :param timeout: the time limit for each puzzle, as in solve()
+    :param max_nodes: the node budget for each puzzle, as in solve()
+    :type puzzles: collections.Iterable[lynedisease.model.Puzzle]
+    :type workers: int|None
+    :type max_pending: int|None
+    :type return_exceptions: bool
+    :type timeout: float|None
+    :type max_nodes: int|None
+    :rtype: collections.Iterable[(int, dict[int, list[int]]|GaveUp|None|Exception)]
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2 * workers
+
+    indexed_puzzles = enumerate(puzzles)
+    exhausted = False
+    pending = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    (index, puzzle) = next(indexed_puzzles)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(
+                    solve, puzzle, timeout=timeout, max_nodes=max_nodes
+                )] = index
+
+            if len(pending) == 0:
+                break
+
+            (done, _) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    solution = future.result()
+                except Exception as exc:
+                    if not return_exceptions:
+                        raise
+                    solution = exc
+                yield index, solution
@@ -0,0 +1,164 @@
+from collections import Counter
+import time
+
+__author__ = 'ondra'
+
+PRUNE_SHAPE_CONFLICT = "shape conflict"
+"""A move to a node of a different shape."""
+PRUNE_PREMATURE_TERMINATION = "premature termination"
+"""A move to the other terminator while nodes of the shape are still unvisited."""
+PRUNE_MULTIPASS_FULL = "multipass full"
+"""A move to a multipass node that has been passed through often enough."""
+PRUNE_FORCED_EDGE = "forced edge"
+"""A move that would give up an edge every solution needs."""
+PRUNE_INFEASIBLE_NODE = "infeasible node"
+"""A move after which a node has too few edges left for its remaining visits."""
+PRUNE_EDGE_BOUND = "edge bound"
+"""A move after which too few edges are left for all remaining visits."""
+PRUNE_MULTIPASS_MISMATCH = "multipass mismatch"
+"""All shapes have been drawn but some multipass node has not been passed often enough."""
+PRUNE_TRANSPOSITION = "transposition"
+"""A state that is already known to be dead."""
+PRUNE_DISCONNECTED = "disconnected"
+"""A move after which some unvisited node can no longer be reached by the path that has to visit
+it."""
+
+DEFAULT_PROGRESS_INTERVAL = 10000
+
+
+class SearchStats:
+    """
+    Statistics of a search, filled in as it goes if passed to solve() or Search. Collecting them
+    slows the search down somewhat; without them, the search only checks for their absence.
+
+    If progress is given, it is called with this object every progress_interval expanded nodes.
+    """
+    def __init__(self, progress=None, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+        """
+        :type progress: ((SearchStats) -> None)|None
+        :type progress_interval: int
+        """
+        self.progress = progress
+        """:type: ((SearchStats) -> None)|None"""
+        self.progress_interval = progress_interval
+        """:type: int"""
+
+        self.nodes_expanded = 0
+        """:type: int"""
+        self.max_depth = 0
+        """:type: int"""
+        self.solutions = 0
+        """:type: int"""
+        self.backtracks = Counter()
+        """:type: Counter[int]"""
+        self.prunes = Counter()
+        """:type: Counter[str]"""
+        self.helper_times = Counter()
+        """:type: Counter[str]"""
+        self.helper_calls = Counter()
+        """:type: Counter[str]"""
+        self.dead_edges = 0
+        """:type: int"""
+        self.forced_edges = 0
+        """:type: int"""
+        self.seeded_moves = 0
+        """:type: int"""
+        self.transposition_hits = 0
+        """:type: int"""
+        self.transposition_misses = 0
+        """:type: int"""
+        self.transposition_evictions = 0
+        """:type: int"""
+        self.start_time = None
+        """:type: float|None"""
+        self.wall_time = 0.0
+        """:type: float"""
+
+    def start(self):
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        if self.start_time is not None:
+            self.wall_time += time.perf_counter() - self.start_time
+            self.start_time = None
+
+    def elapsed(self):
+        """
+        The wall time so far, including that of a search still running.
+
+        :rtype: float
+        """
+        if self.start_time is None:
+            return self.wall_time
+        return self.wall_time + time.perf_counter() - self.start_time
+
+    def expanded(self, depth):
+        """
+        :type depth: int
+        """
+        self.nodes_expanded += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self.progress is not None and self.nodes_expanded % self.progress_interval == 0:
+            self.progress(self)
+
+    def timed(self, name, function):
+        """
+        Wrap a function so that its calls are counted and timed under the given name.
+
+        :type name: str
+        :type function: callable
+        :rtype: callable
+        """
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.helper_times[name] += time.perf_counter() - start
+                self.helper_calls[name] += 1
+        return timed_function
+
+    def as_dict(self):
+        """
+        :rtype: dict
+        """
+        return {
+            "nodes_expanded": self.nodes_expanded,
+            "max_depth": self.max_depth,
+            "solutions": self.solutions,
+            "backtracks": dict(self.backtracks),
+            "prunes": dict(self.prunes),
+            "helper_times": dict(self.helper_times),
+            "helper_calls": dict(self.helper_calls),
+            "dead_edges": self.dead_edges,
+            "forced_edges": self.forced_edges,
+            "seeded_moves": self.seeded_moves,
+            "transposition_hits": self.transposition_hits,
+            "transposition_misses": self.transposition_misses,
+            "transposition_evictions": self.transposition_evictions,
+            "wall_time": self.elapsed(),
+        }
+
+    def __str__(self):
+        lines = [
+            "wall time: {0:.3f}s".format(self.elapsed()),
+            "nodes expanded: {0}".format(self.nodes_expanded),
+            "maximum depth: {0}".format(self.max_depth),
+            "solutions: {0}".format(self.solutions),
+            "dead edges: {0}, forced edges: {1}, seeded moves: {2}".format(
+                self.dead_edges, self.forced_edges, self.seeded_moves
+            ),
+            "transposition table: {0} hits, {1} misses, {2} evictions".format(
+                self.transposition_hits, self.transposition_misses, self.transposition_evictions
+            ),
+        ]
+        for (shape, count) in sorted(self.backtracks.items()):
+            lines.append("backtracks in shape {0}: {1}".format(shape, count))
+        for (reason, count) in self.prunes.most_common():
+            lines.append("pruned ({0}): {1}".format(reason, count))
+        for (name, seconds) in self.helper_times.most_common():
+            lines.append("{0}: {1:.3f}s in {2} calls".format(
+                name, seconds, self.helper_calls[name]
+            ))
+        return "\n".join(lines)
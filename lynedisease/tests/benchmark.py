@@ -0,0 +1,56 @@
+import io
+import random
+
+import lynedisease.benchmark as b
+import lynedisease.solver as s
+from lynedisease.tests.helpers import lattice_puzzle
+
+from unittest import TestCase
+
+__author__ = 'ondra'
+
+
+class BenchmarkTests(TestCase):
+    def test_read_levels(self):
+        in_file = io.StringIO("# comment\n\n3:4:abBA3Aa22B2a\n  2:2:A_A_  \n")
+        self.assertEqual(["3:4:abBA3Aa22B2a", "2:2:A_A_"], b.read_levels(in_file))
+
+    def test_generated_levels_are_solvable(self):
+        rng = random.Random(1)
+        for _ in range(20):
+            line = b.generate_level(rng, 5, 5, 3)
+            self.assertIsNotNone(line)
+            self.assertIsNotNone(s.solve(lattice_puzzle(line)), line)
+
+        self.assertEqual(b.generate_levels(3, seed=7), b.generate_levels(3, seed=7))
+
+    def test_run_benchmark(self):
+        report = b.run_benchmark(["3:4:abBA3Aa22B2a", "2:2:ABBA"])
+
+        self.assertEqual("search", report["engine"])
+        self.assertEqual(
+            [("3:4:abBA3Aa22B2a", True), ("2:2:ABBA", False)],
+            [(result["level"], result["solved"]) for result in report["results"]]
+        )
+        for result in report["results"]:
+            self.assertGreater(result["peak_memory"], 0)
+        self.assertGreater(report["results"][0]["nodes_expanded"], 0)
+
+    def test_find_regressions(self):
+        def report(seconds, nodes, solved=True):
+            return {"results": [
+                {"level": "1:1:_", "solved": solved, "seconds": seconds, "nodes_expanded": nodes}
+            ]}
+
+        baseline = report(1.0, 1000)
+        self.assertEqual([], b.find_regressions(report(1.2, 1200), baseline))
+        self.assertEqual(1, len(b.find_regressions(report(1.5, 1000), baseline)))
+        self.assertEqual(1, len(b.find_regressions(report(1.0, 1500), baseline)))
+        self.assertEqual(1, len(b.find_regressions(report(1.0, 1000, False), baseline)))
+        self.assertEqual([], b.find_regressions(report(1.5, 1500), baseline, threshold=0.6))
+
+        # too fast to tell
+        self.assertEqual([], b.find_regressions(report(0.002, 0), report(0.001, 0)))
+
+        # a level the run dropped or failed on
+        self.assertEqual(1, len(b.find_regressions({"results": []}, baseline)))
@@ -0,0 +1,151 @@
+import os
+import tempfile
+import time
+
+import lynedisease.cache as c
+import lynedisease.canonical as cn
+import lynedisease.link_shapes as ls
+import lynedisease.model as m
+import lynedisease.rectangular_lattice as rl
+from lynedisease.tests.helpers import lattice_puzzle
+
+from unittest import TestCase
+
+__author__ = 'ondra'
+
+
+def c17_nodes():
+    # 0 = square-on-tip, 1 = square
+    return [
+        m.ShapeNode(0),
+        m.ShapeNode(1),
+        m.ShapeNode(1, terminates=True),
+        m.ShapeNode(0, terminates=True),
+        m.MultipassNode(3),
+        m.ShapeNode(0, terminates=True),
+        m.ShapeNode(0),
+        m.MultipassNode(2),
+        m.MultipassNode(2),
+        m.ShapeNode(1, terminates=True),
+        m.MultipassNode(2),
+        m.ShapeNode(0),
+    ]
+
+
+def c17_puzzle(insertion_order):
+    puzzle = m.Puzzle()
+
+    nodes = c17_nodes()
+    node_ids = [None for _ in nodes]
+    for i in insertion_order:
+        node_ids[i] = puzzle.add_node(nodes[i])
+
+    ls.square_lattice(puzzle, node_ids, 3, 4)
+
+    return puzzle
+
+
+class CacheTests(TestCase):
+    def test_fingerprint_ignores_insertion_order(self):
+        forward = c17_puzzle(range(12))
+        backward = c17_puzzle(reversed(range(12)))
+
+        (forward_fingerprint, _) = cn.canonical_form(forward.compile())
+        (backward_fingerprint, _) = cn.canonical_form(backward.compile())
+
+        self.assertEqual(forward_fingerprint, backward_fingerprint)
+
+    def test_fingerprint_distinguishes_puzzles(self):
+        puzzle = c17_puzzle(range(12))
+        (fingerprint, _) = cn.canonical_form(puzzle.compile())
+
+        other = c17_puzzle(range(12))
+        other.node_ids_to_nodes[4] = m.MultipassNode(2)
+        (other_fingerprint, _) = cn.canonical_form(other.compile())
+
+        self.assertNotEqual(fingerprint, other_fingerprint)
+
+    def test_symmetric_puzzles(self):
+        # sixteen interchangeable nodes: 16! orders, but only a few need to be looked at
+        line = "7:7:" + "1_1_1_1" + "_" * 7 + "1_1_1_1" + "_" * 7 + "1_1_1_1" + "_" * 7 + "1_1_1_1"
+        lines = [line, "5:5:1_1_1_____1_1_1_____1_1_1", "8:8:" + "1" * 64]
+        start = time.perf_counter()
+        for line in lines:
+            (fingerprint, order) = cn.canonical_form(lattice_puzzle(line).compile())
+            self.assertEqual(sorted(order), list(range(len(order))))
+        self.assertLess(time.perf_counter() - start, 2.0)
+
+        # the other way around, the same board
+        (width, height, nodes) = rl.parse_spec("4:4:1A2_a1_aa1B_2b2B")
+        (rotated, _) = rl.build_puzzle(height, width, [
+            nodes[(width - 1 - column) + row * width]
+            for column in range(width) for row in range(height)
+        ])
+        self.assertEqual(
+            cn.canonical_form(lattice_puzzle("4:4:1A2_a1_aa1B_2b2B").compile())[0],
+            cn.canonical_form(rotated.compile())[0]
+        )
+
+    def test_too_many_leaves(self):
+        compiled = lattice_puzzle("5:5:1_1_1_____1_1_1_____1_1_1").compile()
+        (fingerprint, _) = cn.canonical_form(compiled)
+        (fallback, order) = cn.canonical_form(compiled, max_leaves=1)
+
+        # the board as numbered, not mixed up with its canonical form
+        self.assertNotEqual(fingerprint, fallback)
+        self.assertEqual(list(range(compiled.node_count)), order)
+        self.assertEqual(
+            fallback, cn.canonical_form(
+                lattice_puzzle("5:5:1_1_1_____1_1_1_____1_1_1").compile(), max_leaves=1
+            )[0]
+        )
+
+    def test_hit_remaps_node_ids(self):
+        forward = c17_puzzle(range(12))
+        backward = c17_puzzle(reversed(range(12)))
+
+        cache = c.SolutionCache()
+        forward_solution = cache.solve(forward)
+        backward_solution = cache.solve(backward)
+
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertIsNotNone(backward_solution)
+        for (shape, path) in forward_solution.items():
+            self.assertEqual([11 - node_id for node_id in path], backward_solution[shape])
+
+    def test_relabeled_shapes(self):
+        puzzle = c17_puzzle(range(12))
+        relabeled = c17_puzzle(range(12))
+        for node in relabeled.node_ids_to_nodes.values():
+            if isinstance(node, m.ShapeNode):
+                node.shape = 1 - node.shape
+
+        (fingerprint, _) = cn.canonical_form(puzzle.compile())
+        (relabeled_fingerprint, _) = cn.canonical_form(relabeled.compile())
+        self.assertNotEqual(fingerprint, relabeled_fingerprint)
+
+        cache = c.SolutionCache(relabel_shapes=True)
+        solution = cache.solve(puzzle)
+        relabeled_solution = cache.solve(relabeled)
+
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual({0: solution[1], 1: solution[0]}, relabeled_solution)
+
+    def test_eviction(self):
+        cache = c.SolutionCache(max_entries=1)
+        cache.solve(c17_puzzle(range(12)))
+        cache.solve(m.Puzzle())
+        cache.solve(c17_puzzle(range(12)))
+
+        self.assertEqual((0, 3), (cache.hits, cache.misses))
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "solutions.sqlite")
+
+            with c.SolutionCache(path=path) as cache:
+                solution = cache.solve(c17_puzzle(range(12)))
+
+            with c.SolutionCache(path=path) as cache:
+                self.assertEqual(solution, cache.solve(c17_puzzle(range(12))))
+                self.assertEqual((1, 0), (cache.hits, cache.misses))
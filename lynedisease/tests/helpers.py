@@ -0,0 +1,15 @@
+import lynedisease.rectangular_lattice as rl
+
+__author__ = 'ondra'
+
+
+def lattice_puzzle(line):
+    """
+    Build the puzzle of a width:height:spec line.
+
+    :type line: str
+    :rtype: lynedisease.model.Puzzle
+    """
+    (width, height, nodes) = rl.parse_spec(line)
+    (puzzle, _) = rl.build_puzzle(width, height, nodes)
+    return puzzle
@@ -0,0 +1,87 @@
+import io
+import os
+import tempfile
+
+import lynedisease.levelpack as lp
+import lynedisease.rectangular_lattice as rl
+import lynedisease.solver as s
+
+from unittest import TestCase
+
+__author__ = 'ondra'
+
+
+class LevelPackTests(TestCase):
+    def test_round_trip(self):
+        lines = [
+            "3:4:abBA3Aa22B2a",
+            # five shapes need a byte per cell
+            "6:8:C1B2E_Cb321__be22e__b_Ee__B_AD____D2___aaa___a2A",
+            "3:1:A_A",
+        ]
+        specs = [rl.parse_spec(line) for line in lines]
+        (puzzle, node_ids_to_nodes) = rl.build_puzzle(*specs[0])
+        solution = s.solve(puzzle)
+        self.assertEqual(len(lp.pack_level(*specs[0])), lp.LEVEL_HEADER.size + 6)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "levels.lpk")
+            with open(path, "wb") as f:
+                lp.write_level_pack(f, [
+                    lp.puzzle_level(puzzle, node_ids_to_nodes, 3, 4, solution=solution),
+                    specs[1] + (lp.UNSTORED,),
+                    specs[2] + (None,),
+                ])
+
+            with lp.LevelPack(path) as pack:
+                self.assertEqual(3, len(pack))
+                self.assertEqual(lines, [pack.spec(i) for i in range(len(pack))])
+                self.assertIs(lp.UNSTORED, pack.solution(1))
+                self.assertIsNone(pack.solution(2))
+                with self.assertRaises(IndexError):
+                    pack.nodes(3)
+
+                self.assertEqual(
+                    {
+                        shape: [node_ids_to_nodes[p] for p in path]
+                        for (shape, path) in solution.items()
+                    },
+                    pack.solution(0)
+                )
+                (packed_puzzle, packed_node_ids_to_nodes) = pack.puzzle(0)
+                self.assertEqual(
+                    lines[0], rl.format_spec(
+                        3, 4, rl.lattice_nodes(packed_puzzle, packed_node_ids_to_nodes, 3, 4)
+                    )
+                )
+                self.assertEqual(solution, pack.puzzle_solution(0, packed_node_ids_to_nodes))
+
+    def test_not_a_pack(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "levels.lpk")
+            with open(path, "wb") as f:
+                f.write(b"3:4:abBA3Aa22B2a\n")
+            with self.assertRaises(ValueError):
+                lp.LevelPack(path)
+
+            with open(path, "wb") as f:
+                lp.write_level_pack(f, [])
+            with lp.LevelPack(path) as pack:
+                self.assertEqual(0, len(pack))
+
+        with self.assertRaises(ValueError):
+            lp.write_level_pack(io.BytesIO(), [(3, 4, [None], lp.UNSTORED)])
+
+    def test_large_levels(self):
+        # positions beyond 65536 cells take four bytes
+        solution = {0: [0, 70000, 89999], 1: [256, 65536]}
+        packed = lp.pack_solution(300, 300, solution)
+        self.assertEqual(solution, lp.unpack_solution(packed, 0, 300, 300))
+        self.assertEqual(
+            lp.SOLUTION_HEADER.size + 2 * lp.SHAPE_HEADER.size + 5 * 4, len(packed)
+        )
+
+        with self.assertRaises(ValueError):
+            lp.pack_solution(300, 300, {0: [0] * 0x10000})
+        with self.assertRaises(ValueError):
+            lp.pack_level(0x10000, 1, [None] * 0x10000)
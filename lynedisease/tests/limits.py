@@ -0,0 +1,92 @@
+import threading
+
+import lynedisease.limits as l
+import lynedisease.solver as s
+from lynedisease.tests.helpers import lattice_puzzle
+
+from unittest import TestCase
+
+__author__ = 'ondra'
+
+HARD_LEVEL = "8:8:_1______1C2c____D221__ddAC111d_DA32_____1EeEB____3e1____ee2bB___"
+
+
+class LimitsTests(TestCase):
+    def assert_partial(self, puzzle, partial):
+        self.assertGreater(len(partial), 0)
+        for (shape, path) in partial.items():
+            first = puzzle.node_ids_to_nodes[path[0]]
+            self.assertEqual(shape, first.shape)
+            self.assertTrue(first.terminates)
+
+    def test_max_nodes(self):
+        puzzle = lattice_puzzle(HARD_LEVEL)
+        result = s.solve(puzzle, max_nodes=5000)
+
+        self.assertIsInstance(result, l.GaveUp)
+        self.assertFalse(result)
+        self.assertEqual(l.GAVE_UP_MAX_NODES, result.reason)
+        self.assertEqual(5000, result.nodes_expanded)
+        self.assert_partial(puzzle, result.partial)
+
+    def test_small_budget(self):
+        # far below STOP_CHECK_INTERVAL, on boards solved within a few thousand nodes
+        puzzle = lattice_puzzle("3:4:abBA3Aa22B2a")
+        for (engine, max_nodes) in (("search", 1), ("search", 10), ("sat", 1), ("sat", 3)):
+            result = s.solve(puzzle, engine=engine, max_nodes=max_nodes)
+            self.assertIsInstance(result, l.GaveUp)
+            self.assertEqual(l.GAVE_UP_MAX_NODES, result.reason)
+            self.assertEqual(max_nodes, result.nodes_expanded)
+
+        puzzle = lattice_puzzle("7:7:_122___d2dd22cD_1123C_A_dBcb1ACD12_a__12Bc____1c1")
+        result = s.solve(puzzle, max_nodes=500)
+        self.assertEqual(l.GAVE_UP_MAX_NODES, result.reason)
+        self.assertEqual(500, result.nodes_expanded)
+        self.assert_partial(puzzle, result.partial)
+
+    def test_timeout(self):
+        puzzle = lattice_puzzle(HARD_LEVEL)
+        result = s.solve(puzzle, timeout=0.05)
+
+        self.assertIsInstance(result, l.GaveUp)
+        self.assertEqual(l.GAVE_UP_TIMEOUT, result.reason)
+        self.assertGreaterEqual(result.elapsed, 0.05)
+        self.assertLess(result.elapsed, 1.0)
+        self.assert_partial(puzzle, result.partial)
+
+    def test_cancel(self):
+        token = l.CancellationToken()
+        timer = threading.Timer(0.05, token.cancel)
+        timer.start()
+        try:
+            result = s.solve(lattice_puzzle(HARD_LEVEL), cancel=token)
+        finally:
+            timer.cancel()
+
+        self.assertIsInstance(result, l.GaveUp)
+        self.assertEqual(l.GAVE_UP_CANCELLED, result.reason)
+
+        # already cancelled: the search gives up before expanding anything but the start
+        result = s.solve(lattice_puzzle("3:4:abBA3Aa22B2a"), cancel=token)
+        self.assertIsInstance(result, l.GaveUp)
+        self.assertEqual(l.GAVE_UP_CANCELLED, result.reason)
+        self.assertEqual(1, result.nodes_expanded)
+
+        # already cancelled: the SAT engine gives up before it starts
+        result = s.solve(lattice_puzzle(HARD_LEVEL), engine="sat", cancel=token)
+        self.assertIsInstance(result, l.GaveUp)
+        self.assertEqual(l.GAVE_UP_CANCELLED, result.reason)
+
+    def test_within_limits(self):
+        puzzle = lattice_puzzle("3:4:abBA3Aa22B2a")
+        self.assertEqual(s.solve(puzzle), s.solve(puzzle, timeout=60, max_nodes=1000))
+        self.assertIsNone(s.solve(lattice_puzzle("2:2:ABBA"), timeout=60))
+
+    def test_parallel(self):
+        puzzle = lattice_puzzle(HARD_LEVEL)
+        result = s.solve(puzzle, workers=2, max_nodes=5000)
+
+        self.assertIsInstance(result, l.GaveUp)
+        self.assertEqual(l.GAVE_UP_MAX_NODES, result.reason)
+        self.assertGreaterEqual(result.nodes_expanded, 5000)
+        self.assert_partial(puzzle, result.partial)
@@ -0,0 +1,131 @@
+import pickle
+import tracemalloc
+
+import lynedisease.link_shapes as ls
+import lynedisease.model as m
+
+from unittest import TestCase
+
+__author__ = 'ondra'
+
+
+class ModelTests(TestCase):
+    def test_edges(self):
+        self.assertEqual(m.Edge(3, 1), m.Edge(1, 3))
+        self.assertEqual(hash(m.Edge(3, 1)), hash(m.Edge(1, 3)))
+        self.assertEqual((1, 3), (m.Edge(3, 1).one, m.Edge(3, 1).two))
+        self.assertEqual((1, 3), m.unpack_edge(m.pack_edge(3, 1)))
+        self.assertLess(m.Edge(0, 5), m.Edge(1, 2))
+        self.assertLess(m.Edge(1, 2), m.Edge(1, 3))
+        self.assertEqual(m.Edge(1, 3), m.Edge.from_key(m.Edge(1, 3).key))
+        self.assertIn(3, m.Edge(1, 3))
+        self.assertEqual(1, m.Edge(1, 3).other_node(3))
+
+    def test_puzzle(self):
+        puzzle = m.Puzzle()
+        ids = [puzzle.add_node(m.ShapeNode(0, terminates=(i in (0, 3)))) for i in range(4)]
+        for (one, two) in ((0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3)):
+            puzzle.link_nodes(ids[one], ids[two])
+        puzzle.add_edge_conflict(m.Edge(ids[2], ids[1]), m.Edge(ids[0], ids[3]))
+
+        self.assertTrue(puzzle.is_edge_conflict(m.Edge(ids[0], ids[3]), m.Edge(ids[1], ids[2])))
+        self.assertFalse(puzzle.is_edge_conflict(m.Edge(ids[0], ids[1]), m.Edge(ids[2], ids[3])))
+        self.assertEqual(
+            {(m.Edge(ids[0], ids[3]), m.Edge(ids[1], ids[2]))}, puzzle.conflict_edge_pairs
+        )
+        self.assertIn((m.Edge(ids[1], ids[2]), m.Edge(ids[0], ids[3])), puzzle.conflict_edge_pairs)
+
+        # the pairs can still be changed like the set they used to be
+        changed = puzzle.copy()
+        changed.conflict_edge_pairs.add((m.Edge(ids[3], ids[2]), m.Edge(ids[0], ids[1])))
+        self.assertTrue(changed.is_edge_conflict(m.Edge(ids[0], ids[1]), m.Edge(ids[2], ids[3])))
+        changed.conflict_edge_pairs.remove((m.Edge(ids[0], ids[3]), m.Edge(ids[1], ids[2])))
+        self.assertEqual(1, len(changed.conflict_edge_pairs))
+        self.assertEqual(1, len(puzzle.conflict_edge_pairs))
+        changed.conflict_edge_pairs = set(puzzle.conflict_edge_pairs)
+        self.assertEqual(puzzle.conflict_edge_keys, changed.conflict_edge_keys)
+
+        copy = puzzle.copy()
+        copy.unlink_nodes(ids[0], ids[1])
+        self.assertTrue(puzzle.are_nodes_linked(ids[0], ids[1]))
+        self.assertFalse(copy.are_nodes_linked(ids[0], ids[1]))
+        self.assertEqual(puzzle.conflict_edge_keys, copy.conflict_edge_keys)
+        self.assertEqual(4, copy.add_node(m.MultipassNode(1)))
+
+        with self.assertRaises(AttributeError):
+            # no per-instance dictionaries
+            puzzle.node_ids_to_nodes[ids[0]].color = 1
+
+        compiled = pickle.loads(pickle.dumps(puzzle)).compile()
+        diagonal_one = compiled.edges.index(m.Edge(ids[0], ids[3]))
+        diagonal_two = compiled.edges.index(m.Edge(ids[1], ids[2]))
+        self.assertEqual(1 << diagonal_two, compiled.edge_conflict_masks[diagonal_one])
+        self.assertEqual(6, compiled.edge_count)
+
+    def test_topology(self):
+        puzzle = m.Puzzle()
+        ids = [puzzle.add_node(m.ShapeNode(0, terminates=(i in (0, 2)))) for i in range(3)]
+        for (one, two) in ((0, 1), (1, 2), (0, 2)):
+            puzzle.link_nodes(ids[one], ids[two])
+        topology = m.Topology(puzzle)
+
+        other = m.Puzzle()
+        other.add_nodes([m.ShapeNode(1, terminates=(i in (0, 1))) for i in range(3)])
+        other.use_topology(topology)
+        self.assertIs(topology.edge_conflict_masks, other.compile().edge_conflict_masks)
+        self.assertTrue(other.are_nodes_linked(ids[0], ids[2]))
+
+        # changing the links leaves the topology alone
+        other.unlink_nodes(ids[0], ids[2])
+        self.assertIsNone(other.topology)
+        self.assertFalse(other.are_nodes_linked(ids[0], ids[2]))
+        self.assertIn(ids[2], topology.node_ids_to_adjacent_node_ids[ids[0]])
+
+        other.use_topology(topology)
+        other.conflict_edge_pairs.add((m.Edge(ids[0], ids[1]), m.Edge(ids[1], ids[2])))
+        self.assertIsNone(other.topology)
+        self.assertEqual(0, len(topology.conflict_edge_keys))
+
+        with self.assertRaises(ValueError):
+            m.Puzzle().use_topology(topology)
+
+    def test_mask_table(self):
+        masks = m.MaskTable((0, 2, 2, 3), (1, 4, 0))
+        self.assertEqual(3, len(masks))
+        self.assertEqual(0b10010, masks[0])
+        self.assertEqual([0b10010, 0, 0b1], list(masks))
+        with self.assertRaises(IndexError):
+            masks[3]
+        with self.assertRaises(IndexError):
+            masks[-1]
+        with self.assertRaises(AttributeError):
+            # not a dict of the masks built so far
+            masks.get(0)
+
+        copy = pickle.loads(pickle.dumps(masks))
+        self.assertEqual(0, len(copy._built))
+        self.assertEqual(list(masks), list(copy))
+        self.assertEqual(masks[2], copy.lookup(2))
+
+    def test_compile_scaling(self):
+        def compile_peak(side):
+            puzzle = m.Puzzle()
+            node_ids = puzzle.add_nodes([m.MultipassNode(1) for _ in range(side * side)])
+            ls.square_lattice(puzzle, node_ids, side, side)
+            tracemalloc.start()
+            try:
+                compiled = puzzle.compile()
+                return compiled, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        (small, small_peak) = compile_peak(30)
+        (large, large_peak) = compile_peak(60)
+
+        # four times the nodes; with bitmasks of the edges of every node built up front, the memory
+        # grows quadratically and this is already more than seven times as much
+        self.assertLess(large_peak, 5 * small_peak)
+        self.assertEqual(0, len(large.node_edge_masks._built))
+        corner_edges = large.neighbor_edges[large.neighbor_offsets[0]:large.neighbor_offsets[1]]
+        self.assertEqual(sum(1 << e for e in corner_edges), large.node_edge_masks[0])
+        self.assertEqual(1, len(large.node_edge_masks._built))
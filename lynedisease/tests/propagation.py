@@ -0,0 +1,81 @@
+import lynedisease.model as m
+import lynedisease.propagation as p
+import lynedisease.solver as s
+from lynedisease.tests.helpers import lattice_puzzle
+
+from unittest import TestCase
+
+__author__ = 'ondra'
+
+
+class PropagationTests(TestCase):
+    def test_forced_line(self):
+        puzzle = m.Puzzle()
+
+        ni1 = puzzle.add_node(m.ShapeNode(0, terminates=True))
+        ni2 = puzzle.add_node(m.ShapeNode(0))
+        ni3 = puzzle.add_node(m.ShapeNode(0, terminates=True))
+
+        puzzle.link_nodes(ni1, ni2)
+        puzzle.link_nodes(ni2, ni3)
+
+        compiled = puzzle.compile()
+        propagation = p.propagate(compiled)
+
+        self.assertTrue(propagation.feasible)
+        self.assertEqual(0, propagation.dead_edge_count)
+        self.assertEqual(2, propagation.forced_edge_count)
+
+        # the whole path is laid down before the search starts
+        search = s.Search(compiled)
+        self.assertEqual(2, search.seeded_moves)
+        self.assertTrue(search.is_complete())
+
+    def test_dead_edges(self):
+        puzzle = m.Puzzle()
+
+        ni1 = puzzle.add_node(m.ShapeNode(0, terminates=True))
+        ni2 = puzzle.add_node(m.ShapeNode(0, terminates=True))
+        ni3 = puzzle.add_node(m.ShapeNode(1, terminates=True))
+        ni4 = puzzle.add_node(m.ShapeNode(1, terminates=True))
+
+        puzzle.link_nodes(ni1, ni2)
+        puzzle.link_nodes(ni2, ni3)
+        puzzle.link_nodes(ni3, ni4)
+
+        compiled = puzzle.compile()
+        propagation = p.propagate(compiled)
+
+        self.assertTrue(propagation.feasible)
+        self.assertFalse(propagation.available_edges >> compiled.find_edge(1, 2) & 1)
+        self.assertEqual(1, propagation.dead_edge_count)
+        self.assertEqual(2, propagation.forced_edge_count)
+
+    def test_forced_multipass(self):
+        # both edges of the multipass node are forced, which kills the diagonal
+        compiled = lattice_puzzle("2:2:A1_A").compile()
+        propagation = p.propagate(compiled)
+
+        self.assertTrue(propagation.feasible)
+        self.assertEqual(1, propagation.dead_edge_count)
+        self.assertEqual(2, propagation.forced_edge_count)
+
+    def test_crossing_forced_edges(self):
+        # each shape has to use its diagonal, but the diagonals cross
+        puzzle = lattice_puzzle("2:2:ABBA")
+        propagation = p.propagate(puzzle.compile())
+
+        self.assertFalse(propagation.feasible)
+        self.assertIsNone(s.solve(puzzle))
+
+    def test_too_few_edges(self):
+        puzzle = m.Puzzle()
+
+        ni1 = puzzle.add_node(m.ShapeNode(0, terminates=True))
+        ni2 = puzzle.add_node(m.MultipassNode(2))
+        ni3 = puzzle.add_node(m.ShapeNode(0, terminates=True))
+
+        puzzle.link_nodes(ni1, ni2)
+        puzzle.link_nodes(ni2, ni3)
+
+        self.assertFalse(p.propagate(puzzle.compile()).feasible)
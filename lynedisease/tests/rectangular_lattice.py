@@ -0,0 +1,119 @@
+import io
+import json
+
+import lynedisease.link_shapes as ls
+import lynedisease.model as m
+import lynedisease.rectangular_lattice as rl
+import lynedisease.solver as s
+
+from unittest import TestCase, skipIf
+
+__author__ = 'ondra'
+
+
+class RectangularLatticeTests(TestCase):
+    def check_lattice_tables(self, square_lattice_tables):
+        (width, height, nodes) = rl.parse_spec("4:3:Aa_b1BaA_2bB")
+        (puzzle, node_ids_to_nodes) = rl.build_puzzle(width, height, nodes)
+        node_ids = [None for _ in nodes]
+        for (node_id, position) in node_ids_to_nodes.items():
+            node_ids[position] = node_id
+
+        # link every square separately
+        expected = m.Puzzle()
+        for node in nodes:
+            if node is not None:
+                expected.add_node(node)
+        for row in range(height - 1):
+            for column in range(width - 1):
+                ls.square_link(
+                    expected,
+                    node_ids[row * width + column], node_ids[row * width + column + 1],
+                    node_ids[(row + 1) * width + column], node_ids[(row + 1) * width + column + 1]
+                )
+
+        (edge_keys, conflict_keys) = square_lattice_tables(node_ids, width, height)
+        actual = m.Puzzle()
+        actual.add_nodes([node for node in nodes if node is not None])
+        actual.link_edge_keys(edge_keys)
+        actual.add_edge_conflict_keys(conflict_keys)
+
+        self.assertEqual(
+            expected.node_ids_to_adjacent_node_ids, actual.node_ids_to_adjacent_node_ids
+        )
+        self.assertEqual(expected.conflict_edge_keys, actual.conflict_edge_keys)
+        self.assertEqual(
+            expected.node_ids_to_adjacent_node_ids, puzzle.node_ids_to_adjacent_node_ids
+        )
+        self.assertEqual(([], []), square_lattice_tables([0, 1, 2], 3, 1))
+
+    def test_lattice_tables_python(self):
+        self.check_lattice_tables(ls.square_lattice_tables_python)
+
+    @skipIf(ls.numpy is None, "NumPy is not installed")
+    def test_lattice_tables_numpy(self):
+        self.check_lattice_tables(ls.square_lattice_tables_numpy)
+
+    def test_transform_lattice(self):
+        # rotate a 3x2 lattice by 90 degrees clockwise
+        # 0 1 2      3 0
+        # 3 4 5  ->  4 1
+        #            5 2
+        self.assertEqual(
+            (2, 3, [3, 0, 4, 1, 5, 2]),
+            rl.transform_lattice(3, 2, False, True, True)
+        )
+
+    def test_canonical_spec(self):
+        (line, _, _) = rl.canonical_spec(3, 4, "abBA3Aa22B2a")
+
+        for flip_columns in (False, True):
+            for flip_rows in (False, True):
+                for transpose in (False, True):
+                    (width, height, positions) = rl.transform_lattice(
+                        3, 4, flip_columns, flip_rows, transpose
+                    )
+                    spec = "".join("abBA3Aa22B2a"[p] for p in positions)
+                    swapped_spec = spec.translate(str.maketrans("abAB", "baBA"))
+                    self.assertEqual(line, rl.canonical_spec(width, height, spec)[0])
+                    self.assertEqual(line, rl.canonical_spec(width, height, swapped_spec)[0])
+
+    def test_batch_deduplication(self):
+        (width, height, positions) = rl.transform_lattice(3, 4, True, False, True)
+        rotated = "".join("abBA3Aa22B2a"[p] for p in positions)
+        lines = "3:4:abBA3Aa22B2a\nbad\n{0}:{1}:{2}\n".format(width, height, rotated)
+
+        out_file = io.StringIO()
+        rl.solve_batch(io.StringIO(lines), out_file, workers=1)
+        results = {}
+        for line in out_file.getvalue().splitlines():
+            result = json.loads(line)
+            results[result["index"]] = result
+
+        self.assertEqual({0, 1, 2}, set(results.keys()))
+        self.assertIn("error", results[1])
+        self.assertEqual(
+            results[0]["solution"],
+            {
+                shape: [positions[p] for p in path]
+                for (shape, path) in results[2]["solution"].items()
+            }
+        )
+
+    def test_topology_cache(self):
+        topologies = rl.TopologyCache()
+        (puzzle1, _) = rl.build_puzzle(*rl.parse_spec("3:4:abBA3A_22B2a"), topologies=topologies)
+        (puzzle2, _) = rl.build_puzzle(*rl.parse_spec("3:4:Aa2bB2_ABab3"), topologies=topologies)
+        (puzzle3, _) = rl.build_puzzle(*rl.parse_spec("3:4:abBA3Aa22B2_"), topologies=topologies)
+        (uncached, _) = rl.build_puzzle(*rl.parse_spec("3:4:Aa2bB2_ABab3"))
+
+        self.assertIs(puzzle1.topology, puzzle2.topology)
+        self.assertIsNot(puzzle1.topology, puzzle3.topology)
+        self.assertEqual((1, 2), (topologies.hits, topologies.misses))
+        self.assertAlmostEqual(1 / 3, topologies.hit_rate)
+
+        compiled = puzzle2.compile()
+        expected = uncached.compile()
+        self.assertEqual(expected.edge_keys, compiled.edge_keys)
+        self.assertEqual(list(expected.edge_conflict_masks), list(compiled.edge_conflict_masks))
+        self.assertEqual(s.solve(uncached), s.solve(puzzle2))
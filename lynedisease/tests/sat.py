@@ -0,0 +1,133 @@
+import lynedisease.model as m
+import lynedisease.sat as sat
+import lynedisease.solver as s
+from lynedisease.tests.helpers import lattice_puzzle
+
+from unittest import TestCase
+
+__author__ = 'ondra'
+
+
+def pigeonhole(pigeons, holes):
+    # variable (p * holes + h + 1): pigeon p sits in hole h
+    clauses = []
+    for p in range(pigeons):
+        clauses.append([p * holes + h + 1 for h in range(holes)])
+    for h in range(holes):
+        for p in range(pigeons):
+            for q in range(p + 1, pigeons):
+                clauses.append([-(p * holes + h + 1), -(q * holes + h + 1)])
+    return clauses
+
+
+class SatTests(TestCase):
+    def test_cdcl_satisfiable(self):
+        clauses = pigeonhole(4, 4)
+        solver = sat.CDCLSolver(16)
+        for clause in clauses:
+            solver.add_clause(clause)
+
+        model = solver.solve()
+
+        self.assertIsNotNone(model)
+        for clause in clauses:
+            self.assertTrue(any(model[abs(literal)] == (literal > 0) for literal in clause))
+
+    def test_cdcl_unsatisfiable(self):
+        solver = sat.CDCLSolver(20)
+        for clause in pigeonhole(5, 4):
+            solver.add_clause(clause)
+
+        self.assertIsNone(solver.solve())
+
+    def test_cdcl_incremental(self):
+        solver = sat.CDCLSolver(2)
+        solver.add_clause([1, 2])
+        self.assertIsNotNone(solver.solve())
+
+        solver.add_clause([-1])
+        model = solver.solve()
+        self.assertEqual([False, True], model[1:])
+
+        solver.add_clause([-2])
+        self.assertIsNone(solver.solve())
+
+    def test_at_most(self):
+        for count in range(4):
+            formula = sat.Formula()
+            literals = [formula.new_variable() for _ in range(4)]
+            formula.at_most(literals, count)
+            formula.at_least(literals, count + 1)
+
+            solver = sat.CDCLSolver(formula.variable_count)
+            for clause in formula.clauses:
+                solver.add_clause(clause)
+            self.assertIsNone(solver.solve())
+
+    def test_lattice(self):
+        puzzle = lattice_puzzle("3:4:abBA3Aa22B2a")
+
+        solution = s.solve(puzzle, engine="sat")
+
+        self.assertIsNotNone(solution)
+        self.assertEqual({0, 1}, set(solution.keys()))
+        for (node_id, node) in puzzle.node_ids_to_nodes.items():
+            visits = sum(path.count(node_id) for path in solution.values())
+            if isinstance(node, m.MultipassNode):
+                self.assertEqual(node.count, visits)
+            else:
+                self.assertEqual(1, visits)
+                self.assertIn(node_id, solution[node.shape])
+
+    def test_detached_loop(self):
+        puzzle = m.Puzzle()
+
+        nodes = [
+            m.ShapeNode(0, terminates=True),
+            m.ShapeNode(0),
+            m.ShapeNode(0, terminates=True),
+            m.ShapeNode(0),
+            m.ShapeNode(0),
+            m.ShapeNode(0),
+        ]
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        # the degrees work out with a separate triangle, but it is not connected to the line
+        for (a, b) in ((0, 1), (1, 2), (3, 4), (4, 5), (5, 3)):
+            puzzle.link_nodes(node_ids[a], node_ids[b])
+
+        self.assertIsNone(s.solve(puzzle, engine="sat"))
+
+        # with a way in and out, the triangle can be part of the line
+        puzzle.link_nodes(node_ids[1], node_ids[3])
+        puzzle.link_nodes(node_ids[2], node_ids[5])
+
+        self.assertEqual({0: [0, 1, 3, 4, 5, 2]}, s.solve(puzzle, engine="sat"))
+
+    def test_multipass_loop(self):
+        puzzle = m.Puzzle()
+
+        nodes = [
+            m.ShapeNode(0, terminates=True),
+            m.MultipassNode(2),
+            m.ShapeNode(0),
+            m.ShapeNode(0),
+            m.ShapeNode(0, terminates=True),
+        ]
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        for (a, b) in ((0, 1), (1, 2), (2, 3), (3, 1), (1, 4)):
+            puzzle.link_nodes(node_ids[a], node_ids[b])
+
+        solution = s.solve(puzzle, engine="sat")
+
+        self.assertIn(
+            solution[0],
+            ([0, 1, 2, 3, 1, 4], [0, 1, 3, 2, 1, 4])
+        )
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            s.solve(m.Puzzle(), engine="magic")
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import lynedisease.limits as l
+import lynedisease.service as sv
+import lynedisease.solver as s
+from lynedisease.tests.helpers import lattice_puzzle
+
+from unittest import TestCase
+
+__author__ = 'ondra'
+
+
+class ServiceTests(TestCase):
+    def test_coalescing(self):
+        async def solve_all(service):
+            return await asyncio.gather(
+                service.solve(lattice_puzzle("3:4:abBA3Aa22B2a")),
+                # the same board, mirrored
+                service.solve(lattice_puzzle("3:4:BbaA3A22aa2B")),
+                service.solve(lattice_puzzle("2:2:ABBA")),
+            )
+
+        with sv.SolverService(workers=1) as service:
+            (first, mirrored, unsolvable) = asyncio.run(solve_all(service))
+            self.assertEqual(2, service.computations)
+            self.assertEqual(1, service.coalesced)
+            self.assertEqual(0, len(service.in_flight))
+
+            asyncio.run(service.solve(lattice_puzzle("3:4:abBA3Aa22B2a")))
+            self.assertEqual(2, service.computations)
+            self.assertEqual(1, service.cache.hits)
+
+        self.assertEqual(s.solve(lattice_puzzle("3:4:abBA3Aa22B2a")), first)
+        self.assertEqual(2, len(mirrored))
+        self.assertIsNone(unsolvable)
+
+    def test_gave_up(self):
+        line = "8:8:_1______1C2c____D221__ddAC111d_DA32_____1EeEB____3e1____ee2bB___"
+        with sv.SolverService(workers=1, max_nodes=1000) as service:
+            result = asyncio.run(service.solve(lattice_puzzle(line)))
+            self.assertIsInstance(result, l.GaveUp)
+            self.assertGreater(len(result.partial), 0)
+            self.assertEqual(0, len(service.cache.entries))
+
+    def test_busy(self):
+        lines = [
+            "6:8:C1B2E_Cb321__be22e__b_Ee__B_AD____D2___aaa___a2A",
+            "8:7:_C_B_aA_c1__2A1a__c_b122__2cB_aa__c2cc2C____111_______cc",
+            "7:8:b1211___223a21_AB_2A1_____1b_____b_C_____BC3c____cc1____",
+            "8:8:_1______1C2c____D221__ddAC111d_DA32_____1EeEB____3e1____ee2bB___",
+        ]
+
+        async def solve_all(service):
+            return await asyncio.gather(
+                *(sv.answer_line(service, line) for line in lines)
+            )
+
+        # one puzzle in the pool, one waiting for it, the others turned away
+        with sv.SolverService(workers=1, max_pending=1, max_queued=1, max_nodes=2000) as service:
+            responses = asyncio.run(solve_all(service))
+            self.assertEqual(0, service.queued)
+
+        busy = [response for response in responses if "busy" in response]
+        self.assertGreater(len(busy), 0)
+        self.assertEqual(len(busy), service.rejected)
+        self.assertLessEqual(service.computations, 2)
+        self.assertEqual(len(lines), len(busy) + service.computations)
+
+    def test_unexpected_error(self):
+        class BrokenService:
+            async def solve(self, puzzle):
+                raise RuntimeError("the pool is gone")
+
+        response = asyncio.run(sv.answer_line(BrokenService(), "2:2:A_A_"))
+        self.assertEqual({"error": "the pool is gone"}, response)
+
+    def test_server(self):
+        async def request(service, lines):
+            server = await asyncio.start_server(
+                lambda reader, writer: sv.handle_connection(service, reader, writer),
+                "127.0.0.1", 0
+            )
+            async with server:
+                port = server.sockets[0].getsockname()[1]
+                (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+                writer.write("".join(line + "\n" for line in lines).encode("utf-8"))
+                await writer.drain()
+                writer.write_eof()
+                responses = [json.loads(line) for line in (await reader.read()).splitlines()]
+                writer.close()
+                return responses
+
+        with sv.SolverService(workers=1) as service:
+            responses = asyncio.run(request(service, ["2:2:A_A_", "2:2:ABBA", "2:2:A"]))
+
+        self.assertEqual({"solution": {"0": [0, 2]}}, responses[0])
+        self.assertEqual({"solution": None}, responses[1])
+        self.assertIn("error", responses[2])
@@ -1,6 +1,7 @@
 import lynedisease.link_shapes as ls
 import lynedisease.model as m
 import lynedisease.solver as s
+from lynedisease.tests.helpers import lattice_puzzle
 
 from unittest import TestCase
 
@@ -236,6 +237,109 @@ class SolverTests(TestCase):
             ([0, 1, 2, 3, 1, 4], [4, 1, 3, 2, 1, 0])
         )
 
+    def test_long_line(self):
+        puzzle = m.Puzzle()
+
+        nodes = [m.ShapeNode(0, terminates=True)]
+        nodes.extend(m.ShapeNode(0) for _ in range(3000))
+        nodes.append(m.ShapeNode(0, terminates=True))
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        for (a, b) in linear_pairs(len(nodes) - 1):
+            puzzle.link_nodes(node_ids[a], node_ids[b])
+
+        solution = s.solve(puzzle)
+
+        self.assertIsNotNone(solution)
+        self.assertEqual(node_ids, solution[0])
+
+    def test_iter_solutions(self):
+        puzzle = m.Puzzle()
+
+        nodes = [
+            m.ShapeNode(0, terminates=True),
+            m.ShapeNode(0),
+            m.ShapeNode(0),
+            m.ShapeNode(0, terminates=True),
+        ]
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        for (a, b) in ((0, 1), (0, 2), (1, 2), (1, 3), (2, 3)):
+            puzzle.link_nodes(node_ids[a], node_ids[b])
+
+        self.assertEqual(
+            [{0: [0, 1, 2, 3]}, {0: [0, 2, 1, 3]}],
+            list(s.iter_solutions(puzzle))
+        )
+        self.assertEqual(2, s.count_solutions(puzzle))
+        self.assertEqual(1, s.count_solutions(puzzle, limit=1))
+
+    def test_count_solutions_loop(self):
+        puzzle = m.Puzzle()
+
+        nodes = [
+            m.ShapeNode(0, terminates=True),
+            m.MultipassNode(2),
+            m.ShapeNode(0),
+            m.ShapeNode(0),
+            m.ShapeNode(0, terminates=True),
+        ]
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        for (a, b) in ((0, 1), (1, 2), (2, 3), (3, 1), (1, 4)):
+            puzzle.link_nodes(node_ids[a], node_ids[b])
+
+        # going around the loop either way draws the same lines
+        self.assertEqual(1, s.count_solutions(puzzle))
+
+    def test_orderings(self):
+        puzzle = m.Puzzle()
+
+        nodes = [
+            m.ShapeNode(0, terminates=True),
+            m.ShapeNode(0),
+            m.ShapeNode(0),
+            m.ShapeNode(0, terminates=True),
+            m.ShapeNode(1, terminates=True),
+            m.ShapeNode(1),
+            m.ShapeNode(1, terminates=True),
+            m.ShapeNode(1),
+        ]
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        for (a, b) in ((0, 1), (0, 2), (1, 2), (1, 3), (2, 3), (4, 5), (4, 7), (5, 7), (7, 6)):
+            puzzle.link_nodes(node_ids[a], node_ids[b])
+
+        # shape 1 has fewer edges per node; its terminator 6 has fewer edges than 4
+        search = s.Search(puzzle.compile(), ordering="constrained")
+        self.assertEqual((1, 0), search.state.shapes)
+        self.assertEqual((6, 0), search.state.start_terminators)
+
+        search = s.Search(puzzle.compile(), ordering="plain")
+        self.assertEqual((0, 1), search.state.shapes)
+        self.assertEqual((0, 4), search.state.start_terminators)
+
+        for ordering in s.ORDERINGS:
+            solution = s.solve(puzzle, ordering=ordering)
+            self.assertIn(solution[1], ([4, 5, 7, 6], [6, 7, 5, 4]))
+            self.assertEqual(2, s.count_solutions(puzzle, ordering=ordering))
+
+    def test_count_solutions_none(self):
+        puzzle = m.Puzzle()
+
+        n1 = m.ShapeNode(0, terminates=True)
+        n2 = m.ShapeNode(0, terminates=True)
+
+        puzzle.add_node(n1)
+        puzzle.add_node(n2)
+
+        self.assertEqual(0, s.count_solutions(puzzle))
+        self.assertEqual([], list(s.iter_solutions(puzzle)))
+
     def test_c16(self):
         puzzle = m.Puzzle()
 
@@ -489,3 +593,182 @@ class SolverTests(TestCase):
 
         self.assertIsNotNone(solution)
         print(solution)
+
+    def test_split(self):
+        puzzle = m.Puzzle()
+
+        n1 = m.ShapeNode(0, terminates=True)
+        n2 = m.ShapeNode(0)
+        n3 = m.ShapeNode(0)
+        n4 = m.ShapeNode(0, terminates=True)
+
+        ni1 = puzzle.add_node(n1)
+        ni2 = puzzle.add_node(n2)
+        ni3 = puzzle.add_node(n3)
+        ni4 = puzzle.add_node(n4)
+
+        puzzle.link_nodes(ni1, ni2)
+        puzzle.link_nodes(ni1, ni3)
+        puzzle.link_nodes(ni2, ni3)
+        puzzle.link_nodes(ni2, ni4)
+        puzzle.link_nodes(ni3, ni4)
+
+        compiled = puzzle.compile()
+        subproblems = s.Search(compiled).split(2)
+
+        self.assertEqual(
+            [(0, (0, 1), (0,)), (0, (0, 2), (0,))],
+            [subproblem[:3] for subproblem in subproblems]
+        )
+
+        solutions = []
+        for subproblem in subproblems:
+            search = s.Search(compiled, s.SearchState.from_snapshot(compiled, subproblem))
+            for _ in search.solutions():
+                solutions.append(search.state.shapes_to_paths(compiled))
+        self.assertEqual([{0: [ni1, ni2, ni3, ni4]}, {0: [ni1, ni3, ni2, ni4]}], solutions)
+
+    def test_bidirectional(self):
+        puzzle = m.Puzzle()
+
+        nodes = [
+            m.ShapeNode(0, terminates=True),
+            m.MultipassNode(2),
+            m.ShapeNode(0),
+            m.ShapeNode(0),
+            m.ShapeNode(0, terminates=True),
+        ]
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        for (a, b) in ((0, 1), (1, 2), (2, 3), (3, 1), (1, 4)):
+            puzzle.link_nodes(node_ids[a], node_ids[b])
+
+        # both ends have to go through the multipass node; the solution is still a single path
+        compiled = puzzle.compile()
+        search = s.Search(compiled, ordering="bidirectional")
+        self.assertEqual((1, 1), search.state.heads)
+        self.assertIn(
+            s.solve(puzzle, ordering="bidirectional")[0],
+            ([0, 1, 2, 3, 1, 4], [0, 1, 3, 2, 1, 4])
+        )
+        self.assertEqual(1, s.count_solutions(puzzle, ordering="bidirectional"))
+
+        solutions = []
+        for subproblem in search.split(2):
+            search = s.Search(compiled, s.SearchState.from_snapshot(compiled, subproblem))
+            for _ in search.solutions():
+                solutions.append(search.state.shapes_to_paths(compiled))
+        self.assertEqual(
+            [{0: [0, 1, 2, 3, 1, 4]}, {0: [0, 1, 3, 2, 1, 4]}],
+            sorted(solutions, key=lambda solution: solution[0])
+        )
+
+    def test_donate(self):
+        compiled = lattice_puzzle("4:4:A" + "a" * 14 + "A").compile()
+
+        def all_solutions(search):
+            return [str(search.state.shapes_to_paths(compiled)) for _ in search.solutions()]
+
+        expected = all_solutions(s.Search(compiled))
+        self.assertEqual(704, len(expected))
+
+        donations = []
+
+        def should_stop():
+            if len(donations) == 0:
+                donations.extend(search.donate())
+            return False
+
+        search = s.Search(
+            compiled, should_stop=should_stop, transpositions=s.make_transposition_table(100)
+        )
+        solutions = all_solutions(search)
+        self.assertGreater(len(donations), 0)
+        self.assertLess(len(solutions), len(expected))
+
+        # between them, the donated subproblems cover the rest of the tree
+        for donation in donations:
+            state = s.SearchState.from_snapshot(compiled, donation)
+            solutions.extend(all_solutions(s.Search(compiled, state)))
+        self.assertEqual(sorted(expected), sorted(solutions))
+
+    def test_parallel(self):
+        puzzle = m.Puzzle()
+
+        # 0 = square-on-tip, 1 = square
+        nodes = [
+            m.ShapeNode(0),
+            m.ShapeNode(1),
+            m.ShapeNode(1, terminates=True),
+            m.ShapeNode(0, terminates=True),
+            m.MultipassNode(3),
+            m.ShapeNode(0, terminates=True),
+            m.ShapeNode(0),
+            m.MultipassNode(2),
+            m.MultipassNode(2),
+            m.ShapeNode(1, terminates=True),
+            m.MultipassNode(2),
+            m.ShapeNode(0),
+        ]
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        ls.square_lattice(puzzle, node_ids, 3, 4)
+
+        self.assertEqual(s.solve(puzzle) is None, s.solve(puzzle, workers=2) is None)
+        self.assertIsNotNone(s.solve(puzzle, workers=2))
+
+    def test_solve_many(self):
+        specs = ["2:2:A_A_", "2:2:A1A_", "2:2:A2A_", "2:2:Aa__"]
+        puzzles = [lattice_puzzle(spec) for spec in specs]
+
+        results = dict(s.solve_many(puzzles, workers=2, return_exceptions=True))
+
+        self.assertEqual({0, 1, 2, 3}, set(results.keys()))
+        self.assertEqual({0: [0, 1]}, results[0])
+        self.assertEqual({0: [0, 1, 2]}, results[1])
+        self.assertIsNone(results[2])
+        self.assertIsInstance(results[3], ValueError)
+
+    def test_compiled_conflicts(self):
+        puzzle = m.Puzzle()
+
+        node_ids = [puzzle.add_node(m.ShapeNode(0)) for _ in range(4)]
+        ls.square_link(puzzle, *node_ids)
+
+        compiled = puzzle.compile()
+        diagonal_one = compiled.edges.index(m.Edge(node_ids[0], node_ids[3]))
+        diagonal_two = compiled.edges.index(m.Edge(node_ids[1], node_ids[2]))
+
+        self.assertEqual(6, len(compiled.edges))
+        self.assertEqual(1 << diagonal_two, compiled.edge_conflict_masks[diagonal_one])
+        self.assertEqual(1 << diagonal_one, compiled.edge_conflict_masks[diagonal_two])
+        for (i, conflict_mask) in enumerate(compiled.edge_conflict_masks):
+            if i not in (diagonal_one, diagonal_two):
+                self.assertEqual(0, conflict_mask)
+
+    def test_compiled_adjacency(self):
+        puzzle = m.Puzzle()
+
+        nodes = [
+            m.ShapeNode(0, terminates=True),
+            m.MultipassNode(2),
+            m.ShapeNode(0, terminates=True),
+        ]
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        for (a, b) in linear_pairs(2):
+            puzzle.link_nodes(node_ids[a], node_ids[b])
+
+        compiled = puzzle.compile()
+
+        self.assertEqual((0, 1, 3, 4), compiled.neighbor_offsets)
+        self.assertEqual((1, 0, 2, 1), compiled.neighbor_nodes)
+        self.assertEqual(
+            (m.NODE_KIND_SHAPE, m.NODE_KIND_MULTIPASS, m.NODE_KIND_SHAPE),
+            compiled.node_kinds
+        )
+        self.assertEqual((0, 2, 0), compiled.node_multipass_counts)
+        self.assertEqual({0: (0, 2)}, compiled.shape_terminators)
@@ -0,0 +1,87 @@
+import lynedisease.model as m
+import lynedisease.solver as s
+import lynedisease.stats as st
+from lynedisease.tests.helpers import lattice_puzzle
+
+from unittest import TestCase
+
+__author__ = 'ondra'
+
+
+class StatsTests(TestCase):
+    def test_solve(self):
+        puzzle = lattice_puzzle("7:7:_122___d2dd22cD_1123C_A_dBcb1ACD12_a__12Bc____1c1")
+        progress = []
+        stats = st.SearchStats(
+            progress=lambda stats: progress.append(stats.nodes_expanded), progress_interval=100
+        )
+
+        solution = s.solve(puzzle, stats=stats)
+
+        self.assertIsNotNone(solution)
+        self.assertEqual(1, stats.solutions)
+        self.assertGreater(stats.nodes_expanded, 100)
+        self.assertEqual(
+            list(range(100, stats.nodes_expanded + 1, 100)),
+            progress
+        )
+        self.assertEqual(
+            sum(len(path) for path in solution.values()) - 1,
+            stats.max_depth
+        )
+        self.assertLessEqual(set(stats.backtracks.keys()), set(solution.keys()))
+        self.assertGreater(stats.prunes[st.PRUNE_SHAPE_CONFLICT], 0)
+        self.assertGreater(stats.prunes[st.PRUNE_MULTIPASS_FULL], 0)
+        self.assertGreater(stats.prunes[st.PRUNE_TRANSPOSITION], 0)
+        self.assertGreater(stats.prunes[st.PRUNE_DISCONNECTED], 0)
+        self.assertGreater(stats.helper_calls["moves"], stats.nodes_expanded)
+        self.assertGreater(stats.wall_time, stats.helper_times["moves"])
+        self.assertEqual(stats.wall_time, stats.as_dict()["wall_time"])
+        # every hit in the transposition table prunes the state it was looked up for
+        self.assertEqual(stats.prunes[st.PRUNE_TRANSPOSITION], stats.transposition_hits)
+        self.assertGreater(stats.transposition_misses, stats.transposition_hits)
+        self.assertEqual(0, stats.as_dict()["transposition_evictions"])
+
+    def test_transposition_evictions(self):
+        puzzle = lattice_puzzle("6:8:_Aa2Aa_c3aa__2C2bb_c1_BbcB_bbbCc__2b____1_______")
+        stats = st.SearchStats()
+
+        self.assertIsNotNone(s.solve(puzzle, max_transpositions=100, stats=stats))
+        self.assertGreater(stats.transposition_hits, 0)
+        self.assertGreater(stats.transposition_evictions, 0)
+        self.assertEqual(
+            (stats.transposition_hits, stats.transposition_misses, stats.transposition_evictions),
+            tuple(
+                stats.as_dict()[key]
+                for key in ("transposition_hits", "transposition_misses", "transposition_evictions")
+            )
+        )
+
+    def test_count_solutions(self):
+        puzzle = m.Puzzle()
+
+        nodes = [
+            m.ShapeNode(0, terminates=True),
+            m.ShapeNode(0),
+            m.ShapeNode(0),
+            m.ShapeNode(0, terminates=True),
+        ]
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        for (a, b) in ((0, 1), (0, 2), (1, 2), (1, 3), (2, 3)):
+            puzzle.link_nodes(node_ids[a], node_ids[b])
+
+        stats = st.SearchStats()
+        self.assertEqual(2, s.count_solutions(puzzle, stats=stats))
+        self.assertEqual(2, stats.solutions)
+        self.assertEqual(3, stats.max_depth)
+        # from either middle node straight to the end
+        self.assertEqual(2, stats.prunes[st.PRUNE_PREMATURE_TERMINATION])
+
+    def test_disabled(self):
+        search = s.Search(lattice_puzzle("3:4:abBA3Aa22B2a").compile())
+
+        # no timed helpers in the way
+        self.assertNotIn("moves", search.__dict__)
+        self.assertIsNone(search.prunes)
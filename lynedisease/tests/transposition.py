@@ -0,0 +1,101 @@
+import lynedisease.model as m
+import lynedisease.solver as s
+import lynedisease.transposition as t
+from lynedisease.tests.helpers import lattice_puzzle
+
+from unittest import TestCase
+
+__author__ = 'ondra'
+
+
+class TranspositionTests(TestCase):
+    def test_eviction(self):
+        table = t.TranspositionTable(max_entries=2)
+        table.add_dead(1)
+        table.add_dead(2)
+        self.assertTrue(table.is_dead(1))
+        table.add_dead(3)
+
+        # 2 was the least recently used
+        self.assertEqual(1, table.evictions)
+        self.assertFalse(table.is_dead(2))
+        self.assertTrue(table.is_dead(1))
+        self.assertTrue(table.is_dead(3))
+        self.assertEqual((3, 1), (table.hits, table.misses))
+
+    def test_shared(self):
+        table = t.SharedTranspositionTable(max_entries=4)
+        table.add_dead(1)
+        table.add_dead(0)
+        self.assertTrue(table.is_dead(1))
+        self.assertTrue(table.is_dead(0))
+        table.add_dead(6)
+        table.add_dead(10)
+
+        # 10 took the slot of 6
+        self.assertEqual(1, table.evictions)
+        self.assertFalse(table.is_dead(6))
+        self.assertTrue(table.is_dead(10))
+        self.assertEqual(2, len(table))
+
+        # another process would see the same keys
+        other = t.SharedTranspositionTable(4, table.slots)
+        self.assertTrue(other.is_dead(10))
+        other.add_dead(3)
+        self.assertTrue(table.is_dead(3))
+        self.assertEqual((4, 1), (table.hits, table.misses))
+
+    def test_key_ignores_route(self):
+        puzzle = m.Puzzle()
+
+        nodes = [
+            m.ShapeNode(0, terminates=True),
+            m.ShapeNode(0),
+            m.ShapeNode(0),
+            m.ShapeNode(0),
+            m.ShapeNode(0, terminates=True),
+        ]
+
+        node_ids = [puzzle.add_node(n) for n in nodes]
+
+        for (a, b) in ((0, 1), (0, 2), (1, 2), (1, 3), (2, 3), (3, 4)):
+            puzzle.link_nodes(node_ids[a], node_ids[b])
+
+        compiled = puzzle.compile()
+        (e01, e02, e12, e13, e23, e34) = (
+            compiled.find_edge(*pair)
+            for pair in ((0, 1), (0, 2), (1, 2), (1, 3), (2, 3), (3, 4))
+        )
+        available_edges = compiled.all_edges_mask & ~(
+            (1 << e01) | (1 << e02) | (1 << e12) | (1 << e13) | (1 << e23)
+        )
+
+        keys = []
+        for path in ([0, 1, 2, 3], [0, 2, 1, 3]):
+            state = s.SearchState(compiled)
+            for node_index in path:
+                state.push_node(node_index)
+            state.available_edges = available_edges
+            keys.append(state.transposition_key())
+        self.assertEqual(keys[0], keys[1])
+
+        state.pop_node()
+        self.assertNotEqual(keys[0], state.transposition_key())
+
+    def test_search(self):
+        puzzle = lattice_puzzle("6:8:_Aa2Aa_c3aa__2C2bb_c1_BbcB_bbbCc__2b____1_______")
+        compiled = puzzle.compile()
+
+        table = t.TranspositionTable(max_entries=100)
+        search = s.Search(compiled, transpositions=table)
+        for _ in search.solutions():
+            break
+
+        self.assertTrue(search.is_complete())
+        self.assertGreater(table.hits, 0)
+        self.assertGreater(table.evictions, 0)
+        self.assertEqual(100, len(table))
+        self.assertEqual(
+            s.solve(puzzle, max_transpositions=0) is not None,
+            s.solve(puzzle) is not None
+        )
@@ -0,0 +1,130 @@
+import multiprocessing
+
+from collections import OrderedDict
+
+__author__ = 'ondra'
+
+DEFAULT_MAX_ENTRIES = 1 << 18
+"""Default size of a TranspositionTable; each entry takes roughly 100 bytes."""
+
+
+class TranspositionTable:
+    """
+    Remembers search states from which no solution can be reached, so that the search can skip
+    them when it arrives at them again along a different route. States are identified by a 64-bit
+    hash (see SearchState.transposition_key()); a collision could make the search skip a live
+    state, but with 64 bits this is vanishingly unlikely.
+
+    At most max_entries states are kept; once the table is full, the least recently used state is
+    evicted.
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        :type max_entries: int
+        """
+        self.max_entries = max_entries
+        """:type: int"""
+        self.entries = OrderedDict()
+        """:type: OrderedDict[int, None]"""
+        self.hits = 0
+        """:type: int"""
+        self.misses = 0
+        """:type: int"""
+        self.evictions = 0
+        """:type: int"""
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return "TranspositionTable(entries={0}, hits={1}, misses={2}, evictions={3})".format(
+            len(self.entries), self.hits, self.misses, self.evictions
+        )
+
+    def is_dead(self, key):
+        """
+        :type key: int
+        :rtype: bool
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add_dead(self, key):
+        """
+        :type key: int
+        """
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = None
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+class SharedTranspositionTable:
+    """
+    A table of dead states in shared memory, for the worker processes of a parallel search to
+    learn from each other's dead ends; the subproblems they search often lead to the same states.
+    It has max_entries slots of one key each, and a state goes into the slot its key picks,
+    replacing whatever was there. No lock is needed: a slot is read and written as one 64-bit
+    word, so a lookup sees either the old key or the new one. Slot 0 marks an empty slot, so key 0
+    is stored as 1. The counters are kept per process.
+
+    Passed to the workers on creating them; the memory cannot be pickled otherwise.
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, slots=None):
+        """
+        :param slots: the shared memory of another table, to be used instead of new memory
+        :type max_entries: int
+        :type slots: multiprocessing.sharedctypes.RawArray|None
+        """
+        self.max_entries = max_entries
+        """:type: int"""
+        self.slots = slots if slots is not None else multiprocessing.RawArray("q", max_entries)
+        """:type: multiprocessing.sharedctypes.RawArray"""
+        # much faster to index than the ctypes array itself
+        self.keys = memoryview(self.slots).cast("B").cast("q")
+        """:type: memoryview"""
+        self.hits = 0
+        """:type: int"""
+        self.misses = 0
+        """:type: int"""
+        self.evictions = 0
+        """:type: int"""
+
+    def __reduce__(self):
+        return SharedTranspositionTable, (self.max_entries, self.slots)
+
+    def __len__(self):
+        return self.max_entries - self.keys.tolist().count(0)
+
+    def __repr__(self):
+        return "SharedTranspositionTable(max_entries={0}, hits={1}, misses={2}, " \
+            "evictions={3})".format(self.max_entries, self.hits, self.misses, self.evictions)
+
+    def is_dead(self, key):
+        """
+        :type key: int
+        :rtype: bool
+        """
+        key = key or 1
+        if self.keys[key % self.max_entries] == key:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add_dead(self, key):
+        """
+        :type key: int
+        """
+        key = key or 1
+        slot = key % self.max_entries
+        if self.keys[slot] not in (0, key):
+            self.evictions += 1
+        self.keys[slot] = key